@@ -0,0 +1,146 @@
+"""Profile the cold start of a function: the time to import main and to handle a skipped file.
+
+Every run starts a new interpreter with python -X importtime in the function directory, imports main and,
+for the storage triggered functions with a FILEPATH_PREFIX_FILTER, calls the entry point with a file name
+outside the filter. The report lists the time of both steps and the modules that took longest to import.
+
+    python coldstart.py produce_delta_event --config my_config.py
+
+The function is profiled with the config.py in its directory, unless another one is given with --config.
+No Google Cloud credentials are needed, importing main and skipping a file do not call any service.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Entry point of every function, as deployed
+ENTRY_POINTS = {
+    'produce_delta_event': 'publish_diff',
+    'datastore_delta_event': 'publish_diff',
+    'file_processing': 'file_processing',
+    'eav_delta_producer': 'handler',
+}
+# Modules reported as loaded after a skipped file, their import takes most of a cold start
+HEAVY_MODULES = ['pandas', 'numpy', 'sqlalchemy', 'openpyxl', 'gobits', 'defusedxml', 'brotli',
+                 'google.cloud.storage', 'google.cloud.pubsub_v1', 'google.cloud.datastore',
+                 'google.cloud.secretmanager_v1']
+
+# Runs in the interpreter that is profiled, prints the timings as JSON on the last line of stdout
+PROFILE_SCRIPT = '''
+import json
+import sys
+import time
+
+start = time.perf_counter()
+import main
+result = {'import': time.perf_counter() - start}
+
+entry_point, prefix_filter = sys.argv[1:3]
+if prefix_filter:
+    start = time.perf_counter()
+    getattr(main, entry_point)({'bucket': 'coldstart', 'name': '~' + prefix_filter}, {'event_id': 0})
+    result['skip'] = time.perf_counter() - start
+result['loaded'] = [name for name in sys.argv[3:] if name in sys.modules]
+print(json.dumps(result))
+'''
+
+
+def profile(function_dir, config_dir, entry_point, prefix_filter):
+    """Return the timings of one cold start and the modules imported by main with their import times."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([config_dir, function_dir]), PYTHONDONTWRITEBYTECODE='1')
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROFILE_SCRIPT, entry_point, prefix_filter or ''] + HEAVY_MODULES,
+        cwd=function_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        raise RuntimeError('Profiling {} failed:\n{}'.format(function_dir, process.stderr[-2000:]))
+    return json.loads(process.stdout.splitlines()[-1]), parse_importtime(process.stderr)
+
+
+def parse_importtime(output):
+    """Return the modules imported by main as (name, self time, cumulative time, depth below main), in order.
+
+    Times are in microseconds. A module is listed after the modules it imports, like in the output of importtime.
+    """
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_time), int(cumulative), (len(name) - len(name.lstrip())) // 2))
+
+    main_index = next(index for index, module in enumerate(modules) if module[0] == 'main')
+    main_depth = modules[main_index][3]
+    start = main_index
+    while start > 0 and modules[start - 1][3] > main_depth:
+        start -= 1
+    return [(name, self_time, cumulative, depth - main_depth)
+            for name, self_time, cumulative, depth in modules[start:main_index + 1]]
+
+
+def read_prefix_filter(config_dir):
+    # The config is read in a separate interpreter, so this process does not import the function's config
+    process = subprocess.run(
+        [sys.executable, '-c', 'import config; print(getattr(config, "FILEPATH_PREFIX_FILTER", ""))'],
+        cwd=config_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        raise RuntimeError('Reading the config failed:\n{}'.format(process.stderr[-2000:]))
+    return process.stdout.strip()
+
+
+def report(name, runs, top):
+    imports = [result['import'] for result, _ in runs]
+    print('{}: import main {:.0f} ms (median of {} runs, {:.0f}-{:.0f} ms)'.format(
+        name, 1000 * statistics.median(imports), len(runs), 1000 * min(imports), 1000 * max(imports)))
+    skips = [result['skip'] for result, _ in runs if 'skip' in result]
+    if skips:
+        print('{}: skipped file {:.1f} ms, modules loaded afterwards: {}'.format(
+            name, 1000 * statistics.median(skips), ', '.join(runs[0][0]['loaded']) or 'none'))
+
+    # The modules of the median run, those main imports itself and the slowest of all modules it loads
+    _, modules = sorted(runs, key=lambda run: run[0]['import'])[len(runs) // 2]
+    direct = sorted((module for module in modules if module[3] == 1), key=lambda module: module[2], reverse=True)
+    slowest = sorted(modules, key=lambda module: module[1], reverse=True)
+    print('{:>12} | {:>12} | module'.format('self [us]', 'cumul [us]'))
+    for title, items in [('imported by main', direct), ('slowest by self time', slowest)]:
+        print('-- {}'.format(title))
+        for name, self_time, cumulative, _ in items[:top]:
+            print('{:>12} | {:>12} | {}'.format(self_time, cumulative, name))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('functions', nargs='*', default=sorted(ENTRY_POINTS), help='function directories')
+    parser.add_argument('--config', help='config.py to use instead of the one in the function directory')
+    parser.add_argument('--runs', type=int, default=5, help='number of cold starts per function')
+    parser.add_argument('--top', type=int, default=15, help='number of modules to list')
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    for function in args.functions:
+        function_dir = os.path.abspath(os.path.join(base_dir, function))
+        name = os.path.basename(function_dir)
+        config_path = args.config or os.path.join(function_dir, 'config.py')
+        if not os.path.exists(config_path):
+            print('{}: skipped, no {}'.format(name, config_path))
+            continue
+
+        config_dir = tempfile.mkdtemp()
+        try:
+            shutil.copyfile(config_path, os.path.join(config_dir, 'config.py'))
+            # eav_delta_producer is triggered over HTTP and handles every request
+            prefix_filter = read_prefix_filter(config_dir) if ENTRY_POINTS.get(name) != 'handler' else None
+            runs = [profile(function_dir, config_dir, ENTRY_POINTS.get(name, 'main'), prefix_filter)
+                    for _ in range(args.runs)]
+        finally:
+            shutil.rmtree(config_dir)
+        report(name, runs, args.top)
+
+
+if __name__ == '__main__':
+    main()
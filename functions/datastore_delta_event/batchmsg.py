@@ -0,0 +1,98 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_encoder(compact=False):
+    """Return a function that encodes a value as JSON bytes.
+
+    By default the result is the same as json.dumps. A compact encoder leaves out whitespace
+    and does not escape non-ASCII characters, it uses orjson when that is installed.
+    """
+    if not compact:
+        return encode_json
+    if orjson is not None:
+        return orjson.dumps
+    return encode_compact_json
+
+
+def encode_json(value):
+    return json.dumps(value).encode('utf-8')
+
+
+def encode_compact_json(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+class MessageBatcher:
+    """Packs messages into payloads of at most max_bytes encoded bytes and max_rows messages.
+
+    A payload is the JSON of the list of messages, or {"gobits": [...], subject: [...]} when
+    a subject is given. The envelope is encoded once for all payloads. When neither max_bytes
+    nor max_rows is given, every message is a payload of its own, without a list around it.
+
+    Messages can be added as values or as bytes that already hold their JSON. Values are only
+    encoded one by one when max_bytes is set, otherwise a batch of them is encoded at once. A
+    single message that is larger than max_bytes is published as a payload of its own.
+    """
+
+    def __init__(self, gobits, subject=None, max_bytes=None, max_rows=None, compact=False):
+        self.encode = json_encoder(compact)
+        self.separator = b',' if compact else b', '
+        self.max_bytes = max_bytes
+        self.batched = bool(max_bytes or max_rows)
+        self.max_rows = max_rows if self.batched else 1
+        self.prefix, self.suffix = self._envelope(gobits, subject, compact)
+        self.rows = []
+        self.rows_encoded = False
+        self.size = len(self.prefix) + len(self.suffix)
+
+    def _envelope(self, gobits, subject, compact):
+        list_start, list_end = (b'[', b']') if self.batched else (b'', b'')
+        if not subject:
+            return list_start, list_end
+        gobits_json = self.encode([gobits.to_json()])
+        subject_json = self.encode(subject)
+        if compact:
+            prefix = b''.join((b'{"gobits":', gobits_json, b',', subject_json, b':', list_start))
+        else:
+            prefix = b''.join((b'{"gobits": ', gobits_json, b', ', subject_json, b': ', list_start))
+        return prefix, list_end + b'}'
+
+    def add(self, row):
+        """Add a message, returns the payload of the previous messages when the message does not fit with them."""
+        payload = None
+        if self.max_rows and len(self.rows) >= self.max_rows:
+            payload = self.flush()
+        if not self.max_bytes and not isinstance(row, bytes):
+            self.rows.append(row)
+            return payload
+
+        encoded_row = row if isinstance(row, bytes) else self.encode(row)
+        if self.rows and self.max_bytes and self.size + len(self.separator) + len(encoded_row) > self.max_bytes:
+            payload = self.flush()
+        if self.rows:
+            self.size += len(self.separator)
+        self.rows.append(encoded_row)
+        self.rows_encoded = True
+        self.size += len(encoded_row)
+        return payload
+
+    def flush(self):
+        """Return the payload of the messages added since the last flush, or None when there are none."""
+        if not self.rows:
+            return None
+        if self.rows_encoded:
+            body = self.separator.join(self.rows)
+        elif self.batched:
+            body = self.encode(self.rows)[1:-1]
+        else:
+            body = self.encode(self.rows[0])
+        payload = b''.join((self.prefix, body, self.suffix))
+        self.rows = []
+        self.rows_encoded = False
+        self.size = len(self.prefix) + len(self.suffix)
+        return payload
@@ -0,0 +1,68 @@
+import pandas as pd
+
+
+def scan_dtypes(chunks):
+    """Return the kinds of values of every column in chunks of a file and whether the column misses values.
+
+    The columns are returned in order of first appearance. Only the kinds are kept, so a file can be scanned in
+    chunks with flat memory use. A column that is left out of a chunk misses the values of its rows.
+    """
+    columns = {}
+    rows = 0
+    for df_chunk in chunks:
+        for column in df_chunk.columns:
+            values = df_chunk[column].dropna()
+            kinds, counts = columns.setdefault(column, (set(), []))
+            if len(values) > 0:
+                kinds.add(pd.api.types.infer_dtype(values))
+            counts.append(len(values))
+        rows += len(df_chunk)
+    return {column: (kinds, sum(counts) < rows) for column, (kinds, counts) in columns.items()}
+
+
+def whole_file_dtypes(columns, parsed_from_text=False):
+    """Return the dtypes columns get when the file is read as a whole, from what scan_dtypes found in its chunks.
+
+    pandas infers the dtype of every chunk from the values of that chunk only. A column of whole numbers that
+    misses values in one chunk is float in the whole file, but int in the other chunks. When values are parsed from
+    text, like in csv files, a column with numbers in some chunks and other values in others holds the text of the
+    file when it is read as a whole. The dtype of such a column is str, it has to be read as text. Columns that get
+    the dtype of the whole file in every chunk are left out.
+    """
+    dtypes = {}
+    for column, (kinds, missing) in columns.items():
+        if not kinds:
+            # read_csv reads a column without values as float, a DataFrame of records holds None
+            dtypes[column] = 'float64' if parsed_from_text else 'object'
+        elif kinds <= {'integer', 'floating'}:
+            if missing or 'floating' in kinds:
+                dtypes[column] = 'float64'
+        elif kinds == {'boolean'}:
+            if missing:
+                dtypes[column] = 'object'
+        elif parsed_from_text and len(kinds) > 1:
+            dtypes[column] = str
+        else:
+            dtypes[column] = 'object'
+    return dtypes
+
+
+def with_dtypes(df, dtypes):
+    """Return df with its columns converted to dtypes, except the columns with dtype str that are read as text."""
+    changed = {column: dtype for column, dtype in dtypes.items()
+               if dtype is not str and column in df.columns and str(df[column].dtype) != dtype}
+    return df.astype(changed) if changed else df
+
+
+def holds_one_kind(columns, dtypes):
+    """Return whether every column that scan_dtypes found holds values of one kind when it is read with dtypes.
+
+    Numbers, text and booleans are a kind each, a column read as text only holds text. Such values are equal when
+    their row fingerprints are, the values of other columns, like a number and its text, are only told apart by
+    comparing the values themselves.
+    """
+    for column, (kinds, _) in columns.items():
+        if dtypes.get(column) is not str and not (
+                kinds <= {'integer', 'floating'} or kinds <= {'string'} or kinds <= {'boolean'}):
+            return False
+    return True
@@ -1,63 +1,142 @@
 from datetime import datetime, timezone
+from operator import methodcaller
+
+
+# The specification gather_publish_msg compiled last with its gather function, callers pass the same
+# COLUMNS_PUBLISH of the config for every row
+_compiled = (None, None)
 
 
 def gather_publish_msg(msg, columns_publish=None):
-    if columns_publish:
-        gathered_msg = {}
-        for msg_key, value_key in columns_publish.items():
-            gathered_msg[msg_key] = None
-
-            if type(value_key) is dict:
-                if value_key.get('conversion') == 'geojson_point' and value_key['longitude_attribute'] in msg and \
-                        value_key['latitude_attribute'] in msg:
-                    gathered_msg[msg_key] = {
-                        "type": "Point",
-                        "coordinates": [float(msg[value_key['longitude_attribute']]),
-                                        float(msg[value_key['latitude_attribute']])]
-                    }
-                    continue
-                elif 'source_attribute' in value_key:
-                    if type(value_key['source_attribute']) is list:
-                        for att in value_key['source_attribute']:
-                            if att in msg:
-                                gathered_msg[msg_key] = msg.get(att)
-                                break
-                    else:
-                        gathered_msg[msg_key] = msg.get(value_key['source_attribute'], None)
-
-                if gathered_msg[msg_key] is not None:
-                    if 'conversion' in value_key:
-                        if value_key['conversion'] == 'lowercase':
-                            gathered_msg[msg_key] = gathered_msg[msg_key].lower()
-                        elif value_key['conversion'] == 'uppercase':
-                            gathered_msg[msg_key] = gathered_msg[msg_key].upper()
-                        elif value_key['conversion'] == 'capitalize':
-                            gathered_msg[msg_key] = gathered_msg[msg_key].capitalize()
-                        elif value_key['conversion'] == 'numeric':
-                            value = gathered_msg[msg_key]
-                            if isint(value):
-                                gathered_msg[msg_key] = int(float(value))
-                            elif isfloat(value):
-                                gathered_msg[msg_key] = float(value)
-                        elif value_key['conversion'] == 'datetime':
-                            if isinstance(gathered_msg[msg_key], int):
-                                # the datetime was converted by Pandas to Unix epoch in milliseconds
-                                date_object = datetime.fromtimestamp(int(gathered_msg[msg_key] / 1000), timezone.utc)
-                            else:
-                                date_object = datetime.strptime(gathered_msg[msg_key], value_key.get(
-                                    'format_from', '%Y-%m-%dT%H:%M:%SZ'))
-                            gathered_msg[msg_key] = str(datetime.strftime(date_object, value_key.get(
-                                'format_to', '%Y-%m-%dT%H:%M:%SZ')))
-
-                    if 'prefix_value' in value_key:
-                        gathered_msg[msg_key] = f"{value_key['prefix_value']}{gathered_msg[msg_key]}"
-
-            elif type(value_key) is not dict:
-                gathered_msg[msg_key] = msg.get(value_key, None)
-        return gathered_msg
+    """Gather the message to publish from a row, columns_publish is only compiled when it differs from the last call."""
+    global _compiled
+    compiled_columns_publish, gather = _compiled
+    if gather is None or compiled_columns_publish is not columns_publish:
+        gather = compile_columns_publish(columns_publish)
+        _compiled = (columns_publish, gather)
+    return gather(msg)
+
+
+def compile_columns_publish(columns_publish=None):
+    """Compile COLUMNS_PUBLISH once into a function that gathers a message from a row.
+
+    Every field of the specification is turned into a closure with its source attribute
+    resolver and conversion already bound, so the specification is not interpreted
+    again for every row.
+    """
+    if not columns_publish:
+        return _return_msg
+
+    fields = [(msg_key, _compile_field(value_key)) for msg_key, value_key in columns_publish.items()]
+
+    def gather(msg):
+        return {msg_key: get_value(msg) for msg_key, get_value in fields}
+
+    return gather
+
+
+def _return_msg(msg):
     return msg
 
 
+def _compile_field(value_key):
+    if type(value_key) is not dict:
+        return methodcaller('get', value_key, None)
+
+    resolve = _compile_source_attribute(value_key)
+    conversion_chain = []
+    if 'conversion' in value_key:
+        convert = _compile_conversion(value_key, value_key['conversion'])
+        if convert is not None:
+            conversion_chain.append(convert)
+    if 'prefix_value' in value_key:
+        prefix_value = value_key['prefix_value']
+        conversion_chain.append(lambda value: f'{prefix_value}{value}')
+
+    if conversion_chain:
+        def get_value(msg):
+            value = resolve(msg)
+            if value is not None:
+                for convert in conversion_chain:
+                    value = convert(value)
+            return value
+    else:
+        get_value = resolve
+
+    if value_key.get('conversion') == 'geojson_point':
+        return _compile_geojson_point(value_key, get_value)
+    return get_value
+
+
+def _compile_source_attribute(value_key):
+    if 'source_attribute' not in value_key:
+        return _return_none
+
+    source_attribute = value_key['source_attribute']
+    if type(source_attribute) is not list:
+        return methodcaller('get', source_attribute, None)
+
+    def resolve(msg):
+        for att in source_attribute:
+            if att in msg:
+                return msg.get(att)
+        return None
+
+    return resolve
+
+
+def _return_none(msg):
+    return None
+
+
+def _compile_geojson_point(value_key, get_value):
+    longitude_attribute = value_key['longitude_attribute']
+    latitude_attribute = value_key['latitude_attribute']
+
+    def get_point(msg):
+        if longitude_attribute in msg and latitude_attribute in msg:
+            return {
+                "type": "Point",
+                "coordinates": [float(msg[longitude_attribute]), float(msg[latitude_attribute])]
+            }
+        return get_value(msg)
+
+    return get_point
+
+
+def _compile_conversion(value_key, conversion):
+    if conversion == 'lowercase':
+        return methodcaller('lower')
+    elif conversion == 'uppercase':
+        return methodcaller('upper')
+    elif conversion == 'capitalize':
+        return methodcaller('capitalize')
+    elif conversion == 'numeric':
+        return convert_numeric
+    elif conversion == 'datetime':
+        format_from = value_key.get('format_from', '%Y-%m-%dT%H:%M:%SZ')
+        format_to = value_key.get('format_to', '%Y-%m-%dT%H:%M:%SZ')
+
+        def convert_datetime(value):
+            if isinstance(value, int):
+                # the datetime was converted by Pandas to Unix epoch in milliseconds
+                date_object = datetime.fromtimestamp(int(value / 1000), timezone.utc)
+            else:
+                date_object = datetime.strptime(value, format_from)
+            return str(datetime.strftime(date_object, format_to))
+
+        return convert_datetime
+    return None
+
+
+def convert_numeric(value):
+    if isint(value):
+        return int(float(value))
+    elif isfloat(value):
+        return float(value)
+    return value
+
+
 def isfloat(x):
     try:
         float(x)
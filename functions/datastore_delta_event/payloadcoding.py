@@ -0,0 +1,47 @@
+import zlib
+
+import brotli
+
+# Message attribute that tells how the data of a message is compressed
+CONTENT_ENCODING_ATTRIBUTE = 'content-encoding'
+DEFAULT_LEVELS = {'br': 5, 'gzip': 6}
+
+
+def compress_payload(payload, content_encoding, level=None):
+    """Return payload compressed with content_encoding, either 'br' (Brotli) or 'gzip'."""
+    if level is None:
+        level = DEFAULT_LEVELS.get(content_encoding)
+    if content_encoding == 'br':
+        return brotli.compress(payload, quality=level)
+    if content_encoding == 'gzip':
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(payload) + compressor.flush()
+    raise ValueError(f'Unknown content encoding {content_encoding}')
+
+
+def decompress_payload(data, attributes=None):
+    """Return the data of a received message, decompressed according to its content-encoding attribute.
+
+    Messages without the attribute are returned unchanged, so subscribers can use this for every message.
+    """
+    content_encoding = (attributes or {}).get(CONTENT_ENCODING_ATTRIBUTE)
+    if not content_encoding:
+        return data
+    return decompress_content(data, content_encoding)
+
+
+def decompress_content(data, content_encoding):
+    if content_encoding == 'br':
+        return brotli.decompress(data)
+    if content_encoding == 'gzip':
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    raise ValueError(f'Unknown content encoding {content_encoding}')
+
+
+def content_decompressor(content_encoding):
+    """Return a function that decompresses content_encoding data one piece at a time."""
+    if content_encoding == 'br':
+        return brotli.Decompressor().process
+    if content_encoding == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress
+    raise ValueError(f'Unknown content encoding {content_encoding}')
@@ -0,0 +1,399 @@
+import logging
+import os
+import io
+import json
+import itertools
+import config
+import threading
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud import storage
+
+from gobits import Gobits
+from defusedxml import ElementTree
+
+from batchmsg import MessageBatcher
+from blobio import blob_source, download_blob, open_blob
+from chunkdtypes import scan_dtypes, whole_file_dtypes, with_dtypes
+from gathermsg import compile_columns_publish
+from gcsclient import get_bucket, log_api_calls, reset_api_calls
+from jsonstream import iter_json_list
+from payloadcoding import CONTENT_ENCODING_ATTRIBUTE, compress_payload
+from publishfutures import PublishFutures
+from statestorage import state_storage_from_specification
+
+# Default limits of messages that are published but not yet sent, publishing blocks when they are exceeded
+TOPIC_FLOW_CONTROL = {'message_limit': 1000, 'byte_limit': 10 * 1024 * 1024}
+
+_lock = threading.Lock()
+_publisher = None
+
+gather_publish_msg = compile_columns_publish(getattr(config, 'COLUMNS_PUBLISH', None))
+
+
+def get_publisher():
+    """Return the publisher of this instance, created on first use and reused by later invocations."""
+    global _publisher
+    with _lock:
+        if _publisher is None:
+            # The Pub/Sub client library takes a quarter of a second to import, runs without new rows do not need it
+            from google.cloud import pubsub_v1
+
+            batch_settings = pubsub_v1.types.BatchSettings(**config.TOPIC_BATCH_SETTINGS)
+            flow_control = pubsub_v1.types.PublishFlowControl(
+                **{'limit_exceeded_behavior': pubsub_v1.types.LimitExceededBehavior.BLOCK,
+                   **getattr(config, 'TOPIC_FLOW_CONTROL', TOPIC_FLOW_CONTROL)})
+            _publisher = pubsub_v1.PublisherClient(
+                batch_settings, publisher_options=pubsub_v1.types.PublisherOptions(flow_control=flow_control))
+        return _publisher
+
+
+def publish_payload(payload, topic_project_id, topic_name, subject=None):
+    publisher = get_publisher()
+    topic_path = publisher.topic_path(topic_project_id, topic_name)
+    content_encoding = getattr(config, 'PUBLISH_CONTENT_ENCODING', None)
+    if content_encoding:
+        payload = compress_payload(payload, content_encoding, getattr(config, 'PUBLISH_COMPRESSION_LEVEL', None))
+        return publisher.publish(topic_path, payload, **{CONTENT_ENCODING_ATTRIBUTE: content_encoding})
+    return publisher.publish(topic_path, payload)
+
+
+def load_odata(xml_data):
+    return list(iter_odata(io.BytesIO(xml_data)))
+
+
+def iter_odata(stream):
+    """Yield the properties of every entry of an OData Atom feed read incrementally from a binary stream.
+
+    Every entry is cleared from the parsed tree once its properties have been yielded, so the
+    feed is never held in memory as a whole.
+    """
+    events = ElementTree.iterparse(stream, events=('start', 'end'))
+    _, feed = next(events)
+    if not feed.tag.endswith('}feed'):
+        logging.warning('Root XML element is expected to be "feed"')
+        return
+    namespace = feed.tag[:-4]
+    depth = 0
+    for event, element in events:
+        if event == 'start':
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 0:
+            if element.tag == f'{namespace}entry':
+                yield from iter_odata_entry(element, namespace)
+            feed.clear()
+
+
+def iter_odata_entry(entry, namespace):
+    content = entry.find(f'{namespace}content')
+    if content is not None and len(content) > 0:
+        entry_dict = {}
+        for properties in content:
+            if properties.tag.endswith('}properties'):
+                for prop in properties:
+                    if prop.text:
+                        entry_dict[prop.tag.split('}')[-1]] = prop.text
+                yield entry_dict
+
+
+def data_from_store(bucket_name, blob_name, from_archive=False):
+    path = 'gs://{}/{}'.format(bucket_name, blob_name)
+    logging.info('Reading {}'.format(path))
+    if blob_name.endswith('.xlsx'):
+        # openpyxl is only imported for xlsx files
+        from xlsxstream import read_excel
+
+        bucket = get_bucket(bucket_name)
+        new_data = read_excel(io.BytesIO(download_blob(bucket.get_blob(blob_name))), dtype=str)
+        new_data[new_data.isnull()] = None
+        new_data = new_data.to_dict(orient='records')
+    elif blob_name.endswith('.csv'):
+        source = blob_source(bucket_name, blob_name)
+        new_data = pd.read_csv(source, **config.CSV_DIALECT_PARAMETERS).to_dict(orient='records')
+    elif blob_name.endswith('.atom'):
+        bucket = get_bucket(bucket_name)
+        return load_odata(download_blob(bucket.get_blob(blob_name)))
+    elif blob_name.endswith('.json'):
+        if hasattr(config, 'ATTRIBUTE_WITH_THE_LIST'):
+            bucket = get_bucket(bucket_name)
+            json_data = json.loads(download_blob(bucket.get_blob(blob_name)))
+            new_data = json_data[config.ATTRIBUTE_WITH_THE_LIST]
+        else:
+            new_data = pd.read_json(blob_source(bucket_name, blob_name), dtype=False).to_dict(orient='records')
+    logging.info('Read file {} from {}'.format(blob_name, bucket_name))
+    return new_data
+
+
+def iter_data_from_store(bucket_name, blob_name):
+    chunk_size = config.CHUNKED_READ_SIZE
+    path = 'gs://{}/{}'.format(bucket_name, blob_name)
+    logging.info('Reading {} in chunks of {} rows'.format(path, chunk_size))
+    if blob_name.endswith('.xlsx'):
+        # openpyxl is only imported for xlsx files
+        from xlsxstream import iter_excel
+
+        # The zip archive is read at random, the compressed file is much smaller than its rows
+        bucket = get_bucket(bucket_name)
+        stream = io.BytesIO(download_blob(bucket.get_blob(blob_name)))
+        for df_chunk in iter_excel(stream, chunk_size, dtype=str):
+            df_chunk[df_chunk.isnull()] = None
+            yield df_chunk.to_dict(orient='records')
+    elif blob_name.endswith('.csv'):
+        # The file is read twice, the chunks get the dtypes of the columns of the whole file found by the first pass
+        dtypes = whole_file_dtypes(scan_dtypes(read_csv_chunks(bucket_name, blob_name)), parsed_from_text=True)
+        for df_chunk in read_csv_chunks(bucket_name, blob_name, dtypes):
+            yield with_dtypes(df_chunk, dtypes).to_dict(orient='records')
+    elif blob_name.endswith('.atom'):
+        bucket = get_bucket(bucket_name)
+        with open_blob(bucket.get_blob(blob_name)) as stream:
+            items = iter_odata(stream)
+            for new_chunk in iter(lambda: list(itertools.islice(items, chunk_size)), []):
+                yield new_chunk
+    else:
+        bucket = get_bucket(bucket_name)
+        with io.TextIOWrapper(open_blob(bucket.get_blob(blob_name)), encoding='utf-8') as stream:
+            items = iter_json_list(stream, config.ATTRIBUTE_WITH_THE_LIST)
+            for new_chunk in iter(lambda: list(itertools.islice(items, chunk_size)), []):
+                yield new_chunk
+    logging.info('Read file {} from {}'.format(blob_name, bucket_name))
+
+
+def read_csv_chunks(bucket_name, blob_name, dtypes=None):
+    csv_parameters = dict(config.CSV_DIALECT_PARAMETERS)
+    text_columns = {column: str for column, dtype in (dtypes or {}).items() if dtype is str}
+    if text_columns:
+        csv_parameters['dtype'] = {**text_columns, **csv_parameters.get('dtype', {})}
+    source = blob_source(bucket_name, blob_name, stream=True)
+    with pd.read_csv(source, chunksize=config.CHUNKED_READ_SIZE, **csv_parameters) as reader:
+        for df_chunk in reader:
+            yield df_chunk
+
+
+def is_chunked_readable(blob_name):
+    if not hasattr(config, 'CHUNKED_READ_SIZE'):
+        return False
+    return blob_name.endswith('.xlsx') or blob_name.endswith('.csv') or blob_name.endswith('.atom') or \
+        (blob_name.endswith('.json') and hasattr(config, 'ATTRIBUTE_WITH_THE_LIST'))
+
+
+def df_to_store(bucket_name, blob_name, df):
+    # Different types of files: xlsx or json
+    if blob_name.endswith('.xlsx'):
+        new_blob = blob_name
+        strIO = io.BytesIO()
+        excel_writer = pd.ExcelWriter(strIO, engine="xlsxwriter")
+        df = pd.DataFrame(df)
+        df.to_excel(excel_writer, sheet_name="data", index=False)
+        excel_writer.save()
+        file = strIO.getvalue()
+        content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    elif blob_name.endswith('.csv'):
+        new_blob = blob_name
+        file = df.to_csv(**config.CSV_DIALECT_PARAMETERS)
+        content_type = 'text/csv'
+    else:
+        new_blob = os.path.splitext(blob_name)[0] + '.json'
+        if hasattr(config, 'ATTRIBUTE_WITH_THE_LIST'):
+            blob_data = {config.ATTRIBUTE_WITH_THE_LIST: df}
+        else:
+            blob_data = df
+        file = json.dumps(blob_data).encode('utf-8')
+        content_type = 'application/json'
+
+    # Create blob
+    bucket = get_bucket(bucket_name)
+    blob = storage.Blob(new_blob, bucket)
+
+    # Compress text files, xlsx files are zip archives already
+    content_encoding = getattr(config, 'ARCHIVE_CONTENT_ENCODING', None)
+    if content_encoding and not blob_name.endswith('.xlsx'):
+        if isinstance(file, str):
+            file = file.encode('utf-8')
+        file = compress_payload(file, content_encoding, getattr(config, 'ARCHIVE_COMPRESSION_LEVEL', None))
+        blob.content_encoding = content_encoding
+
+    # Upload blob
+    blob.upload_from_string(
+        file,
+        content_type=content_type
+    )
+    logging.info('Write file {} to {}'.format(new_blob, bucket_name))
+
+
+def copy_in_store(bucket_name, blob_name, new_bucket_name):
+    bucket = get_bucket(bucket_name)
+    new_bucket = get_bucket(new_bucket_name)
+    bucket.copy_blob(bucket.blob(blob_name), new_bucket, blob_name)
+    logging.info('Copied file {} from {} to {}'.format(blob_name, bucket_name, new_bucket_name))
+
+
+def remove_from_store(bucket_name, blob_name):
+    bucket = get_bucket(bucket_name)
+    blob = bucket.blob(blob_name)
+    blob.delete()
+    logging.info('Deleted file {} from {}'.format(blob_name, bucket_name))
+
+
+def get_prev_blob(bucket_name, prefix_filter):
+    bucket = get_bucket(bucket_name)
+    blobs = list(bucket.list_blobs(prefix=prefix_filter))
+    if blobs:
+
+        def compare_lobs(lob):
+            return lob.updated
+
+        blobs.sort(key=compare_lobs, reverse=True)
+
+        if config.ARCHIVE == config.INBOX:
+            if len(blobs) > 1:
+                return blobs[1].name
+            else:
+                return None
+        else:
+            return blobs[0].name
+    else:
+        return None
+
+
+def calculate_diff_from_state(new_data, state_storage):
+    full_load = config.FULL_LOAD if hasattr(config, 'FULL_LOAD') else False
+    chunk_size = state_storage.chunk_size
+    new_chunks = [new_data[i:i+chunk_size] for i in range(0, len(new_data), chunk_size)]
+
+    def calculate_diff_chunk(new_chunk):
+        new_state_items = {}
+        for item in new_chunk:
+            item_to_publish = gather_publish_msg(item)
+            new_state_items[item_to_publish[state_storage.id_property]] = item_to_publish
+        return state_storage.calculate_diff(new_state_items, full_load)
+
+    # Several chunks are looked up at the same time, map returns their results in order
+    with ThreadPoolExecutor(max_workers=state_storage.concurrency) as executor:
+        return [row for rows_chunk in executor.map(calculate_diff_chunk, new_chunks) for row in rows_chunk]
+
+
+def store_state_in_background(executor, pending_stores, state_to_store, state_storage):
+    """Submit state_storage.store to executor, keeping at most state_storage.concurrency stores pending.
+
+    Pending stores of the same keys are finished first, so the latest state of a key is stored last.
+    """
+    if any(not keys.isdisjoint(state_to_store) for keys, _ in pending_stores):
+        wait_for_stores(pending_stores)
+    elif len(pending_stores) >= state_storage.concurrency:
+        wait_for_stores(pending_stores, 1)
+    future = executor.submit(state_storage.store, state_to_store)
+    pending_stores.append((set(state_to_store), future))
+
+
+def wait_for_stores(pending_stores, count=None):
+    count = len(pending_stores) if count is None else count
+    for _, future in pending_stores[:count]:
+        future.result()
+    del pending_stores[:count]
+
+
+def publish_rows(gobits, rows_json, state_storage, batch_message_size, rowcount=0, rowmax=None):
+    rowmax = rowmax if rowmax is not None else len(rows_json)
+    i = rowcount + 1
+    publish_futures = PublishFutures()
+    batcher = MessageBatcher(gobits, config.TOPIC_SETTINGS.get('subject'),
+                             max_bytes=getattr(config, 'BATCH_MESSAGE_BYTES', None), max_rows=batch_message_size,
+                             compact=getattr(config, 'PUBLISH_COMPACT_JSON', False))
+    new_state = {}
+    pending_stores = []
+
+    with ThreadPoolExecutor(max_workers=state_storage.concurrency) as executor:
+        for publish_message in rows_json:
+            payload = batcher.add(publish_message)
+            if payload is not None:
+                publish_futures.add(publish_payload(payload, **config.TOPIC_SETTINGS), i - 1, rowmax)
+
+            i += 1
+
+            new_state[publish_message[state_storage.id_property]] = publish_message
+            if len(new_state) > state_storage.chunk_size:
+                store_state_in_background(executor, pending_stores, new_state, state_storage)
+                new_state = {}
+
+        payload = batcher.flush()
+        if payload is not None:
+            publish_futures.add(publish_payload(payload, **config.TOPIC_SETTINGS), i - 1, rowmax)
+        publish_futures.flush()
+        if new_state:
+            store_state_in_background(executor, pending_stores, new_state, state_storage)
+        wait_for_stores(pending_stores)
+
+
+def publish_diff(data, context):
+    logging.info('Run started')
+    reset_api_calls()
+
+    bucket = data['bucket']
+    filename = data['name']
+    new_data = None
+
+    batch_message_size = config.BATCH_MESSAGE_SIZE if hasattr(config, 'BATCH_MESSAGE_SIZE') else None
+
+    chunked = is_chunked_readable(filename)
+    state_storage = None
+
+    try:
+        # Read data from store, in chunks when possible
+        if chunked:
+            new_chunks = iter_data_from_store(bucket, filename)
+        else:
+            new_data = data_from_store(bucket, filename)
+            new_chunks = [new_data]
+        state_storage = state_storage_from_specification(config.STATE_STORAGE_SPECIFICATION)
+        full_load = config.FULL_LOAD if hasattr(config, 'FULL_LOAD') else False
+
+        if full_load:
+            logging.info('publish Full Load')
+
+        gobits = Gobits.from_context(context=context)
+        rowcount = 0
+
+        for new_chunk in new_chunks:
+            rows_json = calculate_diff_from_state(new_chunk, state_storage)
+            if len(rows_json) > 0:
+                logging.info('Found {} new rows.'.format(len(rows_json)))
+                publish_rows(gobits, rows_json, state_storage, batch_message_size,
+                             rowcount=rowcount, rowmax=rowcount + len(rows_json))
+                rowcount += len(rows_json)
+
+        # Check the number of new records
+        # In case of no new records: don't send any updates
+        if rowcount == 0:
+            logging.info('No new rows found')
+
+        state_storage.save()
+
+        if config.INBOX != config.ARCHIVE:
+            # Write file to archive, a file read in chunks is copied as a whole
+            if chunked:
+                copy_in_store(config.INBOX, filename, config.ARCHIVE)
+            else:
+                df_to_store(config.ARCHIVE, filename, new_data)
+            # Remove file from inbox
+            remove_from_store(config.INBOX, filename)
+        logging.info('Run succeeded')
+
+    except Exception as e:
+        if hasattr(config, 'ERROR'):
+            if chunked:
+                copy_in_store(bucket, filename, config.ERROR)
+            else:
+                df_to_store(config.ERROR, filename, new_data)
+        if config.INBOX != config.ARCHIVE:
+            remove_from_store(config.INBOX, filename)
+        logging.error('Processing failure {}'.format(e))
+        raise
+    finally:
+        if state_storage is not None:
+            state_storage.close()
+        log_api_calls()
+        logging.info('Run done')
@@ -0,0 +1,49 @@
+import logging
+import threading
+
+
+class PublishFutures:
+    """Keeps the futures of published messages until they are resolved.
+
+    Failed messages are collected while publishing continues. flush waits for all messages
+    and raises when any of them could not be published.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._failures = []
+        self.published = 0
+
+    def add(self, future, rowcount, rowmax):
+        with self._lock:
+            self._pending[future] = (rowcount, rowmax)
+        future.add_done_callback(self._resolve)
+
+    def _resolve(self, future):
+        # Called by the done callback and by flush, whichever is first handles the result
+        with self._lock:
+            if future not in self._pending:
+                return
+            rowcount, rowmax = self._pending.pop(future)
+            exception = future.exception()
+            if exception is None:
+                self.published += 1
+            else:
+                self._failures.append(exception)
+        if exception is None:
+            logging.debug('Published msg with ID {} ({}/{} rows).'.format(future.result(), rowcount, rowmax))
+        else:
+            logging.error('Failed to publish msg ({}/{} rows): {}'.format(rowcount, rowmax, exception))
+
+    def flush(self):
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.exception()
+            self._resolve(future)
+
+        if self._failures:
+            raise RuntimeError('Failed to publish {} of {} messages, first failure: {}'.format(
+                len(self._failures), len(self._failures) + self.published, self._failures[0]))
+        logging.info('Published {} messages'.format(self.published))
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import config
+
+from google.api_core.exceptions import PreconditionFailed
+from google.cloud import datastore, storage
+
+from gcsclient import get_bucket
+
+DATASTORE_CHUNK_SIZE = 300
+DATASTORE_CONCURRENCY = 4
+SQLITE_CHUNK_SIZE = 500
+# SQLite before 3.32 allows at most 999 variables in a statement, keys are looked up in queries of at most this many
+SQLITE_MAX_VARIABLES = 900
+# Property of a DataStore entity that holds only the hash of the latest message
+HASH_PROPERTY = '_state_hash'
+
+
+def state_storage_from_specification(state_storage_specification):
+    if state_storage_specification['type'] == 'datastore':
+        return DatastoreStateStorage(state_storage_specification)
+    if state_storage_specification['type'] == 'sqlite':
+        return SQLiteStateStorage(state_storage_specification)
+    raise ValueError(f"Unknown state_storage type {state_storage_specification['type']}")
+
+
+def state_hash(item):
+    """Return a hash of item that does not depend on the order of its attributes."""
+    return hashlib.sha256(json.dumps(item, sort_keys=True, separators=(',', ':')).encode('utf-8')).digest()
+
+
+class DatastoreStateStorage:
+    """State storage that keeps the latest published message of every key as an entity in DataStore.
+
+    When store_hash is set in the specification, only a hash of the message is stored in the entity. Entities
+    that still hold the full message are compared attribute by attribute and replaced by a hash when they change.
+    """
+
+    def __init__(self, state_storage_specification):
+        self.entity_name = state_storage_specification['entity_name']
+        self.id_property = state_storage_specification['id_property']
+        self.store_hash = state_storage_specification.get('store_hash', False)
+        self.chunk_size = getattr(config, 'DATASTORE_CHUNK_SIZE', DATASTORE_CHUNK_SIZE)
+        self.concurrency = getattr(config, 'DATASTORE_CONCURRENCY', DATASTORE_CONCURRENCY)
+        self.client = datastore.Client()
+
+    def calculate_diff(self, new_state_items, full_load):
+        rows_result = []
+        keys = [self.client.key(self.entity_name, key) for key in new_state_items.keys()]
+        missing_items = []
+        current_state_chunk = self.client.get_multi(keys, missing=missing_items)
+        for current_item in current_state_chunk:
+            new_item = new_state_items[current_item.key.id_or_name]
+            if full_load or not self.is_equal(current_item, new_item):
+                rows_result.append(new_item)
+        rows_result.extend([new_state_items[missing_item.key.id_or_name] for missing_item in missing_items])
+        return rows_result
+
+    @staticmethod
+    def is_equal(current_item, new_item):
+        if HASH_PROPERTY in current_item and len(current_item) == 1:
+            return current_item[HASH_PROPERTY] == state_hash(new_item)
+        for key_name, key_value in new_item.items():
+            if key_name not in current_item:
+                return False
+            elif key_value != current_item[key_name]:
+                return False
+        return True
+
+    def store(self, state_items):
+        entities_to_put = []
+
+        for key, item in state_items.items():
+            if self.store_hash:
+                entity = datastore.Entity(key=self.client.key(self.entity_name, key),
+                                          exclude_from_indexes=(HASH_PROPERTY,))
+                entity[HASH_PROPERTY] = state_hash(item)
+            else:
+                entity = datastore.Entity(key=self.client.key(self.entity_name, key))
+                entity.update(item)
+            entities_to_put.append(entity)
+
+        self.client.put_multi(entities_to_put)
+
+    def save(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteStateStorage:
+    """State storage that keeps a hash of the latest published message of every key in a local SQLite database.
+
+    The database file is read from blob_name on bucket when the storage is opened and written back to it by
+    save, so the state is only updated when a run succeeds. save only replaces the generation of the file that
+    was read, when another run wrote the state in the meantime it fails instead of overwriting that state.
+    close removes the local copy and has to be called on every path, also when a run fails.
+    """
+
+    def __init__(self, state_storage_specification):
+        self.bucket_name = state_storage_specification['bucket']
+        self.blob_name = state_storage_specification['blob_name']
+        self.id_property = state_storage_specification['id_property']
+        self.chunk_size = state_storage_specification.get('chunk_size', SQLITE_CHUNK_SIZE)
+        self.concurrency = 1
+        self.connection = None
+
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'state.sqlite')
+        try:
+            blob = get_bucket(self.bucket_name).get_blob(self.blob_name)
+            # Generation 0 makes the upload fail when another run created the file in the meantime
+            self.generation = 0
+            if blob is not None:
+                blob.download_to_filename(self.path)
+                self.generation = blob.generation
+                logging.info('Read state {} generation {} from {}'.format(
+                    self.blob_name, self.generation, self.bucket_name))
+
+            # Lookups and stores run on worker threads, but never at the same time
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS state (key PRIMARY KEY, hash BLOB NOT NULL) WITHOUT ROWID')
+        except Exception:
+            self.close()
+            raise
+
+    def calculate_diff(self, new_state_items, full_load):
+        if full_load:
+            return list(new_state_items.values())
+
+        keys = list(new_state_items.keys())
+        current_hashes = {}
+        for start in range(0, len(keys), SQLITE_MAX_VARIABLES):
+            chunk = keys[start:start + SQLITE_MAX_VARIABLES]
+            current_hashes.update(self.connection.execute(
+                'SELECT key, hash FROM state WHERE key IN ({})'.format(','.join('?' * len(chunk))), chunk))
+        return [item for key, item in new_state_items.items() if current_hashes.get(key) != state_hash(item)]
+
+    def store(self, state_items):
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO state (key, hash) VALUES (?, ?)',
+            [(key, state_hash(item)) for key, item in state_items.items()])
+
+    def save(self):
+        self.connection.commit()
+        self.connection.close()
+        self.connection = None
+        blob = storage.Blob(self.blob_name, get_bucket(self.bucket_name))
+        try:
+            blob.upload_from_filename(self.path, content_type='application/x-sqlite3',
+                                      if_generation_match=self.generation)
+        except PreconditionFailed:
+            logging.error('State {} on {} was written by another run since generation {}, not overwriting it'.format(
+                self.blob_name, self.bucket_name, self.generation))
+            raise
+        logging.info('Write state {} to {}'.format(self.blob_name, self.bucket_name))
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        shutil.rmtree(self.directory, ignore_errors=True)
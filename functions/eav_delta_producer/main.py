@@ -2,80 +2,237 @@ import utils
 import json
 import config
 import logging
+import itertools
+import threading
 import pandas as pd
 
 from gobits import Gobits
-from google.cloud import pubsub_v1
 from datetime import datetime, timedelta
+from operator import itemgetter
 from sqlalchemy.orm.session import sessionmaker
-from sqlalchemy import create_engine, or_
+from sqlalchemy import cast, create_engine, or_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.types import LargeBinary
 from models import ImportMeasureValues, ImportKeys, Subscriptions
+from fingerprint import diff_rows
+from publishfutures import PublishFutures
 
-db_password = utils.get_secret(
-    config.database['project_id'],
-    config.database['secret_name']
-)
+# Default options of the database engine, connections are checked before use and replaced after 30 minutes
+DATABASE_ENGINE_OPTIONS = {'pool_pre_ping': True, 'pool_recycle': 1800}
+# Number of rows fetched from the server-side cursor at a time when reading in chunks
+YIELD_PER_ROWS = 10000
+# Default number of seconds the database password is used before it is fetched from Secret Manager again
+DATABASE_SECRET_TTL = 3600
+# MySQL error code of a rejected user name or password
+ACCESS_DENIED_ERROR = 1045
 
-sacn = 'mysql+pymysql://{}:{}@/{}?unix_socket=/cloudsql/{}:{}:{}'.format(
-    config.database['db_user'],
-    db_password,
-    config.database['db_name'],
-    config.database['project_id'],
-    config.database['region'],
-    config.database['instance_id']
-)
+_lock = threading.Lock()
+_publisher = None
+_engine = None
+_engine_url = None
 
 
 def handler(request):
     source = config.SOURCE
     logging.info(f'Starting query for source {source}')
-    df = query(source)
-
     yesterday = (datetime.today() - timedelta(days=1)).strftime('%Y-%m-%d')
-    df_yesterday = query(source, yesterday)
 
-    if not config.FULL_LOAD:
-        df = difference(df_yesterday, df)
+    # Only keys with a version that started or ended since yesterday can differ from yesterday
+    changed_since = yesterday if getattr(config, 'CHANGED_KEYS_ONLY', False) and not config.FULL_LOAD else None
 
-    rows_str = df.to_json(orient='records')
-    rows_json = json.loads(rows_str)
+    if hasattr(config, 'CHUNKED_READ_SIZE'):
+        chunks = iter_query(source, config.CHUNKED_READ_SIZE, None if config.FULL_LOAD else yesterday, changed_since)
+    elif config.FULL_LOAD:
+        chunks = [query(source)]
+    else:
+        df = query(source, changed_since=changed_since)
+        df_yesterday = query(source, yesterday, changed_since=changed_since)
+        chunks = [difference(df_yesterday, df)]
 
     gobits = Gobits.from_request(request=request)
 
-    i = 1
-    for row in rows_json:
-        msg = {
-            "gobits": [gobits.to_json()],
-            "data": [row]
-        }
-        publish_json(msg, rowcount=i, rowmax=len(rows_json), **config.TOPIC_SETTINGS)
-        i += 1
+    publish_futures = PublishFutures()
+    rowcount = 0
+    for df in chunks:
+        rows_str = df.to_json(orient='records')
+        rows_json = json.loads(rows_str)
+
+        i = 1
+        for row in rows_json:
+            msg = {
+                "gobits": [gobits.to_json()],
+                "data": [row]
+            }
+            publish_futures.add(publish_json(msg, **config.TOPIC_SETTINGS),
+                                rowcount=rowcount + i, rowmax=rowcount + len(rows_json))
+            i += 1
+        rowcount += len(rows_json)
+    publish_futures.flush()
+
+
+def get_publisher():
+    """Return the publisher of this instance, created on first use so all messages are sent in batches."""
+    global _publisher
+    with _lock:
+        if _publisher is None:
+            # The Pub/Sub client library takes a quarter of a second to import, runs without changes do not need it
+            from google.cloud import pubsub_v1
+
+            batch_settings = pubsub_v1.types.BatchSettings(**config.TOPIC_BATCH_SETTINGS)
+            _publisher = pubsub_v1.PublisherClient(batch_settings)
+        return _publisher
+
 
+def get_engine(refresh_secret=False):
+    """Return the database engine of this instance, its connection pool is reused by later invocations.
+
+    The engine is replaced when the database password changed, which is checked when the cached secret expires
+    or, with refresh_secret, right away.
+    """
+    global _engine, _engine_url
+    url = database_url(refresh_secret)
+    with _lock:
+        if _engine is None or url != _engine_url:
+            if _engine is not None:
+                _engine.dispose()
+            _engine = create_engine(url, **getattr(config, 'DATABASE_ENGINE_OPTIONS', DATABASE_ENGINE_OPTIONS))
+            _engine_url = url
+        return _engine
+
+
+def database_url(refresh_secret=False):
+    db_password = utils.get_cached_secret(
+        config.database['project_id'],
+        config.database['secret_name'],
+        getattr(config, 'DATABASE_SECRET_TTL', DATABASE_SECRET_TTL),
+        refresh=refresh_secret
+    )
+
+    return 'mysql+pymysql://{}:{}@/{}?unix_socket=/cloudsql/{}:{}:{}'.format(
+        config.database['db_user'],
+        db_password,
+        config.database['db_name'],
+        config.database['project_id'],
+        config.database['region'],
+        config.database['instance_id']
+    )
 
-def publish_json(msg, rowcount, rowmax, topic_project_id, topic_name):
-    batch_settings = pubsub_v1.types.BatchSettings(**config.TOPIC_BATCH_SETTINGS)
-    publisher = pubsub_v1.PublisherClient(batch_settings)
+
+def open_session():
+    """Return a session with a database connection.
+
+    When the database rejects the password, for instance after it was rotated, the secret is fetched again and
+    the engine is rebuilt once before giving up.
+    """
+    try:
+        return connect_session(get_engine())
+    except OperationalError as e:
+        if getattr(e.orig, 'args', ())[:1] != (ACCESS_DENIED_ERROR,):
+            raise
+        logging.warning('Database access denied, fetching the password again')
+    return connect_session(get_engine(refresh_secret=True))
+
+
+def connect_session(engine):
+    session = sessionmaker(engine, autoflush=False, autocommit=False)()
+    try:
+        # Check out the connection now, so a rejected password is noticed here
+        session.connection()
+    except Exception:
+        session.close()
+        raise
+    return session
+
+
+def publish_json(msg, topic_project_id, topic_name):
+    publisher = get_publisher()
     topic_path = publisher.topic_path(topic_project_id, topic_name)
-    future = publisher.publish(
+    return publisher.publish(
         topic_path, bytes(json.dumps(msg).encode('utf-8')))
-    future.add_done_callback(
-        lambda x: logging.info(
-            'Published msg with ID {} ({}/{} rows).'.format(
-                future.result(), rowcount, rowmax))
-    )
 
 
 def difference(df_old, df_new):
-    joined = df_old.drop_duplicates().merge(df_new.drop_duplicates(), how='right', indicator=True)
-    diff = joined.query("_merge != 'both'").drop('_merge', axis=1)
+    diff = diff_rows(df_old.drop_duplicates(), df_new.drop_duplicates())
     logging.info(f'Difference is {len(diff)} records!')
     return diff
 
 
-def query(sourceTag, ts=None):
-    engine = create_engine(sacn)
-    session = sessionmaker(engine, autoflush=False, autocommit=False)()
+def query(sourceTag, ts=None, changed_since=None, keys=None):
+    session = open_session()
+    q, set_index = select_values(session, sourceTag, ts)
+
+    if changed_since is not None:
+        # Pivot only the keys of which a version started or ended after changed_since, but keep a column for
+        # every measure of the source, so the pivot has the same columns as when all keys are pivoted
+        measures = select_measures(q)
+        q = filter_changed_keys(session, q, sourceTag, changed_since)
+    if keys is not None:
+        q = q.filter(ImportMeasureValues.sourceKey.in_(keys))
+
+    df = session.execute(q)
+    df = pd.DataFrame(df)
+    # Return the connection to the pool of the engine
+    session.close()
+
+    logging.info(f'Found {len(df)} records!')
+    df = pivot(df, set_index)
+
+    if changed_since is not None:
+        df = df.reindex(columns=measures).astype(object)
+
+    return df
+
+
+def iter_query(sourceTag, chunk_size, ts=None, changed_since=None):
+    """Yield the pivot of the current rows of sourceTag in DataFrames of at most chunk_size keys.
+
+    The rows are read ordered by key with a server-side cursor, so only one chunk is held in memory. When ts
+    is given, every chunk only holds the rows that differ from the row of the same key at ts. This differs from
+    difference, which drops duplicate rows and only publishes a row when no key had the same values at ts: here
+    a row is published when its own key changed, also when another key had the same values, and duplicate rows
+    of different keys are all published.
+    """
+    session = open_session()
+    try:
+        q, set_index = select_values(session, sourceTag)
+        measures = select_measures(q)
+        if changed_since is not None:
+            q = filter_changed_keys(session, q, sourceTag, changed_since)
+        # Keys are ordered by their bytes, a case-insensitive or PAD SPACE collation would mix the rows of keys
+        # like 'a', 'A' and 'a ', which are different keys in the pivot. LargeBinary is cast to BINARY on MySQL and
+        # to BLOB on SQLite, where BINARY would be a number
+        rows = q.order_by(cast(ImportMeasureValues.sourceKey, LargeBinary)).yield_per(YIELD_PER_ROWS)
+
+        for keys, chunk in iter_key_chunks(rows, chunk_size):
+            df = pivot(pd.DataFrame(chunk), set_index).reindex(columns=measures).astype(object)
+            if ts is not None:
+                df = changed_rows(query(sourceTag, ts, keys=keys), df)
+            yield df
+    finally:
+        session.close()
+
+
+def iter_key_chunks(rows, chunk_size):
+    """Yield the keys and rows of at most chunk_size keys at a time from rows ordered by the bytes of the key."""
+    keys, chunk = [], []
+    for key, key_rows in itertools.groupby(rows, key=itemgetter(0)):
+        if len(keys) == chunk_size:
+            yield keys, chunk
+            keys, chunk = [], []
+        keys.append(key)
+        chunk.extend(tuple(row) for row in key_rows)
+    if keys:
+        yield keys, chunk
+
 
+def changed_rows(df_old, df_new):
+    """Return the rows of df_new that differ from the row with the same key in df_old, or have no row there."""
+    old = df_old.reindex(index=df_new.index, columns=df_new.columns)
+    same = ((df_new == old) | (df_new.isna() & old.isna())).all(axis=1)
+    return df_new[~same | ~df_new.index.isin(df_old.index)]
+
+
+def select_values(session, sourceTag, ts=None):
     if ts == "all":
         q = session.query([
             ImportMeasureValues.sourceKey,
@@ -104,14 +261,30 @@ def query(sourceTag, ts=None):
             filter(or_(ImportKeys.versionEnd.is_(None), ImportKeys.versionEnd > ts))
 
     q = q.filter(Subscriptions.sourceTag == sourceTag)
+    return q, set_index
 
-    df = session.execute(q)
-    df = pd.DataFrame(df)
+
+def select_measures(q):
+    """Return the measures of the rows of q, as they are named in the pivot."""
+    measures = pd.Series([measure for measure, in q.with_entities(ImportMeasureValues.measure).distinct()],
+                         dtype=object)
+    measures = measures.replace('\n', ' ', regex=True).replace(' +', ' ', regex=True)
+    return sorted(set(measures))
+
+
+def filter_changed_keys(session, q, sourceTag, changed_since):
+    changed_keys = session.query(ImportKeys.sourceKey).\
+        join(Subscriptions, ImportKeys.sourceTag == Subscriptions.stagingSourceTag).\
+        filter(ImportKeys.delete == 0).\
+        filter(Subscriptions.sourceTag == sourceTag).\
+        filter(or_(ImportKeys.version > changed_since, ImportKeys.versionEnd > changed_since))
+    return q.filter(ImportKeys.sourceKey.in_(changed_keys))
+
+
+def pivot(df, set_index):
     df = df.replace('\n', ' ', regex=True)
     df = df.replace(' +', ' ', regex=True)
 
-    logging.info(f'Found {len(df)} records!')
-
     if len(df) == 0:
         df = pd.DataFrame([])
     else:
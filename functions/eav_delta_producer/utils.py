@@ -1,8 +1,14 @@
-from google.cloud import secretmanager_v1
+import threading
+import time
+
+_lock = threading.Lock()
+_client = None
+# Cached secret values with the time they were fetched, by project and secret id
+_secrets = {}
 
 
 def get_secret(project_id, secret_id):
-    client = secretmanager_v1.SecretManagerServiceClient()
+    client = get_client()
 
     secret_name = client.secret_version_path(project_id, secret_id, "latest")
 
@@ -10,3 +16,27 @@ def get_secret(project_id, secret_id):
     payload = response.payload.data.decode("UTF-8")
 
     return payload
+
+
+def get_cached_secret(project_id, secret_id, ttl, refresh=False):
+    """Return the latest version of a secret, fetched on first use and kept by the instance for ttl seconds.
+
+    With refresh set, the secret is fetched again right away, for instance after it was rejected.
+    """
+    with _lock:
+        cached = _secrets.get((project_id, secret_id))
+        if cached is None or refresh or time.monotonic() - cached[1] >= ttl:
+            cached = (get_secret(project_id, secret_id), time.monotonic())
+            _secrets[(project_id, secret_id)] = cached
+        return cached[0]
+
+
+def get_client():
+    """Return the Secret Manager client of this instance, created on first use."""
+    global _client
+    if _client is None:
+        # The Secret Manager client library takes half a second to import, it is only loaded when a secret is needed
+        from google.cloud import secretmanager_v1
+
+        _client = secretmanager_v1.SecretManagerServiceClient()
+    return _client
@@ -0,0 +1,68 @@
+import logging
+import os
+import threading
+from collections import Counter
+
+import google.auth
+from google.auth.credentials import AnonymousCredentials
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import storage
+from requests.adapters import HTTPAdapter
+
+# Number of connections to Cloud Storage kept open for reuse
+HTTP_POOL_SIZE = 16
+
+# Number of Cloud Storage API requests by HTTP method since the last reset_api_calls
+api_calls = Counter()
+
+_lock = threading.Lock()
+_client = None
+_buckets = {}
+
+
+class _CountingSession(AuthorizedSession):
+    def request(self, method, url, *args, **kwargs):
+        api_calls[method] += 1
+        return super().request(method, url, *args, **kwargs)
+
+
+def get_client():
+    """Return the storage client of this instance, created on first use and reused by later invocations."""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = _create_client()
+        return _client
+
+
+def get_bucket(bucket_name):
+    """Return a cached handle to bucket_name.
+
+    Unlike Client.get_bucket, creating the handle does not request the bucket metadata.
+    """
+    client = get_client()
+    with _lock:
+        if bucket_name not in _buckets:
+            _buckets[bucket_name] = client.bucket(bucket_name)
+        return _buckets[bucket_name]
+
+
+def reset_api_calls():
+    api_calls.clear()
+
+
+def log_api_calls():
+    logging.info('Storage API calls: {} ({})'.format(
+        sum(api_calls.values()), ', '.join('{} {}'.format(count, method) for method, count in api_calls.items())))
+
+
+def _create_client():
+    if os.environ.get('STORAGE_EMULATOR_HOST'):
+        credentials, project = AnonymousCredentials(), os.environ.get('GOOGLE_CLOUD_PROJECT', 'test')
+    else:
+        credentials, project = google.auth.default(scopes=storage.Client.SCOPE)
+    session = _CountingSession(credentials)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return storage.Client(project=project, credentials=credentials, _http=session)
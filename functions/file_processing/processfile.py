@@ -0,0 +1,202 @@
+import json
+import config
+import logging
+import traceback
+import io
+import numpy as np
+import pandas as pd
+import unicodedata
+from google.cloud import storage
+
+from blobio import blob_source, download_blob
+from gcsclient import get_bucket, log_api_calls, reset_api_calls
+from hashing import sha256_hexdigests
+
+
+def send_bytestream_to_filestore(bytesIO, filename, bucket_name):
+    bucket = get_bucket(bucket_name)
+    blob = storage.Blob(filename, bucket)
+    if filename.endswith('.xlsx'):
+        blob.upload_from_string(
+            bytesIO.getvalue(),
+            content_type=config.MEDIA_TYPE
+        )
+    else:
+        blob.upload_from_string(
+            bytesIO,
+            content_type=config.MEDIA_TYPE
+        )
+    logging.info('Write file {} to {}'.format(filename, bucket_name))
+
+
+def remove_file_from_filestore(bucket_name, filename):
+    bucket = get_bucket(bucket_name)
+    blob = bucket.blob(filename)
+    blob.delete()
+    logging.info('Deleted file {} from {}'.format(filename, bucket_name))
+
+
+def normalize_values(values):
+    return [unicodedata.normalize('NFKD', value) for value in values]
+
+
+def map_distinct(series, convert_values):
+    """Return series with its values converted by convert_values, which converts a list of values at once.
+
+    Every distinct value is converted only once.
+    """
+    codes, distinct = pd.factorize(series)
+    # Missing values have code -1, they are converted as they are
+    results = np.array(list(convert_values(distinct)) + [None], dtype=object)[codes]
+    missing = codes == -1
+    if missing.any():
+        results[missing] = convert_values(series.to_numpy()[missing])
+    return pd.Series(results, index=series.index, name=series.name)
+
+
+def join_columns(df, columns, separator):
+    """Return the values in columns of every row of df as strings joined by separator, leaving out missing values.
+
+    Same as df[columns].apply(lambda x: separator.join(x.dropna().astype(str)), axis=1), one column at a time.
+    """
+    values = df[columns].to_numpy()
+    if values.dtype.kind in 'mM':
+        # Rows of dates and durations are formatted as a whole, see Series.astype(str)
+        return df[columns].apply(lambda x: separator.join(x.dropna().astype(str)), axis=1)
+    joined = np.full(len(df), '', dtype=object)
+    started = np.zeros(len(df), dtype=bool)
+    for column in values.T:
+        # Rows share the dtype of values, so convert the values the same way
+        present = pd.notna(column)
+        text = pd.Series(column).astype(str).to_numpy(dtype=object)
+        joined = np.where(present, np.where(started, joined + separator + text, text), joined)
+        started |= present
+    return pd.Series(joined, index=df.index)
+
+
+def preprocessing(bucket_name, blob_name):
+    logging.info('Preprocess start')
+    df = df_from_store(bucket_name, blob_name)
+
+    # Check if contains the correct columns
+    cols_exp = set(list(config.COLUMN_MAPPING.keys()))
+    cols_present = set(list(df))
+
+    if cols_exp.difference(cols_present):
+        missing = cols_exp - cols_present
+        message = 'The uploaded file does not contain the correct columns.' + \
+            ' The following columns are missing: "{}".'.format(
+                '", "'.join(list(missing)))
+
+        logging.info(message)
+        return dict(
+            status='failure',
+            message=message
+        )
+
+    # Check if contains data
+    if len(df) == 0:
+        message = 'The uploaded file does not contain content'
+        logging.info(message)
+        return dict(
+            status='warning',
+            message=message
+        )
+
+    # rename the columns
+    df = df.rename(columns=config.COLUMN_MAPPING)
+
+    # remove characters from certain columns
+    if hasattr(config, 'REMOVE_CHAR_FROM_COLUMN'):
+        for key, value in config.REMOVE_CHAR_FROM_COLUMN.items():
+            df[key] = df[key].str[0:-value].str.strip()
+
+    # normalize string columns
+    if hasattr(config, 'COLUMNS_NORMALIZE'):
+        for col in config.COLUMNS_NORMALIZE:
+            df[col] = map_distinct(df[col], normalize_values)
+
+    # combine columns
+    if hasattr(config, 'COLUMN_COMBINE'):
+        for key, value in config.COLUMN_COMBINE.items():
+            df[key] = join_columns(df, value, '_')
+
+    # Columns to be hashed
+    if hasattr(config, 'COLUMNS_HASH'):
+        for col in config.COLUMNS_HASH:
+            df[col] = map_distinct(df[col], sha256_hexdigests)
+
+    # replace '' with none values
+    for col in df.columns:
+        df.at[df[col] == '', col] = None
+
+    # Only keep non-PII columns
+    df = df[config.COLUMNS_NONPII]
+
+    # Return file as byte-stream
+    if blob_name.endswith('.xlsx'):
+        bytesIO = io.BytesIO()
+        excel_writer = pd.ExcelWriter(bytesIO, engine="xlsxwriter")
+        df.to_excel(excel_writer, sheet_name="data", index=False)
+        excel_writer.save()
+    else:
+        if hasattr(config, 'JSON_ELEMENTS'):
+            df = df.to_dict(orient='records')
+            bytesIO = {config.JSON_ELEMENTS[-1]: df}
+            bytesIO = json.dumps(bytesIO).encode('utf-8')
+        else:
+            df = df.to_json()
+            bytesIO = json.dumps(df).encode('utf-8')
+
+    return dict(
+        status='success',
+        message='file succesfully processed',
+        file=bytesIO
+    )
+
+
+def df_from_store(bucket_name, blob_name):
+    if blob_name.endswith('.xlsx'):
+        # openpyxl is only imported for xlsx files
+        from xlsxstream import read_excel
+
+        bucket = get_bucket(bucket_name)
+        df = read_excel(io.BytesIO(download_blob(bucket.get_blob(blob_name))), dtype=str)
+    elif blob_name.endswith('.json'):
+        if hasattr(config, 'JSON_ELEMENTS'):
+            json_elements = getattr(config, 'JSON_ELEMENTS', [])
+            bucket = get_bucket(bucket_name)
+            content = download_blob(bucket.get_blob(blob_name))
+            data = json.loads(content.decode('utf-8'))
+            for el in json_elements:
+                data = data[el]
+            df = pd.DataFrame.from_records(data)
+        else:
+            df = pd.read_json(blob_source(bucket_name, blob_name), dtype=False)
+    else:
+        raise ValueError('File is not json or xlsx: {}'.format(blob_name))
+    logging.info('Read file {} from {}'.format(blob_name, bucket_name))
+    return df
+
+
+def file_processing(data, context):
+    logging.info('Run started')
+    reset_api_calls()
+    bucket_name = data['bucket']
+    filename = data['name']
+
+    try:
+        # Read dataframe from store
+        preprocessed = preprocessing(bucket_name, filename)
+
+        send_bytestream_to_filestore(preprocessed['file'], filename, config.INBOX)
+        delete = config.DELETE if hasattr(config, 'DELETE') else True
+        if delete:
+            remove_file_from_filestore(bucket_name, filename)
+
+        logging.info('Processing file {} successful'.format(filename))
+    except Exception:
+        logging.error('Processing file {} failed!'.format(filename))
+        traceback.print_exc()
+    finally:
+        log_api_calls()
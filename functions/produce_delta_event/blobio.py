@@ -0,0 +1,65 @@
+import io
+
+from gcsclient import get_bucket
+from payloadcoding import content_decompressor, decompress_content
+
+# Number of compressed bytes downloaded at a time by open_blob
+READ_SIZE = 1 << 20
+
+
+def download_blob(blob):
+    """Return the content of blob, decompressed when it is stored with a Content-Encoding."""
+    # Downloading updates the blob properties from the response headers, so read them first
+    content_encoding = blob.content_encoding
+    if content_encoding:
+        return decompress_content(blob.download_as_bytes(raw_download=True), content_encoding)
+    return blob.download_as_bytes()
+
+
+def blob_source(bucket_name, blob_name, stream=False, blob=None):
+    """Return what to read blob_name from: its gs:// path, or its decompressed content when it is compressed.
+
+    The decompressed content is a stream from open_blob when stream is set, otherwise it is downloaded at once.
+    The properties of blob_name are requested, unless they are passed as blob.
+    """
+    if blob is None:
+        blob = get_bucket(bucket_name).get_blob(blob_name)
+    if blob is None or not blob.content_encoding:
+        return 'gs://{}/{}'.format(bucket_name, blob_name)
+    if stream:
+        return open_blob(blob)
+    return io.BytesIO(download_blob(blob))
+
+
+def open_blob(blob):
+    """Return a binary stream of the content of blob.
+
+    A blob stored with a Content-Encoding is downloaded in ranges of READ_SIZE bytes and
+    decompressed while it is read, so it is never held in memory as a whole.
+    """
+    if blob.content_encoding:
+        return io.BufferedReader(_DecompressingBlobReader(blob))
+    return blob.open('rb')
+
+
+class _DecompressingBlobReader(io.RawIOBase):
+    def __init__(self, blob):
+        self.blob = blob
+        self.decompress = content_decompressor(blob.content_encoding)
+        self.size = blob.size
+        self.position = 0
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer and self.position < self.size:
+            end = min(self.position + READ_SIZE, self.size)
+            data = self.blob.download_as_bytes(start=self.position, end=end - 1, raw_download=True)
+            self.position = end
+            self.buffer = self.decompress(data)
+        size = min(len(b), len(self.buffer))
+        b[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
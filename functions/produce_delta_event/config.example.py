@@ -4,12 +4,34 @@ TOPIC_SETTINGS = {"topic_project_id": "my-topic-id", "topic_name": "my-topic-nam
 # Parameters added to pubsub_v1.types.BatchSettings to initialize pubsub PublisherClient
 TOPIC_BATCH_SETTINGS = {"max_messages": 100}
 
+# Optional, parameters added to pubsub_v1.types.PublishFlowControl. Publishing blocks while message_limit messages or
+# byte_limit bytes are waiting to be sent (default 1000 messages and 10 MiB). Every message is waited for before the
+# file is archived, the run fails when any message could not be published.
+TOPIC_FLOW_CONTROL = {"message_limit": 1000, "byte_limit": 10 * 1024 * 1024}
+
 # Parameters added to pandas.read_csv when reading csv file
 CSV_DIALECT_PARAMETERS = {"sep": ",", "quotechar": '"'}
 
 # Number of entries to send in a single message
 BATCH_MESSAGE_SIZE = 100
 
+# Optional, maximum size in bytes of a single message. Entries are added to a message until either this size or
+# BATCH_MESSAGE_SIZE entries is reached, BATCH_MESSAGE_SIZE can be left out to batch by size only. Pub/Sub accepts
+# messages of at most 10 MB.
+# BATCH_MESSAGE_BYTES = 1000000
+
+# Optional, if True messages are published as compact JSON, without whitespace and with non-ASCII characters
+# unescaped. Messages are encoded with orjson when it is added to requirements.txt, otherwise with the json module.
+# The published JSON values are the same, but their bytes differ from the default encoding.
+PUBLISH_COMPACT_JSON = False
+
+# Optional, when PUBLISH_CONTENT_ENCODING is defined every message is compressed with 'br' (Brotli) or 'gzip' and gets
+# a content-encoding attribute with that value. PUBLISH_COMPRESSION_LEVEL is the Brotli quality (0-11, default 5) or
+# gzip level (1-9, default 6). BATCH_MESSAGE_BYTES applies to the size before compression. Subscribers can use
+# decompress_payload from payloadcoding.py to read both compressed and uncompressed messages.
+# PUBLISH_CONTENT_ENCODING = "br"
+# PUBLISH_COMPRESSION_LEVEL = 5
+
 # Storage buckets to use
 # INBOX will be used to load input
 # ARCHIVE will be used to store all handled input, input on INBOX will be removed when stored to ARCHIVE
@@ -20,12 +42,40 @@ INBOX = "my-inbox-bucket"
 ARCHIVE = "my-archive-bucket"
 ERROR = "my-error-bucket"
 
+# Optional, when ARCHIVE_CONTENT_ENCODING is defined csv and json files written to ARCHIVE and ERROR are compressed with
+# 'br' (Brotli) or 'gzip' and stored with that Content-Encoding. ARCHIVE_COMPRESSION_LEVEL is the Brotli quality (0-11,
+# default 5) or gzip level (1-9, default 6). xlsx files are not compressed. Compressed files are read transparently,
+# also when they are put on INBOX. Chunked reads (CHUNKED_READ_SIZE) copy the file to ARCHIVE as it was received.
+# ARCHIVE_CONTENT_ENCODING = "br"
+# ARCHIVE_COMPRESSION_LEVEL = 5
+
 # Optional, if True then all items will be published, regardless changes to previous data
 FULL_LOAD = False
 
 # Optional, if False then no duplicate items are deleted.
 SHOULD_DROP_DUPLICATES = True
 
+# Optional, if True then the row fingerprints of every archived file are stored next to it on ARCHIVE
+# (as <archived file>.fingerprints). The next run compares new data to these fingerprints instead of
+# reading the previous file from ARCHIVE, which is still read when its fingerprints are missing.
+# Only used when INBOX and ARCHIVE are different buckets.
+ARCHIVE_FINGERPRINTS = False
+
+# Optional, if True then the name of the latest archived file is stored on ARCHIVE (as <FILEPATH_PREFIX_FILTER>.latest)
+# after every successful run. The next run reads the previous file name from it instead of listing all files on
+# ARCHIVE, which is still done when the pointer is missing or refers to a file that no longer exists.
+# Only used when INBOX and ARCHIVE are different buckets.
+ARCHIVE_LATEST_POINTER = False
+
+# Optional, if True then every file archived as a whole is also stored as a Parquet snapshot on ARCHIVE (as
+# <archived file>.parquet). The next run reads the previous data from the snapshot, which is much faster than reading
+# xlsx, csv or json, and still reads the archived file when the snapshot is missing. The snapshot holds the same values
+# and dtypes as the archived file is read with, so xlsx files are compared as strings as before. An archived csv file
+# also holds the row index as its first column, which the snapshot leaves out, so csv rows are compared instead of all
+# rows published because the columns differ. No snapshot is stored for data Parquet can not hold, like columns of
+# mixed types. Only used when INBOX and ARCHIVE are different buckets.
+ARCHIVE_SNAPSHOT = False
+
 # Dict that contains mapping from column names to the used column names
 COLUMN_MAPPING = {
     "Example A": "example_A",
@@ -75,6 +125,19 @@ COLUMNS_PUBLISH = {
     "name": "last_name",
 }
 
+# Optional, number of worker processes that hash large columns with the 'hash' conversion (default the number of
+# CPUs of the instance, 1 hashes in the function itself). Only columns of 50000 or more distinct values are hashed in
+# worker processes. The workers are started for the first such column and kept for later ones and later invocations.
+# HASH_WORKERS = 1
+
+# Optional, when defined csv files and json files with ATTRIBUTE_WITH_THE_LIST are read, compared and published in
+# chunks of CHUNKED_READ_SIZE rows instead of as a whole, which keeps memory use flat for large files. The file is
+# read twice, first to find the types its columns get when it is read as a whole, so the chunks publish the same
+# values. The file is copied to ARCHIVE unchanged. A previous json file on ARCHIVE is read as a whole when its
+# fingerprints (ARCHIVE_FINGERPRINTS) are missing. Files with a column that holds more than one kind of values, like
+# numbers and text, and files whose previous file can not be read in chunks are compared as a whole.
+# CHUNKED_READ_SIZE = 10000
+
 # ATTRIBUTE_WITH_THE_LIST is used when reading data from JSON where the top-level is an object instead
 # of a list. The list containing the data to load is the value of an attribute of the top-level object.
 # For example, setting ATTRIBUTE_WITH_THE_LIST to rows, will load this JSON: {"rows": [{"field1": "value1"}] }
@@ -0,0 +1,147 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+# Fingerprint of a missing value, so None, NaN and NaT all compare equal like they do in a merge
+NULL_HASH = np.uint64(0x9E3779B97F4A7C15)
+COMBINE_MULTIPLIER = np.uint64(1000003)
+
+
+def diff_rows(df_old, df_new):
+    """Return the rows of df_new that do not occur in df_old.
+
+    The result is the same as merging both dataframes with how='right' and indicator=True
+    and keeping the rows that are not in both, but is computed by comparing one 64-bit
+    fingerprint per row instead of joining on all columns. When the dataframes can not
+    be compared by fingerprint (different columns or dtypes, mixed object columns), the
+    merge is used.
+    """
+    if not is_fingerprintable(df_old, df_new):
+        joined = df_old.merge(df_new, how='right', indicator=True)
+        return joined.query("_merge != 'both'").drop('_merge', axis=1)
+
+    columns = list(df_old.columns)
+    return diff_fingerprints(np.sort(row_fingerprints(df_old, columns)), df_new, columns)
+
+
+def diff_fingerprints(old_fingerprints, df_new, columns):
+    """Return the rows of df_new, limited to columns, whose fingerprint is not in the sorted old_fingerprints."""
+    new_fingerprints = row_fingerprints(df_new, columns)
+    matches = np.searchsorted(old_fingerprints, new_fingerprints, side='right') - \
+        np.searchsorted(old_fingerprints, new_fingerprints, side='left')
+    is_new = matches == 0
+
+    # A merge repeats every new row once per matching old row, keep its index positions
+    multiplicity = np.where(is_new, 1, matches)
+    position = np.cumsum(multiplicity) - multiplicity
+
+    diff = df_new.iloc[np.flatnonzero(is_new)][columns]
+    diff.index = pd.Index(position[is_new])
+    return diff
+
+
+def dump_fingerprints(df):
+    """Serialize the sorted row fingerprints of df together with its columns and dtypes."""
+    columns = list(df.columns)
+    return dump_sorted_fingerprints(
+        np.sort(row_fingerprints(df, columns)), columns, [df[column].dtype for column in columns])
+
+
+def dump_fingerprint_chunks(fingerprint_chunks):
+    """Serialize a list of (fingerprints, columns, dtypes) of consecutive chunks of one dataframe."""
+    fingerprints = np.concatenate([chunk_fingerprints for chunk_fingerprints, _, _ in fingerprint_chunks])
+    _, columns, dtypes = fingerprint_chunks[0]
+    return dump_sorted_fingerprints(np.sort(fingerprints), columns, dtypes)
+
+
+def dump_sorted_fingerprints(fingerprints, columns, dtypes):
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        fingerprints=fingerprints,
+        columns=np.array([str(column) for column in columns], dtype=str),
+        dtypes=np.array([str(dtype) for dtype in dtypes], dtype=str))
+    return buffer.getvalue()
+
+
+def load_fingerprints(content):
+    """Return the sorted fingerprints and a dict of column dtypes serialized by dump_fingerprints."""
+    with np.load(io.BytesIO(content), allow_pickle=False) as dumped:
+        return dumped['fingerprints'], dict(zip(dumped['columns'].tolist(), dumped['dtypes'].tolist()))
+
+
+def match_columns(df, dtypes):
+    """Return the columns of df in the order of dtypes, or None when the columns or their dtypes differ."""
+    columns = {str(column): column for column in df.columns}
+    if not is_fingerprintable_frame(df) or len(columns) != len(df.columns) or len(columns) != len(dtypes):
+        return None
+    for column, dtype in dtypes.items():
+        if column not in columns or str(df[columns[column]].dtype) != dtype:
+            return None
+    return [columns[column] for column in dtypes]
+
+
+def diff_dumped_fingerprints(content, df_new):
+    """Return the rows of df_new that do not occur in the dataframe dumped by dump_fingerprints.
+
+    Returns None when df_new can not be compared to the dumped fingerprints, because its
+    columns or dtypes differ or the previous dataframe was empty.
+    """
+    old_fingerprints, dtypes = load_fingerprints(content)
+    columns = match_columns(df_new, dtypes)
+    if len(old_fingerprints) == 0 or columns is None:
+        return None
+    return diff_fingerprints(old_fingerprints, df_new, columns)
+
+
+def is_fingerprintable(df_old, df_new):
+    if not is_fingerprintable_frame(df_old) or not is_fingerprintable_frame(df_new):
+        return False
+    if len(df_old.columns) == 0 or set(df_old.columns) != set(df_new.columns):
+        return False
+
+    for column in df_old.columns:
+        if df_old[column].dtype != df_new[column].dtype:
+            return False
+    return True
+
+
+def is_fingerprintable_frame(df):
+    if not df.columns.is_unique:
+        return False
+
+    for column in df.columns:
+        if df[column].dtype == object and \
+                pd.api.types.infer_dtype(df[column], skipna=True) not in ('string', 'boolean', 'empty'):
+            return False
+    return True
+
+
+def row_fingerprints(df, columns):
+    fingerprints = np.zeros(len(df), dtype=np.uint64)
+    for column in columns:
+        fingerprints = fingerprints * COMBINE_MULTIPLIER ^ column_fingerprints(df[column])
+    return fingerprints
+
+
+def column_fingerprints(series):
+    missing = series.isna().to_numpy()
+    if series.dtype.kind == 'f':
+        # Adding zero turns -0.0 into 0.0, which a merge also considers equal
+        series = series + 0.0
+    elif series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == 'boolean':
+        # Booleans with missing values are hashed like a bool column, the missing values get NULL_HASH
+        series = series.fillna(False).astype(bool)
+    hashed = pd.util.hash_pandas_object(series, index=False).to_numpy()
+    return np.where(missing, NULL_HASH, hashed)
+
+
+def first_occurrences(fingerprints, seen):
+    """Return a mask of the fingerprints that are not in the set seen yet, and add them to it."""
+    is_first = np.zeros(len(fingerprints), dtype=bool)
+    for i, fingerprint in enumerate(fingerprints.tolist()):
+        if fingerprint not in seen:
+            seen.add(fingerprint)
+            is_first[i] = True
+    return is_first
@@ -1,92 +1,277 @@
+import json
 from datetime import datetime, timezone
 from hashlib import sha256
+from operator import methodcaller
 
+import numpy as np
+import pandas as pd
 
-def gather_publish_msg(msg, columns_publish=None):  # noqa: C901
-    if columns_publish:
-        gathered_msg = {}
-        for msg_key, value_key in columns_publish.items():
-            gathered_msg[msg_key] = None
-
-            if type(value_key) is dict:
-                if (
-                    value_key.get("conversion") == "geojson_point"
-                    and value_key["longitude_attribute"] in msg
-                    and value_key["latitude_attribute"] in msg
-                ):
-                    gathered_msg[msg_key] = {
-                        "type": "Point",
-                        "coordinates": [
-                            float(msg[value_key["longitude_attribute"]]),
-                            float(msg[value_key["latitude_attribute"]]),
-                        ],
-                    }
-                    continue
-                elif "source_attribute" in value_key:
-                    if type(value_key["source_attribute"]) is list:
-                        for att in value_key["source_attribute"]:
-                            if att in msg:
-                                gathered_msg[msg_key] = msg.get(att)
-                                break
-                    else:
-                        gathered_msg[msg_key] = msg.get(
-                            value_key["source_attribute"], None
-                        )
-
-                if gathered_msg[msg_key] is not None:
-                    conversions = value_key.get("conversion", [])
-
-                    if not isinstance(conversions, list):
-                        conversions = [conversions]
-
-                    for conversion in conversions:
-                        if conversion == "strip":
-                            gathered_msg[msg_key] = gathered_msg[msg_key].strip()
-                        elif conversion == "lowercase":
-                            gathered_msg[msg_key] = gathered_msg[msg_key].lower()
-                        elif conversion == "uppercase":
-                            gathered_msg[msg_key] = gathered_msg[msg_key].upper()
-                        elif conversion == "capitalize":
-                            gathered_msg[msg_key] = gathered_msg[msg_key].capitalize()
-                        elif conversion == "numeric":
-                            value = gathered_msg[msg_key]
-                            if isint(value):
-                                gathered_msg[msg_key] = int(float(value))
-                            elif isfloat(value):
-                                gathered_msg[msg_key] = float(value)
-                        elif conversion == "datetime":
-                            if isinstance(gathered_msg[msg_key], int):
-                                # the datetime was converted by Pandas to Unix epoch in milliseconds
-                                date_object = datetime.fromtimestamp(
-                                    int(gathered_msg[msg_key] / 1000), timezone.utc
-                                )
-                            else:
-                                date_object = datetime.strptime(
-                                    gathered_msg[msg_key],
-                                    value_key.get("format_from", "%Y-%m-%dT%H:%M:%SZ"),
-                                )
-                            gathered_msg[msg_key] = str(
-                                datetime.strftime(
-                                    date_object,
-                                    value_key.get("format_to", "%Y-%m-%dT%H:%M:%SZ"),
-                                )
-                            )
-                        elif conversion == "hash":
-                            gathered_msg[msg_key] = sha256(
-                                gathered_msg[msg_key].encode("utf-8")
-                            ).hexdigest()
-
-                    if "prefix_value" in value_key:
-                        gathered_msg[
-                            msg_key
-                        ] = f"{value_key['prefix_value']}{gathered_msg[msg_key]}"
-
-            elif type(value_key) is not dict:
-                gathered_msg[msg_key] = msg.get(value_key, None)
-        return gathered_msg
+from hashing import sha256_hexdigests
+
+
+# The specification gather_publish_msg compiled last with its gather function, callers pass the same
+# COLUMNS_PUBLISH of the config for every row
+_compiled = (None, None)
+
+
+def gather_publish_msg(msg, columns_publish=None):
+    """Gather the message to publish from a row, columns_publish is only compiled when it differs from the last call."""
+    global _compiled
+    compiled_columns_publish, gather = _compiled
+    if gather is None or compiled_columns_publish is not columns_publish:
+        gather = compile_columns_publish(columns_publish)
+        _compiled = (columns_publish, gather)
+    return gather(msg)
+
+
+def compile_columns_publish(columns_publish=None):
+    """Compile COLUMNS_PUBLISH once into a function that gathers a message from a row.
+
+    Every field of the specification is turned into a closure with its source attribute
+    resolver and conversion chain already bound, so the specification is not interpreted
+    again for every row.
+    """
+    if not columns_publish:
+        return _return_msg
+
+    fields = [
+        (msg_key, _compile_field(value_key))
+        for msg_key, value_key in columns_publish.items()
+    ]
+
+    def gather(msg):
+        return {msg_key: get_value(msg) for msg_key, get_value in fields}
+
+    return gather
+
+
+def gather_publish_df(df, columns_publish=None, encoded=False):
+    """Gather the messages to publish from all rows of a DataFrame at once.
+
+    COLUMNS_PUBLISH is executed column by column instead of record by record. The
+    result is the same as applying gather_publish_msg to every record of
+    json.loads(df.to_json(orient='records')). Without COLUMNS_PUBLISH and with
+    encoded set, the records are returned as compact JSON bytes instead, as they
+    are written by to_json.
+    """
+    if not columns_publish:
+        if encoded:
+            records = df.to_json(orient="records", lines=True).split("\n")
+            return [record.encode("utf-8") for record in records if record]
+        return json.loads(df.to_json(orient="records"))
+    if df.empty:
+        return []
+
+    df_columns = {str(column): column for column in df.columns}
+    json_columns = {}
+
+    def get_column(name):
+        if name not in df_columns:
+            return None
+        if name not in json_columns:
+            # Encode through to_json so values match the record based path exactly
+            json_columns[name] = json.loads(
+                df[df_columns[name]].to_json(orient="values")
+            )
+        return json_columns[name]
+
+    msg_keys = list(columns_publish.keys())
+    msg_columns = [
+        _gather_column(value_key, get_column, len(df))
+        for value_key in columns_publish.values()
+    ]
+    return [dict(zip(msg_keys, values)) for values in zip(*msg_columns)]
+
+
+def _gather_column(value_key, get_column, length):
+    if type(value_key) is not dict:
+        values = get_column(value_key)
+        return values if values is not None else [None] * length
+
+    if value_key.get("conversion") == "geojson_point":
+        longitude = get_column(value_key["longitude_attribute"])
+        latitude = get_column(value_key["latitude_attribute"])
+        if longitude is not None and latitude is not None:
+            return [
+                {"type": "Point", "coordinates": [float(lon), float(lat)]}
+                for lon, lat in zip(longitude, latitude)
+            ]
+
+    values = None
+    if "source_attribute" in value_key:
+        source_attribute = value_key["source_attribute"]
+        if type(source_attribute) is not list:
+            source_attribute = [source_attribute]
+        for att in source_attribute:
+            values = get_column(att)
+            if values is not None:
+                break
+    if values is None:
+        return [None] * length
+
+    convert = _compile_conversion_chain(value_key)
+    if convert is None:
+        return values
+    return _convert_column(values, convert)
+
+
+def _convert_column(values, convert):
+    if pd.api.types.infer_dtype(values, skipna=True) != "string":
+        return [convert(value) if value is not None else None for value in values]
+
+    # Convert every distinct string once and spread the results over the column
+    codes, uniques = pd.factorize(np.array(values, dtype=object))
+    converted = np.empty(len(uniques) + 1, dtype=object)
+    converted[:-1] = _convert_values(uniques, convert)
+    converted[-1] = None
+    return converted[codes].tolist()
+
+
+def _convert_values(values, convert):
+    # Apply the chain one conversion at a time, so hashing is done for all values at once
+    for conversion in getattr(convert, "conversion_chain", [convert]):
+        if conversion is convert_hash:
+            values = sha256_hexdigests(values)
+        else:
+            values = [conversion(value) for value in values]
+    return values
+
+
+def _return_msg(msg):
     return msg
 
 
+def _compile_field(value_key):
+    if type(value_key) is not dict:
+        return methodcaller("get", value_key, None)
+
+    resolve = _compile_source_attribute(value_key)
+    convert = _compile_conversion_chain(value_key)
+
+    if convert is not None:
+
+        def get_value(msg):
+            value = resolve(msg)
+            if value is not None:
+                return convert(value)
+            return value
+
+    else:
+        get_value = resolve
+
+    if value_key.get("conversion") == "geojson_point":
+        return _compile_geojson_point(value_key, get_value)
+    return get_value
+
+
+def _compile_conversion_chain(value_key):
+    conversions = value_key.get("conversion", [])
+    if not isinstance(conversions, list):
+        conversions = [conversions]
+    conversion_chain = [
+        convert
+        for convert in (_compile_conversion(value_key, c) for c in conversions)
+        if convert is not None
+    ]
+
+    if "prefix_value" in value_key:
+        prefix_value = value_key["prefix_value"]
+        conversion_chain.append(lambda value: f"{prefix_value}{value}")
+
+    if not conversion_chain:
+        return None
+    elif len(conversion_chain) == 1:
+        return conversion_chain[0]
+
+    def convert(value):
+        for conversion in conversion_chain:
+            value = conversion(value)
+        return value
+
+    convert.conversion_chain = conversion_chain
+    return convert
+
+
+def _compile_source_attribute(value_key):
+    if "source_attribute" not in value_key:
+        return _return_none
+
+    source_attribute = value_key["source_attribute"]
+    if type(source_attribute) is not list:
+        return methodcaller("get", source_attribute, None)
+
+    def resolve(msg):
+        for att in source_attribute:
+            if att in msg:
+                return msg.get(att)
+        return None
+
+    return resolve
+
+
+def _return_none(msg):
+    return None
+
+
+def _compile_geojson_point(value_key, get_value):
+    longitude_attribute = value_key["longitude_attribute"]
+    latitude_attribute = value_key["latitude_attribute"]
+
+    def get_point(msg):
+        if longitude_attribute in msg and latitude_attribute in msg:
+            return {
+                "type": "Point",
+                "coordinates": [
+                    float(msg[longitude_attribute]),
+                    float(msg[latitude_attribute]),
+                ],
+            }
+        return get_value(msg)
+
+    return get_point
+
+
+def _compile_conversion(value_key, conversion):  # noqa: C901
+    if conversion == "strip":
+        return methodcaller("strip")
+    elif conversion == "lowercase":
+        return methodcaller("lower")
+    elif conversion == "uppercase":
+        return methodcaller("upper")
+    elif conversion == "capitalize":
+        return methodcaller("capitalize")
+    elif conversion == "numeric":
+        return convert_numeric
+    elif conversion == "datetime":
+        format_from = value_key.get("format_from", "%Y-%m-%dT%H:%M:%SZ")
+        format_to = value_key.get("format_to", "%Y-%m-%dT%H:%M:%SZ")
+
+        def convert_datetime(value):
+            if isinstance(value, int):
+                # the datetime was converted by Pandas to Unix epoch in milliseconds
+                date_object = datetime.fromtimestamp(int(value / 1000), timezone.utc)
+            else:
+                date_object = datetime.strptime(value, format_from)
+            return str(datetime.strftime(date_object, format_to))
+
+        return convert_datetime
+    elif conversion == "hash":
+        return convert_hash
+    return None
+
+
+def convert_numeric(value):
+    if isint(value):
+        return int(float(value))
+    elif isfloat(value):
+        return float(value)
+    return value
+
+
+def convert_hash(value):
+    return sha256(value.encode("utf-8")).hexdigest()
+
+
 def isfloat(x):
     try:
         float(x)
@@ -0,0 +1,77 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from hashlib import sha256
+
+import config
+
+# Fewer values are hashed in the calling process, starting and feeding worker processes costs more than it saves
+PARALLEL_MIN_VALUES = 50000
+# Number of values sent to a worker process at a time
+CHUNK_SIZE = 10000
+
+_lock = threading.Lock()
+_executor = None
+_executor_workers = None
+
+
+def sha256_hexdigests(values, workers=None):
+    """Return the SHA-256 hex digests of the UTF-8 encoded strings in values, in the order of values.
+
+    The number of worker processes is workers, or HASH_WORKERS in config when workers is not given, or the
+    number of CPUs. With 2 or more, large inputs are split in chunks of CHUNK_SIZE values and hashed by a pool
+    of that many worker processes. Threads would not help, hashlib only releases the GIL for data of 2 KiB or more.
+    """
+    values = list(values)
+    if workers is None:
+        workers = getattr(config, 'HASH_WORKERS', os.cpu_count() or 1)
+    if workers < 2 or len(values) < PARALLEL_MIN_VALUES:
+        return hexdigests(values)
+
+    chunks = [values[start:start + CHUNK_SIZE] for start in range(0, len(values), CHUNK_SIZE)]
+    executor = get_executor(workers)
+    try:
+        return [digest for digests in executor.map(hexdigests, chunks) for digest in digests]
+    except BrokenProcessPool:
+        logging.warning('Hashing process pool broke, hashing {} values serially'.format(len(values)))
+        discard_executor(executor)
+        return hexdigests(values)
+
+
+def get_executor(workers):
+    """Return the pool of worker processes of this instance, created on first use and reused by later calls.
+
+    Starting the workers takes longer than hashing a column, so they are kept while the instance lives.
+    """
+    global _executor, _executor_workers
+    with _lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=pool_context())
+            _executor_workers = workers
+        return _executor
+
+
+def discard_executor(executor):
+    """Shut down a broken pool, the next call of get_executor starts a new one."""
+    global _executor
+    with _lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown()
+
+
+def hexdigests(values):
+    return [sha256(value.encode('utf-8')).hexdigest() for value in values]
+
+
+def pool_context():
+    # Forking copies the threads and sockets of the Google Cloud clients (gRPC) into the worker processes,
+    # forkserver and spawn start the workers from a fresh interpreter instead
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
@@ -0,0 +1,85 @@
+import json
+
+READ_SIZE = 1 << 16
+# Characters that can continue a number, a number followed by only these may be cut off by the end of a read
+NUMBER_CHARACTERS = frozenset('0123456789+-.eE')
+
+
+def iter_json_list(stream, attribute=None):
+    """Yield the items of a JSON list read incrementally from a text stream.
+
+    The list is either the top-level JSON value or, when attribute is given, the value of
+    that attribute of the top-level object. Only the item being parsed is kept in memory.
+    """
+    reader = _JSONReader(stream)
+    if attribute is not None:
+        reader.expect('{')
+        while reader.peek() != '}':
+            key = reader.decode()
+            reader.expect(':')
+            if key == attribute:
+                break
+            reader.decode()
+            if reader.peek() == ',':
+                reader.expect(',')
+        else:
+            raise KeyError(attribute)
+
+    reader.expect('[')
+    if reader.peek() == ']':
+        return
+    while True:
+        yield reader.decode()
+        if reader.peek() == ']':
+            return
+        reader.expect(',')
+
+
+class _JSONReader:
+    def __init__(self, stream):
+        self.stream = stream
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read(self):
+        data = self.stream.read(READ_SIZE)
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        self.eof = not data
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof:
+                raise ValueError('Unexpected end of JSON data')
+            self._read()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expected "{}" at JSON data "{}"'.format(char, self.buffer[self.pos:self.pos + 20]))
+        self.pos += 1
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            else:
+                # A number at the end of the buffer may continue in the next read
+                if self.eof or not self._is_cut_off(value, end):
+                    self.pos = end
+                    return value
+            self._read()
+
+    def _is_cut_off(self, value, end):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        return all(char in NUMBER_CHARACTERS for char in self.buffer[end:])
@@ -0,0 +1,614 @@
+import os
+import io
+import json
+import config
+import logging
+import itertools
+import threading
+import numpy as np
+import pandas as pd
+
+from gobits import Gobits
+from google.api_core.exceptions import NotFound
+from google.cloud import storage
+
+from batchmsg import MessageBatcher
+from blobio import blob_source, download_blob, open_blob
+from chunkdtypes import holds_one_kind, scan_dtypes, whole_file_dtypes, with_dtypes
+from gathermsg import gather_publish_df
+from gcsclient import get_bucket, log_api_calls, reset_api_calls
+from jsonstream import iter_json_list
+from payloadcoding import CONTENT_ENCODING_ATTRIBUTE, compress_payload
+from publishfutures import PublishFutures
+from snapshot import dump_snapshot, load_snapshot
+from fingerprint import diff_rows, diff_fingerprints, diff_dumped_fingerprints, dump_fingerprints, \
+    dump_fingerprint_chunks, first_occurrences, is_fingerprintable_frame, load_fingerprints, match_columns, \
+    row_fingerprints
+
+
+FINGERPRINTS_SUFFIX = '.fingerprints'
+LATEST_POINTER_SUFFIX = '.latest'
+SNAPSHOT_SUFFIX = '.parquet'
+# Default limits of messages that are published but not yet sent, publishing blocks when they are exceeded
+TOPIC_FLOW_CONTROL = {'message_limit': 1000, 'byte_limit': 10 * 1024 * 1024}
+
+_lock = threading.Lock()
+_publisher = None
+
+
+def get_publisher():
+    """Return the publisher of this instance, created on first use and reused by later invocations."""
+    global _publisher
+    with _lock:
+        if _publisher is None:
+            # The Pub/Sub client library takes a quarter of a second to import, runs without new rows do not need it
+            from google.cloud import pubsub_v1
+
+            batch_settings = pubsub_v1.types.BatchSettings(**config.TOPIC_BATCH_SETTINGS)
+            flow_control = pubsub_v1.types.PublishFlowControl(
+                **{'limit_exceeded_behavior': pubsub_v1.types.LimitExceededBehavior.BLOCK,
+                   **getattr(config, 'TOPIC_FLOW_CONTROL', TOPIC_FLOW_CONTROL)})
+            _publisher = pubsub_v1.PublisherClient(
+                batch_settings, publisher_options=pubsub_v1.types.PublisherOptions(flow_control=flow_control))
+        return _publisher
+
+
+def publish_payload(payload, topic_project_id, topic_name, subject=None):
+    publisher = get_publisher()
+    topic_path = publisher.topic_path(topic_project_id, topic_name)
+    content_encoding = getattr(config, 'PUBLISH_CONTENT_ENCODING', None)
+    if content_encoding:
+        payload = compress_payload(payload, content_encoding, getattr(config, 'PUBLISH_COMPRESSION_LEVEL', None))
+        return publisher.publish(topic_path, payload, **{CONTENT_ENCODING_ATTRIBUTE: content_encoding})
+    return publisher.publish(topic_path, payload)
+
+
+def calculate_diff(df_old, df_new):
+    if len(df_old.columns) != len(df_new.columns) or df_old.empty:
+        if df_old.empty:
+            logging.info('Previous state is empty. Rebuilding.')
+        else:
+            logging.info('Different columns found')
+        if hasattr(config, 'COLUMNS_NONPII') and len(set(df_new.columns) - set(config.COLUMNS_NONPII)) > 0:
+            logging.warning('Not correct columns found in new file')
+            raise ValueError('Not correct columns found in new file')
+        return df_new
+
+    columns_drop = getattr(config, 'COLUMNS_DROP', [])
+    diff = diff_rows(
+        df_old.drop(columns_drop, axis=1),
+        df_new.drop(columns_drop, axis=1))
+    return diff
+
+
+def calculate_diff_from_fingerprints(bucket_name, blob_name, df_new):
+    content = fingerprints_from_store(bucket_name, blob_name)
+    if content is None:
+        return None
+
+    columns_drop = getattr(config, 'COLUMNS_DROP', [])
+    diff = diff_dumped_fingerprints(content, df_new.drop(columns_drop, axis=1))
+    if diff is None:
+        logging.info('Fingerprints of {} do not match new data'.format(blob_name))
+    return diff
+
+
+def calculate_diff_chunked(bucket_name, blob_name, blob_prev, should_drop_duplicates, fingerprint_chunks):
+    """Return an iterator over the new rows of every chunk of blob_name compared to the blob blob_prev on ARCHIVE.
+
+    Only the fingerprints of the previous data and of the rows read so far are kept in memory.
+    When blob_prev is None all rows are new. The fingerprints of every chunk are appended to
+    fingerprint_chunks, so they can be stored for the next run.
+
+    Returns None when the rows of blob_name or blob_prev can not be compared by fingerprint. This is
+    known before the first chunk is returned, so the file can still be compared as a whole.
+    """
+    columns, dtypes, fingerprintable = chunked_dtypes(bucket_name, blob_name)
+    if not fingerprintable:
+        logging.info('{} holds values that can not be compared by fingerprint'.format(blob_name))
+        return None
+
+    columns_drop = getattr(config, 'COLUMNS_DROP', [])
+    chunks = iter_df_from_store(bucket_name, blob_name, columns, dtypes)
+    df_first = next(chunks, None)
+    if df_first is None:
+        return iter([])
+
+    prev_fingerprints = None
+    if blob_prev:
+        prev_fingerprints = prev_fingerprints_from_store(blob_prev, df_first.drop(columns_drop, axis=1))
+        if prev_fingerprints is None:
+            return None
+
+    def diff_chunks():
+        seen_fingerprints = set()
+        for df_chunk in itertools.chain([df_first], chunks):
+            df_keep = df_chunk.drop(columns_drop, axis=1)
+            fingerprint_chunks.append(
+                (row_fingerprints(df_keep, list(df_keep.columns)), list(df_keep.columns), list(df_keep.dtypes)))
+
+            if should_drop_duplicates:
+                df_chunk = df_chunk[first_occurrences(
+                    row_fingerprints(df_chunk, list(df_chunk.columns)), seen_fingerprints)]
+
+            if prev_fingerprints is None:
+                yield df_chunk
+            else:
+                old_fingerprints, columns = prev_fingerprints
+                yield diff_fingerprints(old_fingerprints, df_chunk.drop(columns_drop, axis=1), columns)
+
+    return diff_chunks()
+
+
+def prev_fingerprints_from_store(blob_prev, df_new):
+    """Return the sorted fingerprints of the blob blob_prev on ARCHIVE and the columns of df_new to compare them with.
+
+    Returns None when the previous data can not be compared to df_new by fingerprint, because it can not be read in
+    chunks, is empty, has other columns or holds values of more than one kind in a column.
+    """
+    blob_name = blob_prev.name
+    if getattr(config, 'ARCHIVE_FINGERPRINTS', False):
+        content = fingerprints_from_store(config.ARCHIVE, blob_name)
+        if content is not None:
+            old_fingerprints, dtypes = load_fingerprints(content)
+            columns = match_columns(df_new, dtypes)
+            if len(old_fingerprints) > 0 and columns is not None:
+                return old_fingerprints, columns
+            logging.info('Fingerprints of {} do not match new data'.format(blob_name))
+
+    if blob_name.endswith('.csv'):
+        prev_columns, dtypes, fingerprintable = chunked_dtypes(config.ARCHIVE, blob_name, blob_prev)
+        if not fingerprintable:
+            logging.info('{} holds values that can not be compared by fingerprint'.format(blob_name))
+            return None
+        prev_chunks = iter_df_from_store(config.ARCHIVE, blob_name, prev_columns, dtypes, blob_prev)
+    elif is_chunked_readable(blob_name):
+        # df_to_store archives json as an object of columns, which can only be read as a whole
+        prev_chunks = [df_from_store(config.ARCHIVE, blob_name, from_archive=True, blob=blob_prev)]
+    else:
+        logging.info('Previous data {} can not be read in chunks'.format(blob_name))
+        return None
+
+    columns_drop = getattr(config, 'COLUMNS_DROP', [])
+    columns = None
+    fingerprint_chunks = []
+    for df_prev in prev_chunks:
+        df_prev = df_prev.drop(columns_drop, axis=1)
+        if columns is None:
+            columns = match_columns(df_new, {str(column): str(df_prev[column].dtype) for column in df_prev.columns})
+            if columns is None:
+                logging.info('Different columns found')
+                return None
+        if not is_fingerprintable_frame(df_prev):
+            logging.info('{} holds values that can not be compared by fingerprint'.format(blob_name))
+            return None
+        fingerprint_chunks.append(row_fingerprints(df_prev, list(df_prev.columns)))
+
+    if not fingerprint_chunks or sum(len(chunk) for chunk in fingerprint_chunks) == 0:
+        logging.info('Previous state is empty')
+        return None
+    return np.sort(np.concatenate(fingerprint_chunks)), columns
+
+
+def df_from_store(bucket_name, blob_name, from_archive=False, blob=None):
+    """Return the rows of blob_name on bucket_name, blob is blob_name with its properties when they are known."""
+    if from_archive and is_archive_snapshot_enabled():
+        df = snapshot_from_store(bucket_name, blob_name)
+        if df is not None:
+            return df
+
+    path = 'gs://{}/{}'.format(bucket_name, blob_name)
+    logging.info('Reading {}'.format(path))
+    if blob is None:
+        blob = get_bucket(bucket_name).get_blob(blob_name)
+    if blob_name.endswith('.xlsx'):
+        # openpyxl is only imported for xlsx files
+        from xlsxstream import read_excel
+
+        stream = io.BytesIO(download_blob(blob))
+        if from_archive:
+            df = read_excel(stream, dtype=str)
+        else:
+            converter = {i: str for i in range(len(config.COLUMNS_NONPII))}
+            df = read_excel(stream, converters=converter)
+    if blob_name.endswith('.csv'):
+        df = pd.read_csv(blob_source(bucket_name, blob_name, blob=blob), **config.CSV_DIALECT_PARAMETERS)
+    if blob_name.endswith('.json'):
+        if hasattr(config, 'ATTRIBUTE_WITH_THE_LIST'):
+            json_data = json.loads(download_blob(blob))
+            df = pd.DataFrame(json_data[config.ATTRIBUTE_WITH_THE_LIST])
+        else:
+            df = pd.read_json(blob_source(bucket_name, blob_name, blob=blob), dtype=False)
+    logging.info('Read file {} from {}'.format(blob_name, bucket_name))
+    return df
+
+
+def chunked_dtypes(bucket_name, blob_name, blob=None):
+    """Return the columns of blob_name, the dtypes to read its chunks with and whether they compare by fingerprint.
+
+    The file is read in chunks to find the dtypes its columns get when it is read as a whole, so the chunks hold the
+    values df_from_store returns and get published the same.
+    """
+    columns = scan_dtypes(read_chunks(bucket_name, blob_name, blob=blob))
+    dtypes = whole_file_dtypes(columns, parsed_from_text=blob_name.endswith('.csv'))
+    return list(columns), dtypes, holds_one_kind(columns, dtypes)
+
+
+def iter_df_from_store(bucket_name, blob_name, columns, dtypes, blob=None):
+    """Yield the rows of a csv file or a json file with ATTRIBUTE_WITH_THE_LIST in chunks of CHUNKED_READ_SIZE rows.
+
+    The chunks get the columns and dtypes that chunked_dtypes returned for the file.
+    """
+    path = 'gs://{}/{}'.format(bucket_name, blob_name)
+    logging.info('Reading {} in chunks of {} rows'.format(path, config.CHUNKED_READ_SIZE))
+    for df_chunk in read_chunks(bucket_name, blob_name, columns, dtypes, blob):
+        yield with_dtypes(df_chunk, dtypes)
+    logging.info('Read file {} from {}'.format(blob_name, bucket_name))
+
+
+def read_chunks(bucket_name, blob_name, columns=None, dtypes=None, blob=None):
+    chunk_size = config.CHUNKED_READ_SIZE
+    if blob_name.endswith('.csv'):
+        csv_parameters = dict(config.CSV_DIALECT_PARAMETERS)
+        text_columns = {column: str for column, dtype in (dtypes or {}).items() if dtype is str}
+        if text_columns:
+            csv_parameters['dtype'] = {**text_columns, **csv_parameters.get('dtype', {})}
+        source = blob_source(bucket_name, blob_name, stream=True, blob=blob)
+        with pd.read_csv(source, chunksize=chunk_size, **csv_parameters) as reader:
+            for df_chunk in reader:
+                yield df_chunk
+    else:
+        if blob is None:
+            blob = get_bucket(bucket_name).get_blob(blob_name)
+        with io.TextIOWrapper(open_blob(blob), encoding='utf-8') as stream:
+            items = iter_json_list(stream, config.ATTRIBUTE_WITH_THE_LIST)
+            for new_chunk in iter(lambda: list(itertools.islice(items, chunk_size)), []):
+                # Every chunk gets all columns of the file, like the DataFrame of the whole list
+                yield pd.DataFrame(new_chunk, columns=columns)
+
+
+def is_chunked_readable(blob_name):
+    if not hasattr(config, 'CHUNKED_READ_SIZE'):
+        return False
+    return blob_name.endswith('.csv') or blob_name.endswith('.json') and hasattr(config, 'ATTRIBUTE_WITH_THE_LIST')
+
+
+def df_to_store(bucket_name, blob_name, df):
+    # Different types of files: xlsx or json
+    if blob_name.endswith('.xlsx'):
+        new_blob = blob_name
+        strIO = io.BytesIO()
+        excel_writer = pd.ExcelWriter(strIO, engine="xlsxwriter")
+        df.to_excel(excel_writer, sheet_name="data", index=False)
+        excel_writer.save()
+        file = strIO.getvalue()
+        content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    elif blob_name.endswith('.csv'):
+        new_blob = blob_name
+        file = df.to_csv(**config.CSV_DIALECT_PARAMETERS)
+        content_type = 'text/csv'
+    else:
+        new_blob = os.path.splitext(blob_name)[0] + '.json'
+        blob_str = df.to_json()
+        blob_json = json.loads(blob_str)
+        if hasattr(config, 'ATTRIBUTE_WITH_THE_LIST'):
+            blob_data = {config.ATTRIBUTE_WITH_THE_LIST: blob_json}
+        else:
+            blob_data = blob_json
+        file = json.dumps(blob_data).encode('utf-8')
+        content_type = 'application/json'
+
+    # Create blob
+    bucket = get_bucket(bucket_name)
+    blob = storage.Blob(new_blob, bucket)
+
+    # Compress text files, xlsx files are zip archives already
+    content_encoding = getattr(config, 'ARCHIVE_CONTENT_ENCODING', None)
+    if content_encoding and not blob_name.endswith('.xlsx'):
+        if isinstance(file, str):
+            file = file.encode('utf-8')
+        file = compress_payload(file, content_encoding, getattr(config, 'ARCHIVE_COMPRESSION_LEVEL', None))
+        blob.content_encoding = content_encoding
+
+    # Upload blob
+    blob.upload_from_string(
+        file,
+        content_type=content_type
+    )
+    logging.info('Write file {} to {}'.format(new_blob, bucket_name))
+    return new_blob
+
+
+def fingerprints_to_store(bucket_name, blob_name, file):
+    bucket = get_bucket(bucket_name)
+    blob = storage.Blob(blob_name + FINGERPRINTS_SUFFIX, bucket)
+    blob.upload_from_string(
+        file,
+        content_type='application/octet-stream'
+    )
+    logging.info('Write fingerprints of {} to {}'.format(blob_name, bucket_name))
+
+
+def fingerprints_from_store(bucket_name, blob_name):
+    bucket = get_bucket(bucket_name)
+    blob = bucket.get_blob(blob_name + FINGERPRINTS_SUFFIX)
+    if blob is None:
+        logging.info('No fingerprints found for {}'.format(blob_name))
+        return None
+    return blob.download_as_string()
+
+
+def is_archive_snapshot_enabled():
+    return getattr(config, 'ARCHIVE_SNAPSHOT', False) and config.INBOX != config.ARCHIVE
+
+
+def snapshot_to_store(bucket_name, blob_name, df):
+    bucket = get_bucket(bucket_name)
+    blob = storage.Blob(blob_name + SNAPSHOT_SUFFIX, bucket)
+    try:
+        file = dump_snapshot(df, blob_name)
+    except (TypeError, ValueError) as e:
+        # Parquet needs string column names and columns of a single type
+        logging.warning('Can not write snapshot of {}: {}'.format(blob_name, e))
+        if blob.exists():
+            blob.delete()
+        return
+    blob.upload_from_string(
+        file,
+        content_type='application/vnd.apache.parquet'
+    )
+    logging.info('Write snapshot of {} to {}'.format(blob_name, bucket_name))
+
+
+def snapshot_from_store(bucket_name, blob_name):
+    bucket = get_bucket(bucket_name)
+    try:
+        content = bucket.blob(blob_name + SNAPSHOT_SUFFIX).download_as_bytes()
+    except NotFound:
+        logging.info('No snapshot found for {}'.format(blob_name))
+        return None
+    df = load_snapshot(content)
+    logging.info('Read snapshot of {} from {}'.format(blob_name, bucket_name))
+    return df
+
+
+def copy_in_store(bucket_name, blob_name, new_bucket_name):
+    bucket = get_bucket(bucket_name)
+    new_bucket = get_bucket(new_bucket_name)
+    bucket.copy_blob(bucket.blob(blob_name), new_bucket, blob_name)
+    logging.info('Copied file {} from {} to {}'.format(blob_name, bucket_name, new_bucket_name))
+
+
+def remove_from_store(bucket_name, blob_name):
+    bucket = get_bucket(bucket_name)
+    blob = bucket.blob(blob_name)
+    blob.delete()
+    logging.info('Deleted file {} from {}'.format(blob_name, bucket_name))
+
+
+def latest_pointer_to_store(bucket_name, prefix_filter, blob_name):
+    bucket = get_bucket(bucket_name)
+    blob = storage.Blob((prefix_filter or '') + LATEST_POINTER_SUFFIX, bucket)
+    blob.upload_from_string(
+        blob_name,
+        content_type='text/plain'
+    )
+    logging.info('Write latest pointer to {} to {}'.format(blob_name, bucket_name))
+
+
+def latest_pointer_from_store(bucket_name, prefix_filter):
+    """Return the blob the latest pointer of prefix_filter refers to, or None when either of them does not exist."""
+    bucket = get_bucket(bucket_name)
+    try:
+        blob_name = bucket.blob((prefix_filter or '') + LATEST_POINTER_SUFFIX).download_as_string().decode('utf-8')
+    except NotFound:
+        logging.info('No latest pointer found for {}'.format(prefix_filter))
+        return None
+    blob = bucket.get_blob(blob_name)
+    if blob is None:
+        logging.warning('Latest pointer refers to {}, which does not exist'.format(blob_name))
+    return blob
+
+
+def get_prev_blob(bucket_name, prefix_filter):
+    """Return the previous file on bucket_name as a blob with its properties, or None when there is none."""
+    if getattr(config, 'ARCHIVE_LATEST_POINTER', False) and config.INBOX != config.ARCHIVE:
+        blob = latest_pointer_from_store(bucket_name, prefix_filter)
+        if blob is not None:
+            return blob
+        logging.info('Listing {} to find the previous file'.format(bucket_name))
+
+    bucket = get_bucket(bucket_name)
+    blobs = [blob for blob in bucket.list_blobs(prefix=prefix_filter)
+             if not blob.name.endswith((FINGERPRINTS_SUFFIX, LATEST_POINTER_SUFFIX, SNAPSHOT_SUFFIX))]
+    if blobs:
+
+        def compare_lobs(lob):
+            return lob.updated
+
+        blobs.sort(key=compare_lobs, reverse=True)
+
+        if config.ARCHIVE == config.INBOX:
+            if len(blobs) > 1:
+                return blobs[1]
+            else:
+                return None
+        else:
+            return blobs[0]
+    else:
+        return None
+
+
+def publish_rows(gobits, rows_json, batch_message_size):
+    publish_row_chunks(gobits, [rows_json], batch_message_size)
+
+
+def publish_row_chunks(gobits, rows_chunks, batch_message_size):
+    """Publish the rows of every list in rows_chunks and return how many there were.
+
+    One batcher is used for all lists, so a message can hold rows of consecutive lists. Only the last message can
+    hold fewer rows than batch_message_size.
+    """
+    rowcount = 0
+    publish_futures = PublishFutures()
+    batcher = MessageBatcher(gobits, config.TOPIC_SETTINGS.get('subject'),
+                             max_bytes=getattr(config, 'BATCH_MESSAGE_BYTES', None), max_rows=batch_message_size,
+                             compact=getattr(config, 'PUBLISH_COMPACT_JSON', False))
+
+    for rows_json in rows_chunks:
+        rowmax = rowcount + len(rows_json)
+        for msg_to_publish in rows_json:
+            payload = batcher.add(msg_to_publish)
+            if payload is not None:
+                publish_futures.add(publish_payload(payload, **config.TOPIC_SETTINGS), rowcount, rowmax)
+
+            rowcount += 1
+
+    payload = batcher.flush()
+    if payload is not None:
+        publish_futures.add(publish_payload(payload, **config.TOPIC_SETTINGS), rowcount, rowcount)
+    publish_futures.flush()
+    return rowcount
+
+
+def gather_publish_chunks(df_diffs, columns_publish):
+    for df_diff in df_diffs:
+        if len(df_diff) > 0:
+            logging.info('Found {} new rows.'.format(len(df_diff)))
+            yield gather_publish_df(df_diff, columns_publish, encoded=getattr(config, 'PUBLISH_COMPACT_JSON', False))
+
+
+def publish_diff_chunked(bucket, filename, prefix_filter, context):
+    """Publish the new rows of filename chunk by chunk, returns False when they have to be compared as a whole."""
+    columns_publish = config.COLUMNS_PUBLISH if hasattr(config, 'COLUMNS_PUBLISH') else None
+    batch_message_size = config.BATCH_MESSAGE_SIZE if hasattr(config, 'BATCH_MESSAGE_SIZE') else None
+    full_load = config.FULL_LOAD if hasattr(config, 'FULL_LOAD') else False
+    should_drop_duplicates = config.SHOULD_DROP_DUPLICATES \
+        if hasattr(config, 'SHOULD_DROP_DUPLICATES') else True
+    archive_fingerprints = config.ARCHIVE_FINGERPRINTS \
+        if hasattr(config, 'ARCHIVE_FINGERPRINTS') else False
+
+    blob_prev = get_prev_blob(config.ARCHIVE, prefix_filter) if not full_load else None
+    fingerprint_chunks = []
+    df_diffs = calculate_diff_chunked(bucket, filename, blob_prev, should_drop_duplicates, fingerprint_chunks)
+    if df_diffs is None:
+        logging.info('Comparing {} as a whole'.format(filename))
+        return False
+
+    gobits = Gobits.from_context(context=context)
+    rowcount = publish_row_chunks(gobits, gather_publish_chunks(df_diffs, columns_publish), batch_message_size)
+
+    if rowcount == 0:
+        logging.info('No new rows found')
+
+    if config.INBOX != config.ARCHIVE:
+        # Copy file to archive, it has not been read as a whole
+        copy_in_store(config.INBOX, filename, config.ARCHIVE)
+        if archive_fingerprints and fingerprint_chunks:
+            fingerprints_to_store(config.ARCHIVE, filename, dump_fingerprint_chunks(fingerprint_chunks))
+        if getattr(config, 'ARCHIVE_LATEST_POINTER', False):
+            latest_pointer_to_store(config.ARCHIVE, prefix_filter, filename)
+        # Remove file from inbox
+        remove_from_store(config.INBOX, filename)
+    return True
+
+
+def publish_diff(data, context):
+    logging.info('Run started')
+    reset_api_calls()
+
+    bucket = data['bucket']
+    filename = data['name']
+
+    prefix_filter = config.FILEPATH_PREFIX_FILTER if hasattr(config, 'FILEPATH_PREFIX_FILTER') else None
+    columns_publish = config.COLUMNS_PUBLISH if hasattr(config, 'COLUMNS_PUBLISH') else None
+    batch_message_size = config.BATCH_MESSAGE_SIZE if hasattr(config, 'BATCH_MESSAGE_SIZE') else None
+
+    df_orig = None
+    chunked = is_chunked_readable(filename)
+
+    try:
+        if chunked and publish_diff_chunked(bucket, filename, prefix_filter, context):
+            logging.info('Run succeeded')
+            return
+
+        # Read dataframe from store
+        df_orig = df_from_store(bucket, filename)
+        full_load = config.FULL_LOAD if hasattr(config, 'FULL_LOAD') else False
+        should_drop_duplicates = config.SHOULD_DROP_DUPLICATES \
+            if hasattr(config, 'SHOULD_DROP_DUPLICATES') else True
+        archive_fingerprints = config.ARCHIVE_FINGERPRINTS \
+            if hasattr(config, 'ARCHIVE_FINGERPRINTS') else False
+
+        if should_drop_duplicates:
+            df_new = df_orig.copy().drop_duplicates()
+        else:
+            df_new = df_orig
+
+        # Read previous data from archive and compare
+        if not full_load:
+            # Get previous data from archive
+            blob_prev = get_prev_blob(config.ARCHIVE, prefix_filter)
+            if blob_prev:
+                df_diff = None
+                if archive_fingerprints:
+                    df_diff = calculate_diff_from_fingerprints(config.ARCHIVE, blob_prev.name, df_new)
+                if df_diff is None:
+                    df_prev = df_from_store(config.ARCHIVE, blob_prev.name, from_archive=True, blob=blob_prev)
+                    if should_drop_duplicates:
+                        df_prev.drop_duplicates()
+                    df_diff = calculate_diff(df_prev, df_new)
+            else:
+                full_load = True
+
+        if full_load:
+            df_diff = df_new
+
+        # Check the number of new records
+        # In case of no new records: don't send any updates
+        if len(df_diff) == 0:
+            logging.info('No new rows found')
+        else:
+            logging.info('Found {} new rows.'.format(len(df_diff)))
+
+            # Gather messages to publish column by column
+            rows_json = gather_publish_df(
+                df_diff, columns_publish, encoded=getattr(config, 'PUBLISH_COMPACT_JSON', False))
+
+            # Publish individual rows to topic
+            gobits = Gobits.from_context(context=context)
+            publish_rows(gobits, rows_json, batch_message_size)
+
+        if config.INBOX != config.ARCHIVE:
+            # Write file to archive
+            archived_blob = df_to_store(config.ARCHIVE, filename, df_orig)
+            if is_archive_snapshot_enabled():
+                snapshot_to_store(config.ARCHIVE, archived_blob, df_orig)
+            if archive_fingerprints:
+                columns_drop = getattr(config, 'COLUMNS_DROP', [])
+                df_keep = df_orig.drop(columns_drop, axis=1)
+                if is_fingerprintable_frame(df_keep):
+                    fingerprints_to_store(config.ARCHIVE, archived_blob, dump_fingerprints(df_keep))
+                else:
+                    # The next run reads the archived file, like a merge it tells numbers and their text apart
+                    logging.info('{} holds values that can not be compared by fingerprint'.format(archived_blob))
+            if getattr(config, 'ARCHIVE_LATEST_POINTER', False):
+                latest_pointer_to_store(config.ARCHIVE, prefix_filter, archived_blob)
+            # Remove file from inbox
+            remove_from_store(config.INBOX, filename)
+
+        logging.info('Run succeeded')
+
+    except Exception as e:
+        if hasattr(config, 'ERROR'):
+            if chunked:
+                copy_in_store(bucket, filename, config.ERROR)
+            else:
+                df_to_store(config.ERROR, filename, df_orig)
+        if config.INBOX != config.ARCHIVE:
+            remove_from_store(config.INBOX, filename)
+        logging.error('Processing failure {}'.format(e))
+        raise
+    finally:
+        log_api_calls()
+        logging.info('Run done')
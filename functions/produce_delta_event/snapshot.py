@@ -0,0 +1,55 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+# Strings read_excel reads as missing values by default, a copy of the private pandas._libs.parsers.STR_NA_VALUES
+# of the pandas version in requirements.txt (1.2.4). Check it when upgrading pandas, 2.0 adds 'None'.
+STR_NA_VALUES = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA',
+    'NULL', 'NaN', 'n/a', 'nan', 'null'])
+
+
+def dump_snapshot(df, blob_name):
+    """Serialize df as Parquet, with the values and dtypes it gets when blob_name is read from the archive.
+
+    An xlsx file is read from the archive with dtype=str, so its snapshot holds the strings read_excel returns.
+    """
+    if blob_name.endswith('.xlsx'):
+        df = excel_strings(df)
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def load_snapshot(content):
+    return pd.read_parquet(io.BytesIO(content))
+
+
+def excel_strings(df):
+    """Return df with every value as read_excel(dtype=str) reads it back after writing df to an xlsx file."""
+    return df.apply(excel_string_column)
+
+
+def excel_string_column(series):
+    # Columns of strings, bools and small integers are converted at once, other values one by one
+    if series.dtype == bool:
+        return series.map({True: 'True', False: 'False'}).astype(object)
+    if series.dtype.kind in 'iu' and series.abs().max() < 10 ** 15:
+        return series.astype(str).astype(object)
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == 'string':
+        return series.where(series.notna() & ~series.isin(STR_NA_VALUES), np.nan)
+    return series.map(excel_string, na_action='ignore').astype(object)
+
+
+def excel_string(value):
+    if isinstance(value, (bool, np.bool_)):
+        return str(bool(value))
+    if isinstance(value, (int, float, np.number)):
+        # Numbers are stored with 16 significant digits, whole numbers are read back as int
+        number = float('{:.16G}'.format(value))
+        return str(int(number)) if number.is_integer() else str(number)
+    if isinstance(value, str):
+        # Empty cells and strings like 'NA' are read as missing values
+        return np.nan if value in STR_NA_VALUES else value
+    return str(value)
@@ -0,0 +1,265 @@
+import re
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from openpyxl.reader.excel import ExcelReader
+from openpyxl.styles.stylesheet import apply_stylesheet
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.datetime import from_excel, from_ISO8601
+from openpyxl.xml.constants import SHARED_STRINGS, SHEET_MAIN_NS
+from pandas.io.parsers import TextParser
+from xml.parsers import expat
+
+READ_SIZE = 1 << 16
+# The workbook is read with internals of openpyxl (ExcelReader.read_manifest and read_workbook, parser.find_sheets
+# and the _date_formats and _timedelta_formats of the workbook), which are tested with openpyxl 3.0.7 and 3.1.5
+MIN_OPENPYXL_VERSION = '3.0.7'
+
+_STRING = SHEET_MAIN_NS + ' si'
+_ROW = SHEET_MAIN_NS + ' row'
+_CELL = SHEET_MAIN_NS + ' c'
+_VALUE = SHEET_MAIN_NS + ' v'
+_TEXT = SHEET_MAIN_NS + ' t'
+_PHONETIC = SHEET_MAIN_NS + ' rPh'
+
+
+def version_tuple(version):
+    return tuple(int(number) for number in re.findall(r'\d+', version)[:3])
+
+
+if version_tuple(openpyxl.__version__) < version_tuple(MIN_OPENPYXL_VERSION):
+    raise ImportError('xlsxstream needs openpyxl {} or later, found openpyxl {}, see requirements.txt'.format(
+        MIN_OPENPYXL_VERSION, openpyxl.__version__))
+
+
+def read_excel(stream, **parameters):
+    """Return the first sheet of an xlsx file as a DataFrame, like pd.read_excel(stream, **parameters).
+
+    The sheet is parsed directly instead of cell by cell through openpyxl, which is several times faster.
+    """
+    rows = list(iter_sheet_rows(stream))
+    # Like read_excel, leave out trailing empty rows and extend all rows to the width of the widest.
+    # Empty rows are kept, as in read_excel since pandas 1.3.
+    while rows and not rows[-1]:
+        rows.pop()
+    if not rows:
+        return pd.DataFrame()
+    width = max(len(row) for row in rows)
+    rows = [row + [''] * (width - len(row)) for row in rows]
+    return TextParser(rows, header=0, skip_blank_lines=False, **parameters).read()
+
+
+def iter_excel(stream, chunk_size, **parameters):
+    """Yield DataFrames of at most chunk_size rows of the first sheet of an xlsx file, read with parameters.
+
+    Only the rows of one chunk are kept in memory. Together the chunks hold the rows read_excel returns,
+    but as the width of the sheet is not known in advance, values right of the header raise a ValueError.
+    """
+    rows = iter_sheet_rows(stream)
+    header = next(rows, None)
+    if not header:
+        if any(rows):
+            raise ValueError('The first row of the sheet is empty, it can only be read as a whole')
+        return
+    width = len(header)
+    columns = TextParser([header], header=0, **parameters).read().columns
+    parameters = {'skip_blank_lines': False, **parameters}
+
+    chunk = []
+    empty_rows = 0
+    for row in rows:
+        if not row:
+            # Trailing empty rows are left out, so only add empty rows when more data follows
+            empty_rows += 1
+            continue
+        if len(row) > width:
+            raise ValueError('The sheet has values right of its header, it can only be read as a whole')
+        for chunk_row in [[''] * width] * empty_rows + [row + [''] * (width - len(row))]:
+            chunk.append(chunk_row)
+            if len(chunk) >= chunk_size:
+                yield TextParser(chunk, names=columns, header=None, **parameters).read()
+                chunk = []
+        empty_rows = 0
+    if chunk:
+        yield TextParser(chunk, names=columns, header=None, **parameters).read()
+
+
+def iter_sheet_rows(stream):
+    """Yield the rows of the first sheet of an xlsx file as lists of the values read_excel parses.
+
+    Empty cells are '', error cells NaN and whole numbers int, trailing empty cells are left out.
+    """
+    return _SheetReader(stream).iter_rows()
+
+
+class _SheetReader:
+    def __init__(self, stream):
+        # openpyxl reads the sheet names and date formats, the strings and cells are parsed here
+        excel_reader = ExcelReader(stream, read_only=True, data_only=True, keep_links=False)
+        excel_reader.read_manifest()
+        excel_reader.read_workbook()
+        apply_stylesheet(excel_reader.archive, excel_reader.wb)
+        self.archive = excel_reader.archive
+        # Cells refer to their style by the index as a string
+        self.date_styles = {str(style) for style in excel_reader.wb._date_formats}
+        # The read-only worksheets of openpyxl 3.1 read durations as timedeltas, earlier versions as datetimes
+        self.timedelta_styles = set()
+        if version_tuple(openpyxl.__version__) >= (3, 1):
+            self.timedelta_styles = {str(style) for style in excel_reader.wb._timedelta_formats}
+        self.epoch = excel_reader.wb.epoch
+        self.worksheet_path = next(
+            rel.target for _, rel in excel_reader.parser.find_sheets()
+            if rel.target in excel_reader.valid_files and 'chartsheet' not in rel.Type)
+        self.shared_strings = []
+        strings_part = excel_reader.package.find(SHARED_STRINGS)
+        if strings_part is not None:
+            self.parse(strings_part.PartName[1:], _StringsHandler(self.shared_strings))
+
+    def iter_rows(self):
+        rows = []
+        try:
+            for _ in self.iter_parse(self.worksheet_path, _SheetHandler(self, rows)):
+                yield from rows
+                rows.clear()
+        finally:
+            self.archive.close()
+
+    def parse(self, path, handler):
+        for _ in self.iter_parse(path, handler):
+            pass
+
+    def iter_parse(self, path, handler):
+        parser = expat.ParserCreate(namespace_separator=' ')
+        parser.buffer_text = True
+        parser.StartElementHandler = handler.start
+        parser.EndElementHandler = handler.end
+        parser.CharacterDataHandler = handler.characters
+        with self.archive.open(path) as source:
+            while True:
+                data = source.read(READ_SIZE)
+                parser.Parse(data, not data)
+                yield
+                if not data:
+                    return
+
+    def convert(self, data_type, style, value):
+        if data_type == 'n':
+            number = float(value) if '.' in value or 'E' in value or 'e' in value else int(value)
+            if style in self.date_styles:
+                try:
+                    if style in self.timedelta_styles:
+                        return from_excel(number, self.epoch, timedelta=True)
+                    return from_excel(number, self.epoch)
+                except (OverflowError, ValueError):
+                    return np.nan
+            whole = int(number)
+            return whole if whole == number else number
+        if data_type == 's':
+            return self.shared_strings[int(value)]
+        if data_type == 'b':
+            return bool(int(value))
+        if data_type == 'e':
+            return np.nan
+        if data_type == 'd':
+            return from_ISO8601(value)
+        return value
+
+
+class _StringsHandler:
+    """expat callbacks that collect the shared strings, see read_string_table of openpyxl."""
+
+    def __init__(self, strings):
+        self.strings = strings
+        self.string = None
+        self.text = None
+        self.phonetic = False
+
+    def start(self, name, attributes):
+        if name == _TEXT and not self.phonetic:
+            self.text = []
+        elif name == _STRING:
+            self.string = []
+        elif name == _PHONETIC:
+            self.phonetic = True
+
+    def characters(self, data):
+        if self.text is not None:
+            self.text.append(data)
+
+    def end(self, name):
+        if name == _TEXT and self.text is not None:
+            self.string.extend(self.text)
+            self.text = None
+        elif name == _STRING:
+            self.strings.append(''.join(self.string).replace('x005F_', ''))
+            self.string = None
+        elif name == _PHONETIC:
+            self.phonetic = False
+
+
+class _SheetHandler:
+    """expat callbacks that collect the rows of a sheet, see WorksheetReader.parse_cell of openpyxl."""
+
+    def __init__(self, reader, rows):
+        self.reader = reader
+        self.rows = rows
+        self.row = None
+        self.row_number = 0
+        self.column = 0
+        self.data_type = None
+        self.style = None
+        self.value = None
+        self.text = None
+        self.phonetic = False
+
+    def start(self, name, attributes):
+        if name == _CELL:
+            reference = attributes.get('r')
+            self.column = column_index_from_string(reference.rstrip('0123456789')) if reference else self.column + 1
+            self.data_type = attributes.get('t', 'n')
+            self.style = attributes.get('s', '0')
+            self.value = None
+        elif name == _VALUE:
+            self.text = ''
+        elif name == _ROW:
+            row_number = attributes.get('r')
+            row_number = int(row_number) if row_number else self.row_number + 1
+            # Rows without cells are left out of the sheet
+            for _ in range(self.row_number + 1, row_number):
+                self.rows.append([])
+            self.row_number = row_number
+            self.row = []
+            self.column = 0
+        elif name == _TEXT and not self.phonetic:
+            self.text = ''
+        elif name == _PHONETIC:
+            self.phonetic = True
+
+    def characters(self, data):
+        if self.text is not None:
+            self.text += data
+
+    def end(self, name):
+        if name == _VALUE:
+            self.value = self.text
+            self.text = None
+        elif name == _CELL:
+            # Cells without a value are empty, like the columns skipped by the cell references
+            if self.value:
+                row = self.row
+                if len(row) < self.column - 1:
+                    row.extend([''] * (self.column - 1 - len(row)))
+                row.append(self.reader.convert(self.data_type, self.style, self.value))
+        elif name == _ROW:
+            row = self.row
+            while row and isinstance(row[-1], str) and row[-1] == '':
+                row.pop()
+            self.rows.append(row)
+            self.row = None
+        elif name == _TEXT and self.text is not None:
+            # Inline strings consist of one or more runs of text
+            self.value = (self.value or '') + self.text
+            self.text = None
+        elif name == _PHONETIC:
+            self.phonetic = False
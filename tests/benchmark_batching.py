@@ -0,0 +1,75 @@
+"""Count and time the messages produce_delta_event publishes for a diff, by row width.
+
+    python tests/benchmark_batching.py 20000 5 50 500
+
+The first argument is the number of rows, the others the numbers of text columns of a row. The rows are encoded in
+batches of BATCH_MESSAGE_SIZE rows like before MessageBatcher, by MessageBatcher with the same number of rows and by
+MessageBatcher with at most BATCH_MESSAGE_BYTES bytes per message. The messages are checked to hold the same rows.
+"""
+import json
+import os
+import sys
+import time
+import types
+
+import numpy as np
+import pandas as pd
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [TESTS_DIR, os.path.join(os.path.dirname(TESTS_DIR), 'functions', 'produce_delta_event')]
+sys.modules['config'] = types.ModuleType('config')
+
+from batchmsg import MessageBatcher  # noqa: E402
+from gathermsg import gather_publish_df  # noqa: E402
+from original_publish import produce_payloads  # noqa: E402
+
+BATCH_MESSAGE_SIZE = 1000
+BATCH_MESSAGE_BYTES = 1000000
+# Largest message Pub/Sub accepts
+MAX_MESSAGE_BYTES = 10 * 1000 * 1000
+GOBITS = types.SimpleNamespace(to_json=lambda: {'processed': 'benchmark', 'gobits': 'x' * 200})
+
+
+def wide_frame(rows, columns, seed=0):
+    rng = np.random.default_rng(seed)
+    words = np.array(['value {} of a column'.format(i) for i in range(1000)], dtype=object)
+    return pd.DataFrame({'column {}'.format(i): words[rng.integers(0, len(words), rows)] for i in range(columns)})
+
+
+def batched_payloads(df, max_bytes=None, max_rows=None):
+    batcher = MessageBatcher(GOBITS, 'rows', max_bytes=max_bytes, max_rows=max_rows)
+    payloads = [batcher.add(message) for message in gather_publish_df(df)] + [batcher.flush()]
+    return [payload for payload in payloads if payload is not None]
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for columns in [int(columns) for columns in sys.argv[2:]] or [5, 50, 500]:
+        df = wide_frame(rows, columns)
+        results = {
+            'original {} rows'.format(BATCH_MESSAGE_SIZE): timed(produce_payloads, df, GOBITS, BATCH_MESSAGE_SIZE,
+                                                                 'rows'),
+            'batcher {} rows'.format(BATCH_MESSAGE_SIZE): timed(batched_payloads, df, max_rows=BATCH_MESSAGE_SIZE),
+            'batcher {} bytes'.format(BATCH_MESSAGE_BYTES): timed(batched_payloads, df, max_bytes=BATCH_MESSAGE_BYTES),
+        }
+
+        published = [[row for payload in payloads for row in json.loads(payload)['rows']]
+                     for payloads, _ in results.values()]
+        if any(rows_of_payloads != published[0] for rows_of_payloads in published):
+            raise AssertionError('Rows of {} columns differ'.format(columns))
+        print('{} rows of {} columns:'.format(rows, columns))
+        for name, (payloads, elapsed) in results.items():
+            largest = max(len(payload) for payload in payloads)
+            print('  {}: {} messages, largest {:.2f} MB{}, {:.2f} s, {:.0f} rows/s'.format(
+                name, len(payloads), largest / 1e6, ' (too large)' if largest > MAX_MESSAGE_BYTES else '', elapsed,
+                rows / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Time the cold start of the storage triggered functions for a file outside FILEPATH_PREFIX_FILTER, with main loading
+the processing code on the first handled file and with main importing it at module load.
+
+    python tests/benchmark_coldstart.py 5
+
+The argument is the number of cold starts per function, every one in a new interpreter with a config that only holds
+FILEPATH_PREFIX_FILTER. The cold start of a skipped file is profiled by coldstart.py: importing main and calling the
+entry point. Before main loaded it lazily, every cold start imported the module with the processing code (publishdiff
+or processfile); the Cloud clients the old main.py also created at import are left out. Skipped files are checked to
+load none of the heavy modules of coldstart.py.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONS_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'functions')
+sys.path.insert(0, FUNCTIONS_DIR)
+
+import coldstart  # noqa: E402
+
+# Module of every function that holds the code main.py imported at module load before
+PROCESSING_MODULES = {
+    'produce_delta_event': 'publishdiff',
+    'datastore_delta_event': 'publishdiff',
+    'file_processing': 'processfile',
+}
+
+IMPORT_SCRIPT = '''
+import sys
+import time
+
+start = time.perf_counter()
+__import__(sys.argv[1])
+print(time.perf_counter() - start)
+'''
+
+
+def import_time(function_dir, config_dir, module):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([config_dir, function_dir]), PYTHONDONTWRITEBYTECODE='1')
+    output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT, module], cwd=function_dir, env=env,
+                            stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+    return float(output.splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    with tempfile.TemporaryDirectory() as config_dir:
+        with open(os.path.join(config_dir, 'config.py'), 'w') as config_file:
+            config_file.write("FILEPATH_PREFIX_FILTER = 'source/'\n")
+
+        for function, module in PROCESSING_MODULES.items():
+            function_dir = os.path.join(FUNCTIONS_DIR, function)
+            lazy = [coldstart.profile(function_dir, config_dir, coldstart.ENTRY_POINTS[function], 'source/')[0]
+                    for _ in range(runs)]
+            eager = [import_time(function_dir, config_dir, module) for _ in range(runs)]
+
+            loaded = sorted({name for result in lazy for name in result['loaded']})
+            if loaded:
+                raise AssertionError('Skipped files of {} loaded {}'.format(function, ', '.join(loaded)))
+            print('{}, median of {} cold starts: importing {} at module load {:.0f} ms; lazily {:.1f} ms '
+                  '(import main {:.1f} ms, skip the file {:.2f} ms)'.format(
+                      function, runs, module, 1000 * statistics.median(eager),
+                      1000 * statistics.median(result['import'] + result['skip'] for result in lazy),
+                      1000 * statistics.median(result['import'] for result in lazy),
+                      1000 * statistics.median(result['skip'] for result in lazy)))
+
+
+if __name__ == '__main__':
+    main()
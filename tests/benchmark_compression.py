@@ -0,0 +1,60 @@
+"""Measure the compression ratio and the CPU time of compressing the payloads of produce_delta_event.
+
+    python tests/benchmark_compression.py 100000
+
+The diff_frame of test_gathermsg.py is encoded in payloads of BATCH_MESSAGE_SIZE rows by MessageBatcher, which are
+compressed and decompressed with every PUBLISH_CONTENT_ENCODING at several levels. The ratio is the size of the
+compressed payloads to the size of the payloads, the times are process CPU times. The payloads are checked to
+decompress to the original.
+"""
+import os
+import sys
+import time
+import types
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [TESTS_DIR, os.path.join(os.path.dirname(TESTS_DIR), 'functions', 'produce_delta_event')]
+sys.modules['config'] = types.ModuleType('config')
+
+from batchmsg import MessageBatcher  # noqa: E402
+from gathermsg import gather_publish_df  # noqa: E402
+from payloadcoding import CONTENT_ENCODING_ATTRIBUTE, compress_payload, decompress_payload  # noqa: E402
+from test_gathermsg import diff_frame  # noqa: E402
+
+BATCH_MESSAGE_SIZE = 1000
+LEVELS = {'br': [1, 5, 9, 11], 'gzip': [1, 6, 9]}
+GOBITS = types.SimpleNamespace(to_json=lambda: {'processed': 'benchmark'})
+
+
+def timed(function, *args):
+    start = time.process_time()
+    result = function(*args)
+    return result, time.process_time() - start
+
+
+def main():
+    for rows in [int(rows) for rows in sys.argv[1:]] or [100000]:
+        batcher = MessageBatcher(GOBITS, 'rows', max_rows=BATCH_MESSAGE_SIZE)
+        payloads = [batcher.add(row) for row in gather_publish_df(diff_frame(rows))] + [batcher.flush()]
+        payloads = [payload for payload in payloads if payload is not None]
+        size = sum(map(len, payloads))
+        print('{} rows, {} payloads of {:.1f} MB'.format(rows, len(payloads), size / 2 ** 20))
+
+        for content_encoding, levels in LEVELS.items():
+            attributes = {CONTENT_ENCODING_ATTRIBUTE: content_encoding}
+            for level in levels:
+                compressed, compress_time = timed(
+                    lambda: [compress_payload(payload, content_encoding, level) for payload in payloads])
+                decompressed, decompress_time = timed(
+                    lambda: [decompress_payload(data, attributes) for data in compressed])
+
+                if decompressed != payloads:
+                    raise AssertionError('{} level {} does not decompress to the payloads'.format(
+                        content_encoding, level))
+                print('  {} level {}: ratio {:.3f}, compressed in {:.2f} s ({:.1f} MB/s), decompressed in {:.2f} s'
+                      .format(content_encoding, level, sum(map(len, compressed)) / size, compress_time,
+                              size / 2 ** 20 / max(compress_time, 1e-9), decompress_time))
+
+
+if __name__ == '__main__':
+    main()
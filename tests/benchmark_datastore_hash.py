@@ -0,0 +1,96 @@
+"""Measure the DataStore bytes and the time of comparing rows of datastore_delta_event to full entities and to hashes.
+
+    python tests/benchmark_datastore_hash.py 10000 5 20 50
+
+The first argument is the number of rows, the others the numbers of attributes of a row. The state of every row is
+stored, then the rows are compared to it by calculate_diff_from_state with one percent of them changed, once with
+full entities, once with store_hash and once with store_hash on the full entities of a previous run. The bytes are
+the sizes of the entity protobufs written by put_multi and read by get_multi of a fake DataStore without latency, the
+compare time is the time of the lookups. The rows to publish are checked to be equal.
+"""
+import os
+import sys
+import time
+import types
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [TESTS_DIR, os.path.join(os.path.dirname(TESTS_DIR), 'functions', 'datastore_delta_event')]
+sys.modules['config'] = types.ModuleType('config')
+
+import publishdiff  # noqa: E402
+import statestorage  # noqa: E402
+from fakes import FakeDatastoreClient  # noqa: E402
+from google.cloud.datastore import helpers  # noqa: E402
+
+
+class MeasuringDatastoreClient(FakeDatastoreClient):
+    """Fake DataStore that adds up the bytes of the entities that are written and read."""
+
+    def __init__(self):
+        super().__init__()
+        self.bytes_written = 0
+        self.bytes_read = 0
+
+    @staticmethod
+    def size(entities):
+        # Newer client libraries wrap the protobuf message in _pb
+        return sum(getattr(pb, '_pb', pb).ByteSize() for pb in map(helpers.entity_to_protobuf, entities))
+
+    def get_multi(self, keys, missing=None):
+        found = super().get_multi(keys, missing)
+        size = self.size(found)
+        with self.lock:
+            self.bytes_read += size
+        return found
+
+    def put_multi(self, entities):
+        size = self.size(entities)
+        with self.lock:
+            self.bytes_written += size
+        super().put_multi(entities)
+
+
+def rows(count, width, changed=()):
+    # DataStore ids start at 1
+    return [dict({'id': i}, **{'attribute {}'.format(column): 'changed' if i in changed and column == 0 else
+                               'value {} of row {}'.format(column, i) for column in range(width)})
+            for i in range(1, count + 1)]
+
+
+def run(client, store_hash, state, new_rows):
+    statestorage.datastore.Client = lambda: client
+    storage = statestorage.state_storage_from_specification(
+        {'type': 'datastore', 'entity_name': 'Entity', 'id_property': 'id', 'store_hash': store_hash})
+    if state is not None:
+        storage.store({row['id']: row for row in state})
+    written = client.bytes_written
+    start = time.perf_counter()
+    diff = publishdiff.calculate_diff_from_state(new_rows, storage)
+    return diff, written, client.bytes_read, time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for width in [int(width) for width in sys.argv[2:]] or [5, 20, 50]:
+        state = rows(count, width)
+        new_rows = rows(count, width, changed=set(range(1, count + 1, 100)))
+        print('{} rows of {} attributes'.format(count, width))
+
+        full_client = MeasuringDatastoreClient()
+        results = {
+            'full entities': run(full_client, False, state, new_rows),
+            'hashes': run(MeasuringDatastoreClient(), True, state, new_rows),
+        }
+        full_client.bytes_written = full_client.bytes_read = 0
+        results['hashes of full entities'] = run(full_client, True, None, new_rows)
+
+        diffs = [diff for diff, _, _, _ in results.values()]
+        if any(diff != diffs[0] for diff in diffs) or len(diffs[0]) != len(range(1, count + 1, 100)):
+            raise AssertionError('Rows to publish of {} rows of {} attributes differ'.format(count, width))
+        for name, (_, written, read, compare_time) in results.items():
+            print('  {}: written {:.1f} MB, read {:.1f} MB, compared in {:.2f} s'.format(
+                name, written / 2 ** 20, read / 2 ** 20, compare_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Time the rows per second eav_delta_producer publishes, with one batched publisher and engine and with a publisher
+per row and an engine per query.
+
+    python tests/benchmark_eav_publish.py 20000 0.005 0.002
+
+The first argument is the number of keys on the SQLite database of test_eav_changed_keys.py, the rows of 3 of every
+11 keys differ from yesterday. The second is the seconds it takes to create a publisher, the third the seconds of every
+publish request. The publishers are FakeBatchingPublishers of fakes.py that send up to 100 messages per request. Every
+mode runs the handler twice, like two invocations of one instance. The published rows are checked to be the same.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [TESTS_DIR, os.path.join(os.path.dirname(TESTS_DIR), 'functions', 'eav_delta_producer')]
+sys.modules['config'] = types.ModuleType('config')
+
+from google.cloud import pubsub_v1  # noqa: E402
+
+from test_eav_changed_keys import CONFIG, EAVDatabase, fill  # noqa: E402
+
+sys.modules['config'].__dict__.update(CONFIG, TOPIC_BATCH_SETTINGS={'max_messages': 100})
+
+import main as eav  # noqa: E402
+import models  # noqa: E402
+from fakes import FakeBatchingPublisher  # noqa: E402
+
+RUNS = 2
+
+get_engine = eav.get_engine
+publish_json = eav.publish_json
+
+
+def publish_json_per_row(msg, topic_project_id, topic_name):
+    # A new client for every row, like publish_json before the publisher was kept by the instance
+    batch_settings = pubsub_v1.types.BatchSettings(**eav.config.TOPIC_BATCH_SETTINGS)
+    publisher = pubsub_v1.PublisherClient(batch_settings)
+    topic_path = publisher.topic_path(topic_project_id, topic_name)
+    return publisher.publish(topic_path, bytes(json.dumps(msg).encode('utf-8')))
+
+
+def run_handler(url, shared, client_latency, request_latency):
+    stats = {}
+    pubsub_v1.PublisherClient = lambda batch_settings: FakeBatchingPublisher(
+        stats, batch_settings.max_messages, client_latency=client_latency, request_latency=request_latency)
+    eav._publisher = None
+    eav._engine = None
+    engines = []
+
+    def engine_per_query(refresh_secret=False):
+        # A new engine for every query, like query before the engine was kept by the instance
+        engines.append(eav.create_engine(url))
+        return engines[-1]
+
+    eav.get_engine = get_engine if shared else engine_per_query
+    eav.publish_json = publish_json if shared else publish_json_per_row
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        eav.handler(None)
+    elapsed = time.perf_counter() - start
+    for engine in engines + ([eav._engine] if eav._engine is not None else []):
+        engine.dispose()
+    rows = [row for payload in stats['payloads'] for row in json.loads(payload)['data']]
+    return rows, stats, elapsed, len(engines) if engines else 1
+
+
+def main():
+    keys = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    client_latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.005
+    request_latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.002
+    with tempfile.TemporaryDirectory() as root:
+        database = EAVDatabase(models, os.path.join(root, 'eav.sqlite'))
+        fill(database, keys)
+        eav.database_url = lambda refresh_secret=False: database.url
+
+        results = {}
+        for name, shared in (('publisher per row, engine per query', False), ('one publisher and engine', True)):
+            results[name] = run_handler(database.url, shared, client_latency, request_latency)
+
+    published = [sorted(json.dumps(row, sort_keys=True) for row in rows) for rows, _, _, _ in results.values()]
+    if published[0] != published[1]:
+        raise AssertionError('Published rows differ')
+    for name, (rows, stats, elapsed, engines) in results.items():
+        print('{} keys, {} runs, {}: {} rows, {} publishers, {} requests, {} engines, {:.2f} s, {:.0f} rows/s'.format(
+            keys, RUNS, name, len(rows), stats['clients'], stats['requests'], engines, elapsed, len(rows) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Time encoding the messages of a diff of produce_delta_event into payloads.
+
+    python tests/benchmark_encoding.py 100000 1000000
+
+The diff_frame of test_gathermsg.py is encoded in batches of BATCH_MESSAGE_SIZE rows like before MessageBatcher, by
+MessageBatcher, and by MessageBatcher with PUBLISH_COMPACT_JSON, with the json module and with orjson when it is
+installed. Without and with the COLUMNS_PUBLISH of test_gathermsg.py. The payloads of MessageBatcher are checked to
+be the bytes of the original ones, the compact payloads to hold the same values.
+"""
+import json
+import os
+import sys
+import time
+import types
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [TESTS_DIR, os.path.join(os.path.dirname(TESTS_DIR), 'functions', 'produce_delta_event')]
+sys.modules['config'] = types.ModuleType('config')
+
+import batchmsg  # noqa: E402
+from gathermsg import gather_publish_df  # noqa: E402
+from original_publish import produce_payloads  # noqa: E402
+from test_gathermsg import COLUMNS_PUBLISH, diff_frame  # noqa: E402
+
+BATCH_MESSAGE_SIZE = 1000
+GOBITS = types.SimpleNamespace(to_json=lambda: {'processed': 'benchmark'})
+
+
+def batched_payloads(df, columns_publish, compact=False):
+    batcher = batchmsg.MessageBatcher(GOBITS, 'rows', max_rows=BATCH_MESSAGE_SIZE, compact=compact)
+    rows = gather_publish_df(df, columns_publish, encoded=compact)
+    payloads = [batcher.add(row) for row in rows] + [batcher.flush()]
+    return [payload for payload in payloads if payload is not None]
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    orjson = batchmsg.orjson
+    for rows in [int(rows) for rows in sys.argv[1:]] or [100000, 1000000]:
+        df = diff_frame(rows)
+        for columns_publish in (None, COLUMNS_PUBLISH):
+            original, original_time = timed(produce_payloads, df, GOBITS, BATCH_MESSAGE_SIZE, 'rows', columns_publish)
+            batched, batched_time = timed(batched_payloads, df, columns_publish)
+            batchmsg.orjson = None
+            compact, compact_time = timed(batched_payloads, df, columns_publish, compact=True)
+            batchmsg.orjson = orjson
+            if orjson is not None:
+                fast, fast_time = timed(batched_payloads, df, columns_publish, compact=True)
+
+            if batched != original:
+                raise AssertionError('Payloads of {} rows differ from the original bytes'.format(rows))
+            values = [json.loads(payload) for payload in original]
+            if [json.loads(payload) for payload in compact] != values or (
+                    orjson is not None and [json.loads(payload) for payload in fast] != values):
+                raise AssertionError('Compact payloads of {} rows hold other values'.format(rows))
+            print('{} rows, {}: original {:.2f} s; batcher {:.2f} s; compact json {:.2f} s, {:.0f}% of the bytes; '
+                  'compact orjson {}'.format(
+                      rows, 'COLUMNS_PUBLISH' if columns_publish else 'all columns', original_time, batched_time,
+                      compact_time, 100 * sum(map(len, compact)) / sum(map(len, original)),
+                      '{:.2f} s'.format(fast_time) if orjson is not None else 'not installed'))
+
+
+if __name__ == '__main__':
+    main()
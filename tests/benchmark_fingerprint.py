@@ -0,0 +1,66 @@
+"""Time and measure the peak memory of diffing wide DataFrames by merge and by row fingerprint.
+
+    python tests/benchmark_fingerprint.py 100000 300000
+
+The frames have 30 text and 10 numeric columns, one percent of the rows of the new frame differ from the old frame.
+Peak memory is the largest amount allocated by Python, NumPy and pandas during the diff, as traced by tracemalloc.
+"""
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+import numpy as np
+import pandas as pd
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [TESTS_DIR, os.path.join(os.path.dirname(TESTS_DIR), 'functions', 'produce_delta_event')]
+sys.modules['config'] = types.ModuleType('config')
+
+from fingerprint import diff_rows  # noqa: E402
+from test_fingerprint import merge_diff  # noqa: E402
+
+TEXT_COLUMNS = 30
+NUMBER_COLUMNS = 10
+
+
+def wide_frames(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    words = np.array(['value {}'.format(i) for i in range(1000)], dtype=object)
+    columns = {'text {}'.format(i): words[rng.integers(0, len(words), rows)] for i in range(TEXT_COLUMNS)}
+    columns.update({'number {}'.format(i): rng.random(rows) for i in range(NUMBER_COLUMNS)})
+    df_old = pd.DataFrame(columns)
+
+    df_new = df_old.sample(frac=1, random_state=seed).reset_index(drop=True)
+    changed = rng.choice(rows, rows // 100, replace=False)
+    df_new.loc[changed, 'text 0'] = 'changed'
+    return df_old, df_new
+
+
+def measure(diff, df_old, df_new):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = diff(df_old, df_new)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    for rows in [int(rows) for rows in sys.argv[1:]] or [100000, 300000]:
+        df_old, df_new = wide_frames(rows)
+        size = df_new.memory_usage(deep=True).sum()
+
+        merged, merge_time, merge_peak = measure(merge_diff, df_old, df_new)
+        fingerprinted, fingerprint_time, fingerprint_peak = measure(diff_rows, df_old, df_new)
+
+        pd.testing.assert_frame_equal(fingerprinted, merged)
+        print('{} rows, {} MB per frame, {} changed: merge {:.2f} s, peak {} MB; fingerprint {:.2f} s, peak {} MB'
+              .format(rows, size >> 20, len(merged), merge_time, merge_peak >> 20, fingerprint_time,
+                      fingerprint_peak >> 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Count the Cloud Storage requests and connections of produce_delta_event runs, with one client and with a client per
+operation.
+
+    python tests/benchmark_gcs_requests.py 5 1000
+
+The first argument is the number of runs, the second the number of rows of the json file of a run. The runs go to the
+FakeGCSServer of fakes.py, once with the shared client of gcsclient and once with a new storage client that gets the
+bucket for every operation, like the functions did before gcsclient. The published messages are checked to be equal.
+"""
+import json
+import os
+import sys
+import time
+import types
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [TESTS_DIR, os.path.join(os.path.dirname(TESTS_DIR), 'functions', 'produce_delta_event')]
+sys.modules['config'] = types.ModuleType('config')
+sys.modules['config'].__dict__.update({
+    'INBOX': 'inbox',
+    'ARCHIVE': 'archive',
+    'ATTRIBUTE_WITH_THE_LIST': 'rows',
+    'ARCHIVE_LATEST_POINTER': True,
+    'TOPIC_SETTINGS': {'topic_project_id': 'project', 'topic_name': 'topic'},
+    'TOPIC_BATCH_SETTINGS': {},
+    'BATCH_MESSAGE_SIZE': 100,
+})
+
+import blobio  # noqa: E402
+import gcsclient  # noqa: E402
+import publishdiff  # noqa: E402
+from fakes import FakeGCSServer, FakePublisher  # noqa: E402
+
+
+def get_bucket_per_operation(bucket_name):
+    # A new client and session, and a request for the bucket properties
+    return gcsclient._create_client().get_bucket(bucket_name)
+
+
+def run_days(runs, rows, get_bucket):
+    server = FakeGCSServer()
+    os.environ['STORAGE_EMULATOR_HOST'] = server.url
+    gcsclient._client = None
+    gcsclient._buckets.clear()
+    for module in (blobio, publishdiff):
+        module.get_bucket = get_bucket
+    publisher = FakePublisher()
+    publishdiff.get_publisher = lambda: publisher
+    try:
+        results = []
+        for day in range(runs):
+            content = {'rows': [{'id': i, 'name': 'name {}'.format(i * day if i % 10 == 0 else i)}
+                                for i in range(rows)]}
+            server.put('inbox', 'day{}.json'.format(day), json.dumps(content).encode('utf-8'))
+            server.requests.clear()
+            connections = server.connections
+            start = time.perf_counter()
+            publishdiff.publish_diff({'bucket': 'inbox', 'name': 'day{}.json'.format(day)}, None)
+            results.append((len(server.requests), server.connections - connections, time.perf_counter() - start))
+        return results, publisher.payloads()
+    finally:
+        publisher.close()
+        server.close()
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    os.environ.setdefault('GOOGLE_CLOUD_PROJECT', 'test')
+
+    per_operation, per_operation_payloads = run_days(runs, rows, get_bucket_per_operation)
+    shared, shared_payloads = run_days(runs, rows, gcsclient.get_bucket)
+
+    if per_operation_payloads != shared_payloads:
+        raise AssertionError('Published messages differ')
+    for day, ((requests, connections, elapsed), (shared_requests, shared_connections, shared_elapsed)) in enumerate(
+            zip(per_operation, shared)):
+        print('run {}: client per operation {} requests, {} connections, {:.2f} s; '
+              'shared client {} requests, {} connections, {:.2f} s'.format(
+                  day, requests, connections, elapsed, shared_requests, shared_connections, shared_elapsed))
+
+
+if __name__ == '__main__':
+    main()
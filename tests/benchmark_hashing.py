@@ -0,0 +1,54 @@
+"""Time hashing a column with sha256_hexdigests serially and by a pool of worker processes.
+
+    python tests/benchmark_hashing.py 50000 200000 1000000
+
+Every column is hashed with 1 worker (in this process), 2, 4 and os.cpu_count() workers. The first call with a new
+number of workers starts the pool, its time is shown apart from the time of a call that reuses the pool. The digests
+of every call are checked to equal the serial ones. Only an instance with more than one CPU gains from the workers.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTION_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'functions', 'produce_delta_event')
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    # The worker processes import hashing and its config, so config has to be a module on sys.path
+    config_dir = tempfile.mkdtemp()
+    open(os.path.join(config_dir, 'config.py'), 'w').close()
+    sys.path[:0] = [config_dir, FUNCTION_DIR]
+    import hashing
+
+    try:
+        sizes = [int(size) for size in sys.argv[1:]] or [50000, 200000, 1000000]
+        print('{} CPUs'.format(os.cpu_count()))
+        for workers in sorted({2, 4, os.cpu_count() or 1}):
+            # Start the pool on a column just large enough to be hashed by it
+            _, start_time = timed(hashing.sha256_hexdigests, ['start'] * hashing.PARALLEL_MIN_VALUES, workers=workers)
+            print('{} workers: pool started in {:.2f} s'.format(workers, start_time))
+            for size in sizes:
+                values = ['value {} of the column'.format(i) for i in range(size)]
+                serial, serial_time = timed(hashing.sha256_hexdigests, values, workers=1)
+                parallel, parallel_time = timed(hashing.sha256_hexdigests, values, workers=workers)
+                if parallel != serial:
+                    raise AssertionError('Digests of {} values differ'.format(size))
+                print('  {} values: serial {:.2f} s, {} workers {:.2f} s'.format(
+                    size, serial_time, workers, parallel_time))
+    finally:
+        if hashing._executor is not None:
+            hashing._executor.shutdown()
+        shutil.rmtree(config_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Time and measure the peak memory of reading the entries of an OData Atom feed of datastore_delta_event.
+
+    python tests/benchmark_odata.py 10000 100000
+
+The feed of odata_feed in test_odata.py is read by the original load_odata, which parses it into a tree, by
+load_odata, which parses it incrementally into a list of entries, and by iter_odata in chunks of CHUNKED_READ_SIZE
+entries, like a chunked run, without keeping the chunks. Peak memory is the largest amount allocated by Python during
+the read, besides the feed itself, as traced by tracemalloc. The entries are checked to be equal.
+"""
+import io
+import itertools
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [TESTS_DIR, os.path.join(os.path.dirname(TESTS_DIR), 'functions', 'datastore_delta_event')]
+sys.modules['config'] = types.ModuleType('config')
+
+import publishdiff  # noqa: E402
+from original_odata import load_odata  # noqa: E402
+from test_odata import odata_entry, odata_feed  # noqa: E402
+
+CHUNKED_READ_SIZE = 1000
+
+
+def read_chunks(xml_data):
+    items = publishdiff.iter_odata(io.BytesIO(xml_data))
+    return [chunk[-1] for chunk in iter(lambda: list(itertools.islice(items, CHUNKED_READ_SIZE)), [])]
+
+
+def measure(read, xml_data):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = read(xml_data)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    for entries in [int(entries) for entries in sys.argv[1:]] or [10000, 100000]:
+        xml_data = odata_feed(odata_entry(i) for i in range(entries))
+
+        original, original_time, original_peak = measure(load_odata, xml_data)
+        incremental, incremental_time, incremental_peak = measure(publishdiff.load_odata, xml_data)
+        last_of_chunks, chunks_time, chunks_peak = measure(read_chunks, xml_data)
+
+        if original != incremental or last_of_chunks != original[CHUNKED_READ_SIZE - 1::CHUNKED_READ_SIZE]:
+            raise AssertionError('Entries of a feed of {} entries differ'.format(entries))
+        print('{} entries, {} MB: tree {:.2f} s, peak {} MB; incremental {:.2f} s, peak {} MB; '
+              'chunks of {} {:.2f} s, peak {} MB'.format(
+                  entries, len(xml_data) >> 20, original_time, original_peak >> 20, incremental_time,
+                  incremental_peak >> 20, CHUNKED_READ_SIZE, chunks_time, chunks_peak >> 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Time preprocessing a file by file_processing, with its transforms done a column at a time and with apply.
+
+    python tests/benchmark_preprocessing.py 500000
+
+The argument is the number of rows of the json file. Its columns are normalized, combined and hashed with the CONFIG
+of test_preprocessing.py, one of the hashed columns has a distinct value on every row. The file is read once from
+a LocalStorage of fakes.py in a temporary directory, the time of reading it is left out. Every step is also timed on
+its own. The preprocessed files are checked to be the same bytes.
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+import unicodedata
+
+import numpy as np
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [TESTS_DIR, os.path.join(os.path.dirname(TESTS_DIR), 'functions', 'file_processing')]
+sys.modules['config'] = types.ModuleType('config')
+
+import blobio  # noqa: E402
+import hashing  # noqa: E402
+import processfile  # noqa: E402
+from fakes import LocalStorage  # noqa: E402
+from original_preprocessing import preprocessing  # noqa: E402
+from test_preprocessing import CONFIG, NAMES  # noqa: E402
+
+sys.modules['config'].__dict__.update(CONFIG, JSON_ELEMENTS=['rows'])
+
+
+def records(count, seed=0):
+    rng = np.random.default_rng(seed)
+    names = ['{} {}'.format(NAMES[i % len(NAMES)], i) for i in range(1000)]
+    return [{
+        'Name': names[name],
+        'Project': 'Project ½ {}'.format(project),
+        'Number': None if i % 50 == 0 else i,
+        'Amount': float(amount),
+        'Active': bool(i % 3),
+        'Email': 'user{}@example.com'.format(i),
+        'Remark': ['', 'ok!!', None, 'remark é!!'][i % 4],
+    } for i, (name, project, amount) in enumerate(zip(
+        rng.integers(0, len(names), count), rng.integers(0, 50, count), rng.integers(0, 10000, count) / 100))]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def time_steps(df):
+    """Return the seconds of every transform with apply and a column at a time."""
+    df = df.rename(columns=CONFIG['COLUMN_MAPPING'])
+    steps = {}
+    for column in CONFIG['COLUMNS_NORMALIZE']:
+        steps['normalize ' + column] = (
+            timed(df[column].apply, lambda x: unicodedata.normalize('NFKD', x))[1],
+            timed(processfile.map_distinct, df[column], processfile.normalize_values)[1])
+    for key, columns in CONFIG['COLUMN_COMBINE'].items():
+        steps['combine ' + key] = (
+            timed(df[columns].apply, lambda x: '_'.join(x.dropna().astype(str)), 1)[1],
+            timed(processfile.join_columns, df, columns, '_')[1])
+    for column in CONFIG['COLUMNS_HASH']:
+        values = df[column].apply(lambda x: unicodedata.normalize('NFKD', x)) if column == 'name' else df[column]
+        steps['hash ' + column] = (
+            timed(values.apply, lambda x: hashlib.sha256(x.encode()).hexdigest())[1],
+            timed(processfile.map_distinct, values, hashing.sha256_hexdigests)[1])
+    return steps
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    with tempfile.TemporaryDirectory() as root, pytest.MonkeyPatch.context() as monkeypatch:
+        local_storage = LocalStorage(root)
+        local_storage.install(monkeypatch, processfile, blobio)
+        local_storage.put('upload', 'file.json', json.dumps({'rows': records(rows)}).encode('utf-8'))
+
+        df = processfile.df_from_store('upload', 'file.json')
+        # Both preprocess the frame read once, so only the transforms and writing the file are timed
+        monkeypatch.setattr(processfile, 'df_from_store', lambda bucket_name, blob_name: df.copy())
+        original, original_time = timed(preprocessing, df.copy(), 'file.json', sys.modules['config'])
+        preprocessed, preprocessed_time = timed(processfile.preprocessing, 'upload', 'file.json')
+
+        if preprocessed['file'] != original['file']:
+            raise AssertionError('The preprocessed file of {} rows differs from the one of apply'.format(rows))
+        for step, (apply_time, column_time) in time_steps(df).items():
+            print('{} rows, {}: apply {:.2f} s; a column at a time {:.2f} s'.format(
+                rows, step, apply_time, column_time))
+        print('{} rows, preprocessing: apply {:.2f} s; a column at a time {:.2f} s'.format(
+            rows, original_time, preprocessed_time))
+
+
+if __name__ == '__main__':
+    main()
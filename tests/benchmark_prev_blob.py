@@ -0,0 +1,56 @@
+"""Time finding the previous archive file of produce_delta_event by listing the archive and by the latest pointer.
+
+    python tests/benchmark_prev_blob.py 100000 0.03
+
+The first argument is the number of objects on the archive, the second the seconds every request takes. The archive
+is a FakeGCSServer of fakes.py that returns 1000 objects per page of a listing, like Cloud Storage. The server runs
+in this process, the time it takes to make a page adds to the time of the listing. Both lookups are checked to find
+the same file.
+"""
+import os
+import sys
+import time
+import types
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [TESTS_DIR, os.path.join(os.path.dirname(TESTS_DIR), 'functions', 'produce_delta_event')]
+sys.modules['config'] = types.ModuleType('config')
+sys.modules['config'].__dict__.update({'INBOX': 'inbox', 'ARCHIVE': 'archive'})
+
+import publishdiff  # noqa: E402
+from fakes import FakeGCSServer  # noqa: E402
+
+
+def lookup(server, latest_pointer):
+    publishdiff.config.ARCHIVE_LATEST_POINTER = latest_pointer
+    server.requests.clear()
+    start = time.perf_counter()
+    blob = publishdiff.get_prev_blob('archive', 'source/')
+    return blob.name, len(server.requests), time.perf_counter() - start
+
+
+def main():
+    objects = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.03
+    server = FakeGCSServer(latency=latency)
+    os.environ['STORAGE_EMULATOR_HOST'] = server.url
+    os.environ.setdefault('GOOGLE_CLOUD_PROJECT', 'test')
+    try:
+        for i in range(objects):
+            server.put('archive', 'source/{:08d}.json'.format(i), b'{}')
+        publishdiff.latest_pointer_to_store('archive', 'source/', 'source/{:08d}.json'.format(objects - 1))
+
+        listed, listing_requests, listing_time = lookup(server, False)
+        from_pointer, pointer_requests, pointer_time = lookup(server, True)
+
+        if listed != from_pointer:
+            raise AssertionError('The listing found {}, the pointer refers to {}'.format(listed, from_pointer))
+        print('{} objects, {:.0f} ms per request: listing {} requests, {:.2f} s; latest pointer {} requests, '
+              '{:.2f} s'.format(objects, latency * 1000, listing_requests, listing_time, pointer_requests,
+                                pointer_time))
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Time reading the previous archive file of produce_delta_event from the file and from its Parquet snapshot.
+
+    python tests/benchmark_snapshot.py 100000 xlsx csv json
+
+The first argument is the number of rows, the others the formats of the archived file. The rows are read from a file
+on the inbox and archived like publish_diff does. The archive is a LocalStorage of fakes.py in a temporary directory,
+so the times are those of parsing the file, not of downloading it. The rows read from the snapshot are checked to be
+the rows read from the file.
+"""
+import os
+import sys
+import tempfile
+import time
+import types
+
+import pandas as pd
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [TESTS_DIR, os.path.join(os.path.dirname(TESTS_DIR), 'functions', 'produce_delta_event')]
+sys.modules['config'] = types.ModuleType('config')
+sys.modules['config'].__dict__.update({
+    'INBOX': 'inbox',
+    'ARCHIVE': 'archive',
+    'CSV_DIALECT_PARAMETERS': {'sep': ','},
+    'ARCHIVE_SNAPSHOT': True,
+})
+
+import blobio  # noqa: E402
+import publishdiff  # noqa: E402
+from fakes import LocalStorage  # noqa: E402
+from test_gathermsg import diff_frame  # noqa: E402
+
+
+def read_archive(blob_name, snapshot):
+    publishdiff.config.ARCHIVE_SNAPSHOT = snapshot
+    start = time.perf_counter()
+    df = publishdiff.df_from_store('archive', blob_name, from_archive=True)
+    return df, time.perf_counter() - start
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    df = diff_frame(rows)
+    publishdiff.config.COLUMNS_NONPII = list(df.columns)
+    with tempfile.TemporaryDirectory() as root, pytest.MonkeyPatch.context() as monkeypatch:
+        local_storage = LocalStorage(root)
+        local_storage.install(monkeypatch, publishdiff, blobio)
+        for extension in sys.argv[2:] or ['xlsx', 'csv', 'json']:
+            # The rows are archived as publish_diff archives them, after reading them from a file on the inbox
+            blob_name = 'day.' + extension
+            if extension == 'csv':
+                local_storage.put('inbox', blob_name, df.to_csv(index=False).encode('utf-8'), 'text/csv')
+            else:
+                publishdiff.df_to_store('inbox', blob_name, df)
+            new_df = publishdiff.df_from_store('inbox', blob_name)
+            publishdiff.df_to_store('archive', blob_name, new_df)
+            publishdiff.snapshot_to_store('archive', blob_name, new_df)
+
+            from_file, file_time = read_archive(blob_name, False)
+            from_snapshot, snapshot_time = read_archive(blob_name, True)
+
+            if extension == 'csv':
+                # The archived csv file holds the index of the rows as its first column, the snapshot does not
+                from_file = from_file.drop(columns='Unnamed: 0')
+            pd.testing.assert_frame_equal(from_snapshot, from_file.reset_index(drop=True))
+            file_size = len(local_storage.read('archive', blob_name))
+            snapshot_size = len(local_storage.read('archive', blob_name + publishdiff.SNAPSHOT_SUFFIX))
+            print('{} rows, {}: file {:.2f} MB, {:.2f} s; snapshot {:.2f} MB, {:.2f} s'.format(
+                rows, extension, file_size / 1e6, file_time, snapshot_size / 1e6, snapshot_time))
+
+
+if __name__ == '__main__':
+    main()
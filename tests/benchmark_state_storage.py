@@ -0,0 +1,99 @@
+"""Time looking up the state of rows of datastore_delta_event in SQLite and in a fake DataStore.
+
+    python tests/benchmark_state_storage.py 10000 100000
+
+The state of every row is stored first, then the rows are compared to it by calculate_diff_from_state, with one
+percent of them changed. The SQLite state is read from and written to a local Cloud Storage stand-in, opening it
+includes reading the file. Every DataStore request sleeps LATENCY seconds, DATASTORE_CONCURRENCY requests are done at
+the same time, the time without latency is spent building the keys and entities of the client library. The rows to
+publish of both storages are checked to be equal.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [TESTS_DIR, os.path.join(os.path.dirname(TESTS_DIR), 'functions', 'datastore_delta_event')]
+sys.modules['config'] = types.ModuleType('config')
+
+import publishdiff  # noqa: E402
+import statestorage  # noqa: E402
+from fakes import FakeDatastoreClient, LocalBlob, LocalStorage  # noqa: E402
+
+# Seconds of a DataStore lookup or write of one chunk
+LATENCY = 0.03
+
+
+def rows(count, changed=()):
+    # DataStore ids start at 1
+    return [{'id': i, 'value': 'changed' if i in changed else 'value {}'.format(i)} for i in range(1, count + 1)]
+
+
+def lookup(open_storage, new_rows):
+    start = time.perf_counter()
+    storage = open_storage()
+    open_time = time.perf_counter() - start
+    try:
+        diff = publishdiff.calculate_diff_from_state(new_rows, storage)
+    finally:
+        storage.close()
+    return diff, open_time, time.perf_counter() - start - open_time
+
+
+def sqlite_lookup(root, state, new_rows):
+    statestorage.get_bucket = LocalStorage(root).bucket
+    statestorage.storage = types.SimpleNamespace(Blob=LocalBlob)
+
+    def open_storage():
+        return statestorage.state_storage_from_specification(
+            {'type': 'sqlite', 'bucket': 'state', 'blob_name': 'state.sqlite', 'id_property': 'id'})
+
+    storage = open_storage()
+    try:
+        storage.store({row['id']: row for row in state})
+        storage.save()
+    finally:
+        storage.close()
+    return lookup(open_storage, new_rows)
+
+
+def datastore_lookup(state, new_rows):
+    client = FakeDatastoreClient(latency=LATENCY)
+    statestorage.datastore.Client = lambda: client
+
+    def open_storage():
+        return statestorage.state_storage_from_specification(
+            {'type': 'datastore', 'entity_name': 'Entity', 'id_property': 'id', 'store_hash': True})
+
+    open_storage().store({row['id']: row for row in state})
+    client.requests = client.max_concurrent = 0
+    diff, _, lookup_time = lookup(open_storage, new_rows)
+    return diff, lookup_time, client
+
+
+def main():
+    for count in [int(count) for count in sys.argv[1:]] or [10000, 100000]:
+        state = rows(count)
+        new_rows = rows(count, changed=set(range(1, count + 1, 100)))
+        print('{} rows'.format(count))
+
+        root = tempfile.mkdtemp()
+        try:
+            sqlite_diff, sqlite_open, sqlite_time = sqlite_lookup(root, state, new_rows)
+        finally:
+            shutil.rmtree(root)
+        datastore_diff, datastore_time, client = datastore_lookup(state, new_rows)
+
+        if sqlite_diff != datastore_diff or len(sqlite_diff) != len(range(1, count + 1, 100)):
+            raise AssertionError('Rows to publish of {} rows differ'.format(count))
+        print('  SQLite: opened in {:.2f} s, looked up in {:.2f} s, {:.0f} rows/s'.format(
+            sqlite_open, sqlite_time, count / sqlite_time))
+        print('  DataStore: {} lookups, at most {} at the same time, in {:.2f} s, {:.0f} rows/s'.format(
+            client.requests, client.max_concurrent, datastore_time, count / datastore_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Fixtures shared by the tests of the functions.
+
+Every function is a directory of flat modules (main, config, publishdiff, ...) that is deployed on its own, so modules
+of different functions have the same names. The load_function fixture puts one function directory on sys.path with a
+config module built from keyword arguments, and removes the modules of the function again after the test.
+"""
+import importlib
+import os
+import sys
+import types
+
+import pytest
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'functions')
+
+
+def function_module_names():
+    names = {'config'}
+    for function in os.listdir(FUNCTIONS_DIR):
+        function_dir = os.path.join(FUNCTIONS_DIR, function)
+        if os.path.isdir(function_dir):
+            names.update(os.path.splitext(name)[0] for name in os.listdir(function_dir) if name.endswith('.py'))
+    return names
+
+
+def unload_function_modules():
+    for name in function_module_names():
+        sys.modules.pop(name, None)
+
+
+@pytest.fixture
+def load_function(monkeypatch):
+    """Return a function that imports modules of a function with a config of the given values.
+
+    load_function('produce_delta_event', 'publishdiff', INBOX='inbox') returns the publishdiff module. Later calls
+    for the same function return modules that share that config, leave out the config values to keep it.
+    """
+    loaded = {}
+
+    def load(function, *module_names, **config_values):
+        if loaded.get('function') != function:
+            unload_function_modules()
+            monkeypatch.syspath_prepend(os.path.join(FUNCTIONS_DIR, function))
+            sys.modules['config'] = types.ModuleType('config')
+            loaded['function'] = function
+        sys.modules['config'].__dict__.update(config_values)
+        modules = [importlib.import_module(name) for name in module_names]
+        return modules[0] if len(modules) == 1 else modules
+
+    yield load
+    unload_function_modules()
@@ -0,0 +1,510 @@
+"""In-process stand-ins for the Google Cloud services the functions use."""
+import concurrent.futures
+import datetime
+import io
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import types
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+
+class LocalStorage:
+    """Cloud Storage stand-in that keeps the blobs of every bucket as files in a local directory.
+
+    Blob properties (generation, updated time, content type and encoding) are kept in memory. Every upload gets
+    the next generation and an updated time one second after the previous upload, so blobs sort in upload order.
+    Every request the client library would send is kept in requests as a tuple of the operation ('get' for the
+    properties of a blob, 'download', 'upload', 'list', 'copy' or 'delete'), the bucket and the blob name or prefix.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.properties = {}
+        self.generations = itertools.count(1)
+        self.lock = threading.Lock()
+        self.requests = []
+
+    def bucket(self, bucket_name):
+        return LocalBucket(self, bucket_name)
+
+    def install(self, monkeypatch, *modules):
+        """Make modules use this storage through their get_bucket, storage.Blob and blob_source.
+
+        The gs:// paths blob_source returns for pandas are replaced by the paths of the local files.
+        """
+        for module in modules:
+            if hasattr(module, 'get_bucket'):
+                monkeypatch.setattr(module, 'get_bucket', self.bucket)
+            if hasattr(module, 'storage'):
+                monkeypatch.setattr(module, 'storage', types.SimpleNamespace(Blob=LocalBlob))
+            if hasattr(module, 'blob_source'):
+                monkeypatch.setattr(module, 'blob_source', self.local_blob_source(module.blob_source))
+
+    def local_blob_source(self, blob_source):
+        def local_source(*args, **kwargs):
+            source = blob_source(*args, **kwargs)
+            if isinstance(source, str) and source.startswith('gs://'):
+                bucket_name, blob_name = source[len('gs://'):].split('/', 1)
+                self.record('download', bucket_name, blob_name)
+                return LocalBlob(blob_name, self.bucket(bucket_name)).path
+            return source
+
+        return local_source
+
+    def put(self, bucket_name, blob_name, content, content_type=None):
+        self.bucket(bucket_name).blob(blob_name).upload_from_string(content, content_type=content_type)
+
+    def read(self, bucket_name, blob_name):
+        return self.bucket(bucket_name).blob(blob_name).download_as_bytes()
+
+    def names(self, bucket_name):
+        return [blob.name for blob in self.bucket(bucket_name).list_blobs()]
+
+    def record(self, operation, bucket_name, name):
+        with self.lock:
+            self.requests.append((operation, bucket_name, name))
+
+
+class LocalBucket:
+    def __init__(self, local_storage, name):
+        self.local_storage = local_storage
+        self.name = name
+
+    def blob(self, blob_name):
+        return LocalBlob(blob_name, self)
+
+    def get_blob(self, blob_name):
+        self.local_storage.record('get', self.name, blob_name)
+        blob = LocalBlob(blob_name, self)
+        return blob if blob._exists() else None
+
+    def list_blobs(self, prefix=None):
+        self.local_storage.record('list', self.name, prefix)
+        with self.local_storage.lock:
+            names = sorted(name for bucket_name, name in self.local_storage.properties
+                           if bucket_name == self.name and name.startswith(prefix or ''))
+        return [LocalBlob(name, self) for name in names]
+
+    def copy_blob(self, blob, destination_bucket, new_name=None):
+        self.local_storage.record('copy', self.name, blob.name)
+        source = LocalBlob(blob.name, self)
+        copy = LocalBlob(new_name or blob.name, destination_bucket)
+        copy.content_encoding = source.content_encoding
+        copy._write(source._read(), source.content_type)
+        return copy
+
+
+class LocalBlob:
+    def __init__(self, name, bucket, **kwargs):
+        self.name = name
+        self.bucket = bucket
+        self.content_encoding = None
+        self.content_type = None
+        self.generation = None
+        self.updated = None
+        self.size = None
+        self.reload()
+
+    @property
+    def path(self):
+        return os.path.join(self.bucket.local_storage.root, self.bucket.name, self.name)
+
+    def _key(self):
+        return self.bucket.name, self.name
+
+    def reload(self):
+        properties = self.bucket.local_storage.properties.get(self._key())
+        if properties is not None:
+            self.__dict__.update(properties)
+
+    def _exists(self):
+        return self._key() in self.bucket.local_storage.properties
+
+    def exists(self):
+        self.bucket.local_storage.record('get', self.bucket.name, self.name)
+        return self._exists()
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        self.bucket.local_storage.record('upload', self.bucket.name, self.name)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._write(data, content_type, if_generation_match)
+
+    def _write(self, data, content_type, if_generation_match=None):
+        local_storage = self.bucket.local_storage
+        with local_storage.lock:
+            current = local_storage.properties.get(self._key(), {}).get('generation', 0)
+            if if_generation_match is not None and if_generation_match != current:
+                raise PreconditionFailed('{} is at generation {}, not {}'.format(
+                    self.name, current, if_generation_match))
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'wb') as file:
+                file.write(data)
+            generation = next(local_storage.generations)
+            properties = {
+                'content_encoding': self.content_encoding,
+                'content_type': content_type,
+                'generation': generation,
+                'updated': datetime.datetime(2021, 1, 1) + datetime.timedelta(seconds=generation),
+                'size': len(data),
+            }
+            local_storage.properties[self._key()] = properties
+        self.__dict__.update(properties)
+
+    def upload_from_filename(self, filename, content_type=None, if_generation_match=None):
+        with open(filename, 'rb') as file:
+            self.upload_from_string(file.read(), content_type=content_type, if_generation_match=if_generation_match)
+
+    def download_as_bytes(self, start=None, end=None, raw_download=False):
+        self.bucket.local_storage.record('download', self.bucket.name, self.name)
+        data = self._read()
+        return data[start or 0:None if end is None else end + 1]
+
+    def _read(self):
+        if not self._exists():
+            raise NotFound('{} not found in {}'.format(self.name, self.bucket.name))
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+    download_as_string = download_as_bytes
+
+    def download_to_filename(self, filename):
+        with open(filename, 'wb') as file:
+            file.write(self.download_as_bytes())
+
+    def open(self, mode='rb'):
+        return io.BytesIO(self.download_as_bytes())
+
+    def delete(self):
+        self.bucket.local_storage.record('delete', self.bucket.name, self.name)
+        with self.bucket.local_storage.lock:
+            if self.bucket.local_storage.properties.pop(self._key(), None) is None:
+                raise NotFound('{} not found in {}'.format(self.name, self.bucket.name))
+            os.remove(self.path)
+
+
+class FakeGCSServer(ThreadingHTTPServer):
+    """Local HTTP server that answers the Cloud Storage JSON API requests the storage client library sends.
+
+    Objects are kept in memory. Every request is kept in requests as a tuple of the HTTP method and the path, and
+    the number of connections that were opened in connections. Set STORAGE_EMULATOR_HOST to url to use it.
+    Listings return pages of page_size objects, every request sleeps latency seconds.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, page_size=1000, latency=0.0):
+        super().__init__(('127.0.0.1', 0), _FakeGCSHandler)
+        self.url = 'http://127.0.0.1:{}'.format(self.server_address[1])
+        self.page_size = page_size
+        self.latency = latency
+        self.objects = {}
+        # Sorted names of the objects of every bucket, made by the first listing after a change
+        self.names = {}
+        self.generations = itertools.count(1)
+        self.requests = []
+        self.connections = 0
+        self.lock = threading.RLock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def put(self, bucket_name, name, data, content_type=None):
+        """Store an object without a request, like a file that was uploaded by another service."""
+        with self.lock:
+            generation = next(self.generations)
+            self.names.pop(bucket_name, None)
+            self.objects[bucket_name, name] = {
+                'data': data, 'contentType': content_type or 'application/octet-stream', 'generation': generation,
+                'updated': datetime.datetime(2021, 1, 1) + datetime.timedelta(seconds=generation)}
+
+    def resource(self, bucket_name, name):
+        stored = self.objects[bucket_name, name]
+        return {
+            'kind': 'storage#object', 'id': '{}/{}/{}'.format(bucket_name, name, stored['generation']),
+            'bucket': bucket_name, 'name': name, 'contentType': stored['contentType'],
+            'generation': str(stored['generation']), 'metageneration': '1', 'size': str(len(stored['data'])),
+            'updated': stored['updated'].strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+        }
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _FakeGCSHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+    def handle_request(self, method):
+        url = urlsplit(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests.append((method, url.path))
+            routes = [
+                ('GET', r'/storage/v1/b/([^/]+)', self.get_bucket),
+                ('GET', r'/storage/v1/b/([^/]+)/o', self.list_objects),
+                ('GET', r'/storage/v1/b/([^/]+)/o/([^/]+)', self.get_object),
+                ('GET', r'/download/storage/v1/b/([^/]+)/o/([^/]+)', self.download_object),
+                ('POST', r'/upload/storage/v1/b/([^/]+)/o', self.upload_object),
+                ('POST', r'/storage/v1/b/([^/]+)/o/([^/]+)/copyTo/b/([^/]+)/o/([^/]+)', self.copy_object),
+                ('DELETE', r'/storage/v1/b/([^/]+)/o/([^/]+)', self.delete_object),
+            ]
+            for route_method, pattern, route in routes:
+                match = re.fullmatch(pattern, url.path)
+                if method == route_method and match:
+                    try:
+                        status, content, headers = route(query, body, *map(unquote, match.groups()))
+                    except KeyError:
+                        status, content, headers = 404, {'error': {'code': 404, 'message': 'Not Found'}}, {}
+                    break
+            else:
+                status, content, headers = 400, {'error': {'code': 400, 'message': 'Unknown request'}}, {}
+        if isinstance(content, dict):
+            content = json.dumps(content).encode('utf-8')
+            headers = dict(headers, **{'Content-Type': 'application/json'})
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def get_bucket(self, query, body, bucket_name):
+        return 200, {'kind': 'storage#bucket', 'id': bucket_name, 'name': bucket_name}, {}
+
+    def list_objects(self, query, body, bucket_name):
+        if bucket_name not in self.server.names:
+            self.server.names[bucket_name] = sorted(
+                name for bucket, name in self.server.objects if bucket == bucket_name)
+        names = [name for name in self.server.names[bucket_name] if name.startswith(query.get('prefix', ''))]
+        start = int(query.get('pageToken', 0))
+        end = start + self.server.page_size
+        listing = {'kind': 'storage#objects',
+                   'items': [self.server.resource(bucket_name, name) for name in names[start:end]]}
+        if end < len(names):
+            listing['nextPageToken'] = str(end)
+        return 200, listing, {}
+
+    def get_object(self, query, body, bucket_name, name):
+        return 200, self.server.resource(bucket_name, name), {}
+
+    def download_object(self, query, body, bucket_name, name):
+        data = self.server.objects[bucket_name, name]['data']
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match is None:
+            return 200, data, {}
+        start, end = int(match.group(1)), int(match.group(2) or len(data) - 1)
+        return 206, data[start:end + 1], {'Content-Range': 'bytes {}-{}/{}'.format(start, end, len(data))}
+
+    def upload_object(self, query, body, bucket_name):
+        # A multipart upload holds the object resource and the data, separated by the boundary of the content type
+        boundary = self.headers['Content-Type'].split('boundary=')[1].strip('"').encode('ascii')
+        parts = [part.partition(b'\r\n\r\n')[2][:-2] for part in body.split(b'--' + boundary)[1:3]]
+        resource = json.loads(parts[0])
+        current = self.server.objects.get((bucket_name, resource['name']), {}).get('generation', 0)
+        if 'ifGenerationMatch' in query and int(query['ifGenerationMatch']) != current:
+            return 412, {'error': {'code': 412, 'message': 'Precondition Failed'}}, {}
+        self.server.put(bucket_name, resource['name'], parts[1], resource.get('contentType'))
+        return 200, self.server.resource(bucket_name, resource['name']), {}
+
+    def copy_object(self, query, body, bucket_name, name, destination_bucket, destination_name):
+        stored = self.server.objects[bucket_name, name]
+        self.server.put(destination_bucket, destination_name, stored['data'], stored['contentType'])
+        return 200, self.server.resource(destination_bucket, destination_name), {}
+
+    def delete_object(self, query, body, bucket_name, name):
+        del self.server.objects[bucket_name, name]
+        self.server.names.pop(bucket_name, None)
+        return 204, b'', {}
+
+
+class FakePublisher:
+    """Pub/Sub publisher stand-in whose futures resolve on another thread after latency seconds.
+
+    The futures of payloads for which fail returns True get an exception, like messages the service rejected.
+    Every published payload is kept in published, in the order of the publish calls.
+    """
+
+    def __init__(self, latency=0.0, fail=None):
+        self.latency = latency
+        self.fail = fail
+        self.published = []
+        self.message_ids = itertools.count()
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+
+    def topic_path(self, project_id, topic_name):
+        return 'projects/{}/topics/{}'.format(project_id, topic_name)
+
+    def publish(self, topic_path, data, **attributes):
+        with self.lock:
+            self.published.append((topic_path, data, attributes))
+            message_id = str(next(self.message_ids))
+        return self.executor.submit(self._send, data, message_id)
+
+    def _send(self, data, message_id):
+        time.sleep(self.latency)
+        if self.fail is not None and self.fail(data):
+            raise RuntimeError('Message {} was rejected'.format(message_id))
+        return message_id
+
+    def payloads(self):
+        return [data for _, data, _ in self.published]
+
+    def close(self):
+        self.executor.shutdown()
+
+
+class FakeBatchingPublisher:
+    """Pub/Sub publisher stand-in that sends messages in batches, like the PublisherClient of the client library.
+
+    A batch is sent when it holds max_messages messages or max_latency seconds after its first message. Creating a
+    publisher takes client_latency seconds and every publish request, one per batch, takes request_latency seconds.
+    The numbers of publishers created and of requests sent by all of them are counted in the shared stats dict, with
+    the payloads they sent in the order of the requests.
+    """
+
+    # Publishers of one run share their stats
+    stats_lock = threading.Lock()
+
+    def __init__(self, stats, max_messages=100, max_latency=0.01, client_latency=0.0, request_latency=0.0):
+        time.sleep(client_latency)
+        self.stats = stats
+        self.max_messages = max_messages
+        self.max_latency = max_latency
+        self.request_latency = request_latency
+        self.batch = []
+        self.timer = None
+        self.lock = threading.Lock()
+        with self.stats_lock:
+            stats['clients'] = stats.get('clients', 0) + 1
+
+    def topic_path(self, project_id, topic_name):
+        return 'projects/{}/topics/{}'.format(project_id, topic_name)
+
+    def publish(self, topic_path, data, **attributes):
+        future = concurrent.futures.Future()
+        with self.lock:
+            self.batch.append((future, data))
+            if len(self.batch) == self.max_messages:
+                batch, self.batch = self.batch, []
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+            else:
+                batch = None
+                if self.timer is None:
+                    self.timer = threading.Timer(self.max_latency, self._send_partial)
+                    self.timer.start()
+        if batch:
+            threading.Thread(target=self._send, args=(batch,)).start()
+        return future
+
+    def _send_partial(self):
+        with self.lock:
+            batch, self.batch, self.timer = self.batch, [], None
+        if batch:
+            self._send(batch)
+
+    def _send(self, batch):
+        time.sleep(self.request_latency)
+        with self.stats_lock:
+            self.stats['requests'] = self.stats.get('requests', 0) + 1
+            payloads = self.stats.setdefault('payloads', [])
+            message_ids = range(len(payloads), len(payloads) + len(batch))
+            payloads.extend(data for _, data in batch)
+        for (future, _), message_id in zip(batch, message_ids):
+            future.set_result(str(message_id))
+
+
+class FakeDatastoreClient:
+    """DataStore client stand-in that keeps entities in a dict and sleeps latency seconds in every request.
+
+    The largest number of requests that were handled at the same time is kept in max_concurrent.
+    """
+
+    def __init__(self, latency=0.0):
+        from google.cloud import datastore
+
+        self.datastore = datastore
+        self.latency = latency
+        self.entities = {}
+        self.requests = 0
+        self.in_progress = 0
+        self.max_concurrent = 0
+        self.lock = threading.Lock()
+
+    def key(self, kind, name):
+        return self.datastore.Key(kind, name, project='test')
+
+    @contextmanager
+    def _request(self):
+        with self.lock:
+            self.requests += 1
+            self.in_progress += 1
+            self.max_concurrent = max(self.max_concurrent, self.in_progress)
+        try:
+            time.sleep(self.latency)
+            yield
+        finally:
+            with self.lock:
+                self.in_progress -= 1
+
+    def get_multi(self, keys, missing=None):
+        with self._request():
+            found = []
+            for key in keys:
+                if key in self.entities:
+                    entity = self.datastore.Entity(key=key)
+                    entity.update(self.entities[key])
+                    found.append(entity)
+                elif missing is not None:
+                    missing.append(self.datastore.Entity(key=key))
+            return found
+
+    def put_multi(self, entities):
+        with self._request():
+            for entity in entities:
+                self.entities[entity.key] = dict(entity)
+
+
+class FakeSecretClient:
+    """Secret Manager client stand-in that returns the current value of every secret and counts the accesses."""
+
+    def __init__(self, secrets):
+        self.secrets = dict(secrets)
+        self.accesses = 0
+
+    def secret_version_path(self, project_id, secret_id, version):
+        return 'projects/{}/secrets/{}/versions/{}'.format(project_id, secret_id, version)
+
+    def access_secret_version(self, request):
+        self.accesses += 1
+        secret_id = request['name'].split('/')[3]
+        return types.SimpleNamespace(payload=types.SimpleNamespace(data=self.secrets[secret_id].encode('UTF-8')))
@@ -0,0 +1,29 @@
+"""load_odata of datastore_delta_event as it was before the feed was parsed incrementally.
+
+It parses the whole feed into a tree and is kept unchanged, to check iter_odata yields the same entries and to time
+and measure it against.
+"""
+import logging
+
+import pandas as pd
+from defusedxml import ElementTree
+
+
+def load_odata(xml_data):
+    xml_tree = ElementTree.XML(xml_data)
+    if not xml_tree.tag.endswith('}feed'):
+        logging.warning('Root XML element is expected to be "feed"')
+        return pd.DataFrame()
+    namespace = xml_tree.tag[:-4]
+    entries_list = []
+    for entry in xml_tree.findall(f'{namespace}entry'):
+        content = entry.find(f'{namespace}content')
+        if content:
+            entry_dict = {}
+            for properties in content:
+                if properties.tag.endswith('}properties'):
+                    for prop in properties:
+                        if prop.text:
+                            entry_dict[prop.tag.split('}')[-1]] = prop.text
+                    entries_list.append(entry_dict)
+    return entries_list
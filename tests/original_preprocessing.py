@@ -0,0 +1,93 @@
+"""How file_processing preprocessed a file before its transforms were done a column at a time.
+
+The columns are normalized, combined and hashed with apply, a Python call for every value and for every row of a
+combine. The frame is passed in instead of being read from a bucket and the config is an argument. Kept unchanged
+otherwise, to check the files are the same and to time them against.
+"""
+import hashlib
+import io
+import json
+import logging
+import unicodedata
+
+import pandas as pd
+
+
+def preprocessing(df, blob_name, config):
+    logging.info('Preprocess start')
+
+    # Check if contains the correct columns
+    cols_exp = set(list(config.COLUMN_MAPPING.keys()))
+    cols_present = set(list(df))
+
+    if cols_exp.difference(cols_present):
+        missing = cols_exp - cols_present
+        message = 'The uploaded file does not contain the correct columns.' + \
+            ' The following columns are missing: "{}".'.format(
+                '", "'.join(list(missing)))
+
+        logging.info(message)
+        return dict(
+            status='failure',
+            message=message
+        )
+
+    # Check if contains data
+    if len(df) == 0:
+        message = 'The uploaded file does not contain content'
+        logging.info(message)
+        return dict(
+            status='warning',
+            message=message
+        )
+
+    # rename the columns
+    df = df.rename(columns=config.COLUMN_MAPPING)
+
+    # remove characters from certain columns
+    if hasattr(config, 'REMOVE_CHAR_FROM_COLUMN'):
+        for key, value in config.REMOVE_CHAR_FROM_COLUMN.items():
+            df[key] = df[key].str[0:-value].str.strip()
+
+    # normalize string columns
+    if hasattr(config, 'COLUMNS_NORMALIZE'):
+        for col in config.COLUMNS_NORMALIZE:
+            df[col] = df[col].apply(lambda x: unicodedata.normalize('NFKD', x))
+
+    # combine columns
+    if hasattr(config, 'COLUMN_COMBINE'):
+        for key, value in config.COLUMN_COMBINE.items():
+            df[key] = df[value].apply(lambda x: '_'.join(x.dropna().astype(str)), axis=1)
+
+    # Columns to be hashed
+    if hasattr(config, 'COLUMNS_HASH'):
+        for col in config.COLUMNS_HASH:
+            df[col] = df[col].apply(lambda x: hashlib.sha256(x.encode()).hexdigest())
+
+    # replace '' with none values
+    for col in df.columns:
+        df.at[df[col] == '', col] = None
+
+    # Only keep non-PII columns
+    df = df[config.COLUMNS_NONPII]
+
+    # Return file as byte-stream
+    if blob_name.endswith('.xlsx'):
+        bytesIO = io.BytesIO()
+        excel_writer = pd.ExcelWriter(bytesIO, engine="xlsxwriter")
+        df.to_excel(excel_writer, sheet_name="data", index=False)
+        excel_writer.save()
+    else:
+        if hasattr(config, 'JSON_ELEMENTS'):
+            df = df.to_dict(orient='records')
+            bytesIO = {config.JSON_ELEMENTS[-1]: df}
+            bytesIO = json.dumps(bytesIO).encode('utf-8')
+        else:
+            df = df.to_json()
+            bytesIO = json.dumps(df).encode('utf-8')
+
+    return dict(
+        status='success',
+        message='file succesfully processed',
+        file=bytesIO
+    )
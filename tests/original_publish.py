@@ -0,0 +1,41 @@
+"""How produce_delta_event encoded the messages of a diff before they were batched by MessageBatcher.
+
+The rows are exported with to_json and loaded again, gathered record by record and published in batches of
+batch_message_size rows, every batch encoded on its own with json.dumps. Kept unchanged, to check the payloads are
+the same and to time and count them against.
+"""
+import json
+
+from original_gathermsg import produce_gather_publish_msg
+
+
+def produce_payloads(df_diff, gobits, batch_message_size=None, subject=None, columns_publish=None):
+    payloads = []
+
+    def publish_json(innermsg):
+        if subject:
+            sendmsg = {
+                "gobits": [gobits.to_json()],
+                subject: innermsg
+            }
+        else:
+            sendmsg = innermsg
+        payloads.append(bytes(json.dumps(sendmsg).encode('utf-8')))
+
+    rows_str = df_diff.to_json(orient='records')
+    rows_json = json.loads(rows_str)
+
+    message_batch = []
+    for row in rows_json:
+        msg_to_publish = produce_gather_publish_msg(row, columns_publish)
+        if not batch_message_size:
+            publish_json(msg_to_publish)
+        else:
+            message_batch.append(msg_to_publish)
+            if len(message_batch) == batch_message_size:
+                publish_json(message_batch)
+                message_batch = []
+
+    if message_batch:
+        publish_json(message_batch)
+    return payloads
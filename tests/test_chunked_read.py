@@ -0,0 +1,108 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+DOCUMENTS = [
+    [],
+    [{'a': 1}],
+    [1, 22, 333, -4.5e10, True, None, 'text'],
+    [{'a': 'x' * 50, 'b': [1, {'c': '"quoted" \\ é ☃'}]}, {'a': None}, {}],
+    {'before': {'rows': [0]}, 'rows': [{'id': 1}, {'id': 2}], 'after': 1},
+    {'rows': []},
+]
+
+
+@pytest.fixture(params=['produce_delta_event', 'datastore_delta_event'])
+def function(request):
+    return request.param
+
+
+@pytest.mark.parametrize('read_size', [1, 3, 7, 1 << 16])
+@pytest.mark.parametrize('document', DOCUMENTS)
+def test_iter_json_list_yields_the_items_of_the_list(load_function, monkeypatch, function, read_size, document):
+    jsonstream = load_function(function, 'jsonstream')
+    monkeypatch.setattr(jsonstream, 'READ_SIZE', read_size)
+    attribute = 'rows' if isinstance(document, dict) else None
+
+    for text in (json.dumps(document), json.dumps(document, indent=2)):
+        items = list(jsonstream.iter_json_list(io.StringIO(text), attribute))
+
+        assert items == (document['rows'] if attribute else document)
+
+
+def test_iter_json_list_reads_the_stream_incrementally(load_function, monkeypatch):
+    jsonstream = load_function('produce_delta_event', 'jsonstream')
+    monkeypatch.setattr(jsonstream, 'READ_SIZE', 10)
+    stream = io.StringIO(json.dumps({'rows': [{'id': i} for i in range(100)]}))
+
+    items = jsonstream.iter_json_list(stream, 'rows')
+
+    assert next(items) == {'id': 0}
+    assert stream.tell() < 30
+
+
+@pytest.mark.parametrize('text, error', [
+    ('{"other": []}', KeyError),
+    ('{"rows": [1, 2', ValueError),
+    ('{"rows": {}}', ValueError),
+    ('[1 2]', ValueError),
+])
+def test_iter_json_list_raises_on_invalid_documents(load_function, text, error):
+    jsonstream = load_function('produce_delta_event', 'jsonstream')
+
+    with pytest.raises(error):
+        list(jsonstream.iter_json_list(io.StringIO(text), 'rows' if text.startswith('{') else None))
+
+
+def csv_text():
+    rows = 30
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'id': range(rows),
+        'late_missing': [None if i == 25 else i for i in range(rows)],
+        'late_text': ['x{}'.format(i) if i > 20 else str(i) for i in range(rows)],
+        'late_float': [i + 0.5 if i == 28 else i for i in range(rows)],
+        'flag': [None if i == 3 else bool(i % 2) for i in range(rows)],
+        'empty': [None] * rows,
+        'number': rng.random(rows),
+    })
+    return df.to_csv(index=False)
+
+
+def test_chunked_csv_gets_the_dtypes_and_values_of_the_whole_file(load_function, function):
+    chunkdtypes = load_function(function, 'chunkdtypes')
+    text = csv_text()
+    whole = pd.read_csv(io.StringIO(text))
+
+    columns = chunkdtypes.scan_dtypes(pd.read_csv(io.StringIO(text), chunksize=10))
+    dtypes = chunkdtypes.whole_file_dtypes(columns, parsed_from_text=True)
+    text_columns = [column for column, dtype in dtypes.items() if dtype is str]
+    chunks = [chunkdtypes.with_dtypes(df_chunk, dtypes) for df_chunk in
+              pd.read_csv(io.StringIO(text), chunksize=10, dtype={column: str for column in text_columns})]
+
+    assert text_columns == ['late_text']
+    pd.testing.assert_frame_equal(pd.concat(chunks), whole)
+    # The column of numbers and text is read as text, every column holds one kind of values
+    assert chunkdtypes.holds_one_kind(columns, dtypes)
+
+
+def test_chunked_records_get_the_dtypes_and_values_of_all_records(load_function, function):
+    chunkdtypes = load_function(function, 'chunkdtypes')
+    records = [{'id': i, 'late_missing': None if i == 25 else i, 'mixed': 'x' if i > 20 else i,
+                'flag': None if i == 3 else bool(i % 2), 'empty': None} for i in range(30)]
+    # A record without an attribute misses its value
+    del records[12]['late_missing']
+    whole = pd.DataFrame(records)
+
+    chunk_records = [records[start:start + 10] for start in range(0, len(records), 10)]
+    columns = chunkdtypes.scan_dtypes(pd.DataFrame(chunk) for chunk in chunk_records)
+    dtypes = chunkdtypes.whole_file_dtypes(columns)
+    chunks = [chunkdtypes.with_dtypes(pd.DataFrame(chunk, columns=list(columns)), dtypes) for chunk in chunk_records]
+
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), whole)
+    # Numbers and text of the mixed column can only be told apart by their values
+    assert not chunkdtypes.holds_one_kind(columns, dtypes)
+    assert chunkdtypes.holds_one_kind({column: kinds for column, kinds in columns.items() if column != 'mixed'}, dtypes)
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'functions')
+sys.path.insert(0, FUNCTIONS_DIR)
+import coldstart  # noqa: E402
+
+STORAGE_TRIGGERED = ['produce_delta_event', 'datastore_delta_event', 'file_processing']
+
+
+@pytest.fixture
+def profile(tmp_path):
+    """Return a function that profiles a cold start of a function with FILEPATH_PREFIX_FILTER 'source/'."""
+    (tmp_path / 'config.py').write_text("FILEPATH_PREFIX_FILTER = 'source/'\n")
+
+    def run(function):
+        return coldstart.profile(os.path.join(FUNCTIONS_DIR, function), str(tmp_path),
+                                 coldstart.ENTRY_POINTS[function], coldstart.read_prefix_filter(str(tmp_path)))
+
+    return run
+
+
+@pytest.mark.parametrize('function', STORAGE_TRIGGERED)
+def test_skipped_files_load_no_heavy_modules(profile, function):
+    result, _ = profile(function)
+
+    assert result['loaded'] == []
+    # Skipping a file only logs a line
+    assert result['skip'] < 0.1
+
+
+@pytest.mark.parametrize('function', STORAGE_TRIGGERED)
+def test_main_only_imports_config_and_logging(profile, function):
+    _, modules = profile(function)
+
+    assert modules[-1][0] == 'main'
+    assert {name for name, _, _, depth in modules if depth == 1} <= {'config', 'logging'}
+
+
+def test_importtime_lists_the_modules_main_imports_before_main():
+    output = '\n'.join([
+        'import time: self [us] | cumulative | imported package',
+        'import time:       100 |        100 | site',
+        'import time:        20 |         20 |     _json',
+        'import time:       300 |        320 |   json',
+        'import time:        10 |         10 |   config',
+        'import time:        50 |        380 | main',
+        'import time:        40 |         40 | time',
+    ])
+
+    assert coldstart.parse_importtime(output) == [
+        ('_json', 20, 20, 2), ('json', 300, 320, 1), ('config', 10, 10, 1), ('main', 50, 380, 0)]
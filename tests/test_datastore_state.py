@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+from fakes import FakeDatastoreClient, FakePublisher
+
+CONFIG = {
+    'TOPIC_SETTINGS': {'topic_project_id': 'project', 'topic_name': 'topic'},
+    'TOPIC_BATCH_SETTINGS': {},
+    'DATASTORE_CHUNK_SIZE': 10,
+}
+SPECIFICATION = {'type': 'datastore', 'entity_name': 'Entity', 'id_property': 'id'}
+
+
+@pytest.fixture
+def datastore_state(load_function, monkeypatch):
+    """Return a function that opens DatastoreStateStorage on a fake DataStore with the given latency and concurrency."""
+    publishdiff, statestorage = load_function('datastore_delta_event', 'publishdiff', 'statestorage', **CONFIG)
+    publisher = FakePublisher()
+    monkeypatch.setattr(publishdiff, 'get_publisher', lambda: publisher)
+
+    def open_storage(client, concurrency, store_hash=False):
+        load_function('datastore_delta_event', DATASTORE_CONCURRENCY=concurrency)
+        monkeypatch.setattr(statestorage.datastore, 'Client', lambda: client)
+        return statestorage.state_storage_from_specification(dict(SPECIFICATION, store_hash=store_hash))
+
+    open_storage.publishdiff = publishdiff
+    open_storage.publisher = publisher
+    yield open_storage
+    publisher.close()
+
+
+def items(count, changed=()):
+    # DataStore ids start at 1
+    return [{'id': i, 'value': 'changed' if i in changed else 'value {}'.format(i)} for i in range(1, count + 1)]
+
+
+def fill(client, storage, state):
+    storage.store({item['id']: item for item in state})
+    client.requests = client.max_concurrent = 0
+
+
+@pytest.mark.parametrize('store_hash', [False, True])
+def test_concurrent_lookups_return_the_same_rows_in_the_same_order(datastore_state, store_hash):
+    results = []
+    for concurrency in (1, 4):
+        client = FakeDatastoreClient()
+        storage = datastore_state(client, concurrency, store_hash)
+        fill(client, storage, items(60))
+
+        results.append(datastore_state.publishdiff.calculate_diff_from_state(
+            items(80, changed={3, 17, 42}), storage))
+
+    assert results[0] == results[1]
+    assert sorted(row['id'] for row in results[1]) == [3, 17, 42] + list(range(61, 81))
+
+
+def test_lookups_run_concurrently(datastore_state):
+    elapsed = {}
+    for concurrency in (1, 4):
+        client = FakeDatastoreClient(latency=0.05)
+        storage = datastore_state(client, concurrency)
+
+        start = time.perf_counter()
+        datastore_state.publishdiff.calculate_diff_from_state(items(80), storage)
+        elapsed[concurrency] = time.perf_counter() - start
+
+        assert client.requests == 8
+        assert client.max_concurrent == concurrency
+
+    assert elapsed[4] < elapsed[1] / 2
+
+
+def test_published_rows_are_stored_concurrently_with_the_latest_state_last(datastore_state):
+    client = FakeDatastoreClient(latency=0.01)
+    storage = datastore_state(client, 4)
+    # Every key occurs in several chunks, its last row has to be stored
+    rows = [{'id': i % 15 + 1, 'value': 'version {}'.format(i)} for i in range(100)]
+
+    datastore_state.publishdiff.publish_rows(None, rows, storage, batch_message_size=None)
+
+    assert client.max_concurrent > 1
+    assert {key.id_or_name: entity['value'] for key, entity in client.entities.items()} == \
+        {row['id']: row['value'] for row in rows[85:]}
+    assert len(datastore_state.publisher.published) == 100
+    assert datastore_state.publishdiff.calculate_diff_from_state(rows[85:], storage) == []
+
+
+def test_store_hash_migrates_from_full_entities(datastore_state):
+    client = FakeDatastoreClient()
+    fill(client, datastore_state(client, 4), items(30))
+    storage = datastore_state(client, 4, store_hash=True)
+    calculate_diff_from_state = datastore_state.publishdiff.calculate_diff_from_state
+
+    # Full entities are compared attribute by attribute, the entities of published rows are replaced by a hash
+    diff = calculate_diff_from_state(items(30, changed={4, 21}), storage)
+    datastore_state.publishdiff.publish_rows(None, diff, storage, batch_message_size=None)
+
+    assert [row['id'] for row in diff] == [4, 21]
+    hashed = {key.id_or_name for key, entity in client.entities.items() if list(entity) == ['_state_hash']}
+    assert hashed == {4, 21}
+    assert calculate_diff_from_state(items(30, changed={4, 21}), storage) == []
+    assert [row['id'] for row in calculate_diff_from_state(items(30), storage)] == [4, 21]
+    # The hash does not depend on the order of the attributes
+    assert calculate_diff_from_state([dict(reversed(list(row.items()))) for row in items(30, changed={4, 21})],
+                                     storage) == []
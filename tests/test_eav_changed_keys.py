@@ -0,0 +1,177 @@
+import datetime
+import json
+from operator import itemgetter
+
+import pandas as pd
+import pytest
+import sqlalchemy
+
+from fakes import FakePublisher
+
+CONFIG = {
+    'FULL_LOAD': False,
+    'SOURCE': 'source',
+    'TOPIC_SETTINGS': {'topic_project_id': 'project', 'topic_name': 'topic'},
+    'TOPIC_BATCH_SETTINGS': {},
+    'ImportMeasureValues': 'importMeasureValues',
+    'ImportKeys': 'importKeys',
+    'Subscriptions': 'subscriptions',
+}
+# How the versions of a key changed, the keys of the first three kinds have a row that differs from yesterday. A key
+# that only got a measure that is new to the source is only published when reading in chunks.
+PUBLISHED_KINDS = ['changed', 'new', 'missing_value']
+KINDS = PUBLISHED_KINDS + ['new_measure', 'same', 'same', 'same', 'changed_before_yesterday', 'ended', 'deleted',
+                           'other_source']
+KEYS = 220
+
+# The pivot addresses the columns of the query result by position, newer pandas name them after the selected columns
+pytestmark = pytest.mark.skipif(not pd.__version__.startswith('1.2.'),
+                                reason='eav_delta_producer needs the pandas 1.2 of its requirements.txt')
+
+
+class EAVDatabase:
+    """SQLite stand-in for the MySQL database of eav_delta_producer, with the tables of models.py."""
+
+    def __init__(self, models, path, indexed=True):
+        self.models = models
+        self.url = 'sqlite:///{}'.format(path)
+        engine = sqlalchemy.create_engine(self.url)
+        models.Base.metadata.create_all(engine, tables=[models.ImportKeys.__table__, models.Subscriptions.__table__])
+        with engine.begin() as connection:
+            # The values of a key version have one row per measure. Without an index, the rows are read in the order
+            # they were added
+            connection.exec_driver_sql(
+                'CREATE TABLE "importMeasureValues" ("importId" INTEGER NOT NULL, "sourceId" INTEGER NOT NULL, '
+                '"sourceKey" VARCHAR(128) NOT NULL, measure VARCHAR(128) NOT NULL, value TEXT, '
+                '"valueDate" DATETIME NOT NULL{})'.format(', PRIMARY KEY ("importId", measure)' if indexed else ''))
+            connection.execute(models.Subscriptions.__table__.insert(), [
+                {'stagingSourceTag': 'staging', 'sourceTag': 'source', 'name': 'source'},
+                {'stagingSourceTag': 'other_staging', 'sourceTag': 'other', 'name': 'other'}])
+        engine.dispose()
+        self.keys = []
+        self.values = []
+
+    def add(self, key, version, version_end, measures, tag='staging', delete=0):
+        import_id = len(self.keys) + 1
+        self.keys.append({'id': import_id, 'sourceTag': tag, 'sourceKey': key, 'delete': delete,
+                          'version': version, 'versionEnd': version_end})
+        self.values.extend({'importId': import_id, 'sourceId': 1, 'sourceKey': key, 'measure': measure,
+                            'value': value, 'valueDate': version} for measure, value in measures.items())
+
+    def commit(self):
+        engine = sqlalchemy.create_engine(self.url)
+        with engine.begin() as connection:
+            connection.execute(self.models.ImportKeys.__table__.insert(), self.keys)
+            connection.execute(self.models.ImportMeasureValues.__table__.insert(), self.values)
+        engine.dispose()
+
+
+def fill(database, count):
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time(0, 5))
+    long_ago = today - datetime.timedelta(days=30)
+    before_yesterday = today - datetime.timedelta(days=2, hours=-3)
+
+    for i in range(count):
+        key = 'key {:04d}'.format(i)
+        kind = KINDS[i % len(KINDS)]
+        measures = {'measure {}'.format(m): 'value  {} {}'.format(i, m) for m in range(4) if m == 0 or (i + m) % 5}
+        if kind == 'same':
+            database.add(key, long_ago, None, measures)
+        elif kind == 'other_source':
+            database.add(key, today, None, measures, tag='other_staging')
+        elif kind == 'new':
+            database.add(key, today, None, measures)
+        elif kind == 'changed_before_yesterday':
+            database.add(key, long_ago, before_yesterday, measures)
+            database.add(key, before_yesterday, None, dict(measures, **{'measure 1': 'x'}))
+        else:
+            changed = today
+            database.add(key, long_ago, changed, measures)
+            if kind == 'changed':
+                database.add(key, changed, None, dict(measures, **{'measure 0': 'new\nvalue {}'.format(i)}))
+            elif kind == 'new_measure':
+                database.add(key, changed, None, dict(measures, extra='extra'))
+            elif kind == 'missing_value':
+                database.add(key, changed, None, dict(measures, **{'measure 0': None}))
+            elif kind == 'deleted':
+                database.add(key, changed, None, measures, delete=1)
+    database.commit()
+
+
+@pytest.fixture
+def eav(load_function, monkeypatch, tmp_path):
+    """Return a function that runs the handler of eav_delta_producer on a SQLite database and returns the rows."""
+    main, models = load_function('eav_delta_producer', 'main', 'models', **CONFIG)
+    database = EAVDatabase(models, tmp_path / 'eav.sqlite')
+    fill(database, KEYS)
+    monkeypatch.setattr(main, 'database_url', lambda refresh_secret=False: database.url)
+    monkeypatch.setattr(main, '_engine', None)
+    publisher = FakePublisher()
+    monkeypatch.setattr(main, 'get_publisher', lambda: publisher)
+
+    def run(changed_keys_only, chunked_read_size=None):
+        load_function('eav_delta_producer', CHANGED_KEYS_ONLY=changed_keys_only)
+        if chunked_read_size is None:
+            monkeypatch.delattr(main.config, 'CHUNKED_READ_SIZE', raising=False)
+        else:
+            monkeypatch.setattr(main.config, 'CHUNKED_READ_SIZE', chunked_read_size, raising=False)
+        publisher.published.clear()
+        main.handler(None)
+        return [row for payload in publisher.payloads() for row in json.loads(payload)['data']]
+
+    yield run
+    publisher.close()
+    if main._engine is not None:
+        main._engine.dispose()
+
+
+def kind_of(row):
+    # Every key has a value of measure 1 or 2 that holds its number
+    value = row['measure 1'] or row['measure 2']
+    return KINDS[int(value.split()[1]) % len(KINDS)]
+
+
+def test_changed_keys_only_publishes_the_rows_of_all_keys(eav):
+    published = eav(False)
+
+    assert eav(True) == published
+    assert sorted(set(map(kind_of, published))) == sorted(PUBLISHED_KINDS)
+    assert len(published) == KEYS // len(KINDS) * len(PUBLISHED_KINDS)
+
+
+def test_chunked_changed_keys_only_publishes_the_rows_of_all_keys(eav):
+    published = eav(False, chunked_read_size=7)
+
+    assert eav(True, chunked_read_size=7) == published
+    assert sorted(set(map(kind_of, published))) == sorted(PUBLISHED_KINDS + ['new_measure'])
+    assert sorted((row for row in published if kind_of(row) != 'new_measure'), key=json.dumps) == \
+        sorted(eav(False), key=json.dumps)
+
+
+def test_changed_rows_have_a_column_for_every_measure_of_the_source(eav):
+    published = eav(True)
+
+    assert all(sorted(row) == ['extra', 'measure 0', 'measure 1', 'measure 2', 'measure 3'] for row in published)
+    # Line breaks and repeated spaces in values are replaced by one space
+    assert all(value is None or '\n' not in value and '  ' not in value for row in published for value in row.values())
+
+
+def test_chunks_hold_every_key_once_when_its_rows_are_not_next_to_each_other(load_function, monkeypatch, tmp_path):
+    main, models = load_function('eav_delta_producer', 'main', 'models', **CONFIG)
+    database = EAVDatabase(models, tmp_path / 'eav.sqlite', indexed=False)
+    # Keys that only differ in case, trailing spaces or leading zeros are different keys in the pivot
+    keys = ['a', 'A', 'a ', 'b', 'B', 'é', 'key 1', 'key 2', '1', '01']
+    version = datetime.datetime(2021, 1, 1)
+    for key in keys:
+        database.add(key, version, None, {'measure {}'.format(m): '{}/{}'.format(key, m) for m in range(4)})
+    # The rows of every key are added one measure at a time, so they are read interleaved
+    database.values.sort(key=itemgetter('measure'))
+    database.commit()
+    monkeypatch.setattr(main, 'database_url', lambda refresh_secret=False: database.url)
+    monkeypatch.setattr(main, '_engine', None)
+
+    chunks = list(main.iter_query('source', 3))
+    main._engine.dispose()
+
+    assert sorted(key for df in chunks for key in df.index) == sorted(keys)
+    assert all(df.loc[key, 'measure 2'] == '{}/2'.format(key) for df in chunks for key in df.index)
@@ -0,0 +1,89 @@
+import types
+
+import pandas as pd
+import pytest
+import sqlalchemy
+
+from fakes import FakeBatchingPublisher, FakePublisher
+from test_eav_changed_keys import CONFIG, KEYS, KINDS, PUBLISHED_KINDS, EAVDatabase, fill
+
+PUBLISHED = KEYS // len(KINDS) * len(PUBLISHED_KINDS)
+
+# The pivot addresses the columns of the query result by position, newer pandas name them after the selected columns
+pytestmark = pytest.mark.skipif(not pd.__version__.startswith('1.2.'),
+                                reason='eav_delta_producer needs the pandas 1.2 of its requirements.txt')
+
+
+@pytest.fixture
+def eav(load_function, monkeypatch, tmp_path):
+    """Load main of eav_delta_producer on a SQLite database, counting the engines it creates."""
+    main, models = load_function('eav_delta_producer', 'main', 'models', **CONFIG)
+    database = EAVDatabase(models, tmp_path / 'eav.sqlite')
+    fill(database, KEYS)
+    monkeypatch.setattr(main, 'database_url', lambda refresh_secret=False: database.url)
+    monkeypatch.setattr(main, '_engine', None)
+    monkeypatch.setattr(main, '_publisher', None)
+    engines = []
+    create_engine = main.create_engine
+    monkeypatch.setattr(main, 'create_engine', lambda *args, **kwargs: engines.append(create_engine(*args, **kwargs))
+                        or engines[-1])
+    yield types.SimpleNamespace(main=main, engines=engines)
+    for engine in engines:
+        engine.dispose()
+
+
+def test_runs_publish_through_one_batched_publisher(eav, monkeypatch):
+    from google.cloud import pubsub_v1
+
+    stats = {}
+    monkeypatch.setattr(eav.main.config, 'TOPIC_BATCH_SETTINGS', {'max_messages': 25})
+    monkeypatch.setattr(pubsub_v1, 'PublisherClient',
+                        lambda batch_settings: FakeBatchingPublisher(stats, batch_settings.max_messages))
+
+    eav.main.handler(None)
+    eav.main.handler(None)
+
+    assert stats['clients'] == 1
+    assert len(stats['payloads']) == 2 * PUBLISHED
+    # Only the last messages of a run are sent in a partial batch
+    assert stats['requests'] <= 2 * (PUBLISHED // 25 + 1)
+
+
+def test_runs_wait_for_every_message(eav, monkeypatch):
+    publisher = FakePublisher(latency=0.05)
+    futures = []
+    publish = publisher.publish
+    monkeypatch.setattr(publisher, 'publish', lambda *args, **kwargs: futures.append(publish(*args, **kwargs))
+                        or futures[-1])
+    monkeypatch.setattr(eav.main, 'get_publisher', lambda: publisher)
+
+    eav.main.handler(None)
+    publisher.close()
+
+    assert len(futures) == PUBLISHED
+    assert all(future.done() for future in futures)
+
+
+def test_runs_fail_when_a_message_is_rejected(eav, monkeypatch):
+    publisher = FakePublisher(fail=lambda data: b'"value 0 1"' in data)
+    monkeypatch.setattr(eav.main, 'get_publisher', lambda: publisher)
+
+    with pytest.raises(RuntimeError, match='Failed to publish 1 of {} messages'.format(PUBLISHED)):
+        eav.main.handler(None)
+    publisher.close()
+
+
+def test_runs_share_one_engine_and_return_its_connections(eav, monkeypatch):
+    # SQLite files get no connection pool by default, MySQL gets the QueuePool
+    monkeypatch.setattr(eav.main.config, 'DATABASE_ENGINE_OPTIONS', {'poolclass': sqlalchemy.pool.QueuePool},
+                        raising=False)
+    publisher = FakePublisher()
+    monkeypatch.setattr(eav.main, 'get_publisher', lambda: publisher)
+
+    eav.main.handler(None)
+    eav.main.handler(None)
+    publisher.close()
+
+    assert len(eav.engines) == 1
+    assert eav.engines[0].pool.checkedout() == 0
+    assert eav.engines[0].pool.checkedin() == 1
@@ -0,0 +1,119 @@
+import types
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from fakes import FakeSecretClient
+
+CONFIG = {
+    'ImportMeasureValues': 'importMeasureValues',
+    'ImportKeys': 'importKeys',
+    'Subscriptions': 'subscriptions',
+    'DATABASE_SECRET_TTL': 60,
+    'database': {'db_user': 'user', 'db_name': 'db', 'instance_id': 'instance', 'project_id': 'project',
+                 'region': 'region', 'secret_name': 'password'},
+}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def eav(load_function, monkeypatch):
+    """Load main and utils of eav_delta_producer with a fake Secret Manager and a clock that only moves on request.
+
+    Connecting with an engine fails with MySQL error 1045 when its password is not the current secret.
+    """
+    main, utils = load_function('eav_delta_producer', 'main', 'utils', **CONFIG)
+    client = FakeSecretClient({'password': 'first'})
+    clock = Clock()
+    monkeypatch.setattr(utils, 'get_client', lambda: client)
+    monkeypatch.setattr(utils, 'time', clock)
+    monkeypatch.setattr(main, '_engine', None)
+    connected = []
+
+    def connect_session(engine):
+        if engine.url.password != client.secrets['password']:
+            raise OperationalError('connect', {}, Exception(1045, "Access denied for user 'user'"))
+        connected.append(engine)
+        return types.SimpleNamespace(engine=engine)
+
+    monkeypatch.setattr(main, 'connect_session', connect_session)
+    yield types.SimpleNamespace(main=main, utils=utils, client=client, clock=clock, connected=connected)
+    if main._engine is not None:
+        main._engine.dispose()
+
+
+def test_secret_is_fetched_again_when_it_expires(eav):
+    assert eav.utils.get_cached_secret('project', 'password', 60) == 'first'
+    eav.client.secrets['password'] = 'second'
+    eav.clock.now += 59
+
+    assert eav.utils.get_cached_secret('project', 'password', 60) == 'first'
+    eav.clock.now += 1
+    assert eav.utils.get_cached_secret('project', 'password', 60) == 'second'
+    assert eav.client.accesses == 2
+
+
+def test_secret_is_fetched_again_on_refresh(eav):
+    eav.utils.get_cached_secret('project', 'password', 60)
+    eav.client.secrets['password'] = 'second'
+
+    assert eav.utils.get_cached_secret('project', 'password', 60, refresh=True) == 'second'
+    assert eav.client.accesses == 2
+
+
+def test_sessions_share_the_engine_of_the_instance(eav):
+    first = eav.main.open_session()
+    second = eav.main.open_session()
+
+    assert first.engine is second.engine
+    assert eav.client.accesses == 1
+
+
+def test_rotated_password_is_fetched_again_and_the_engine_rebuilt(eav):
+    old_engine = eav.main.open_session().engine
+    eav.client.secrets['password'] = 'rotated'
+
+    session = eav.main.open_session()
+
+    assert session.engine is not old_engine
+    assert session.engine.url.password == 'rotated'
+    assert eav.client.accesses == 2
+    assert eav.main.open_session().engine is session.engine
+
+
+def test_engine_is_rebuilt_when_the_password_expires(eav):
+    old_engine = eav.main.open_session().engine
+    eav.client.secrets['password'] = 'rotated'
+    eav.clock.now += 60
+
+    assert eav.main.open_session().engine.url.password == 'rotated'
+    assert eav.main.open_session().engine is not old_engine
+    assert eav.client.accesses == 2
+
+
+def test_other_connection_errors_are_raised_without_fetching_the_password_again(eav, monkeypatch):
+    def connect_session(engine):
+        raise OperationalError('connect', {}, Exception(2003, "Can't connect to MySQL server"))
+
+    monkeypatch.setattr(eav.main, 'connect_session', connect_session)
+
+    with pytest.raises(OperationalError):
+        eav.main.open_session()
+    assert eav.client.accesses == 1
+
+
+def test_password_that_is_still_rejected_after_fetching_it_again_is_raised(eav):
+    eav.main.open_session()
+    eav.client.secrets['password'] = 'rotated'
+    eav.client.access_secret_version = lambda request: types.SimpleNamespace(
+        payload=types.SimpleNamespace(data=b'first'))
+
+    with pytest.raises(OperationalError):
+        eav.main.open_session()
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def merge_diff(df_old, df_new):
+    # How produce_delta_event compared rows before fingerprints
+    joined = df_old.merge(df_new, how='right', indicator=True)
+    return joined.query("_merge != 'both'").drop('_merge', axis=1)
+
+
+def assert_same_diff(diff, expected):
+    # A merge turns bool columns into object columns, the published JSON is the same
+    pd.testing.assert_frame_equal(diff, expected, check_dtype=False)
+    assert diff.to_json(orient='records') == expected.to_json(orient='records')
+
+
+def frames(seed):
+    rng = np.random.default_rng(seed)
+
+    def frame(rows):
+        return pd.DataFrame({
+            'id': rng.integers(0, 20, rows),
+            'name': pd.Series(rng.choice(['a', 'b', 'NA', ''], rows)).where(rng.random(rows) > 0.2, None),
+            'amount': np.where(rng.random(rows) < 0.2, np.nan, rng.integers(-2, 3, rows) * 0.5),
+            'flag': rng.random(rows) > 0.5,
+            'day': pd.Timestamp('2021-01-01') + pd.to_timedelta(rng.integers(0, 3, rows), unit='D'),
+        })
+
+    return frame(60), frame(60)
+
+
+@pytest.fixture(params=['produce_delta_event', 'eav_delta_producer'])
+def fingerprint(request, load_function):
+    return load_function(request.param, 'fingerprint')
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_diff_rows_matches_merge(fingerprint, seed):
+    df_old, df_new = frames(seed)
+
+    assert_same_diff(fingerprint.diff_rows(df_old, df_new), merge_diff(df_old, df_new))
+
+
+def test_diff_rows_matches_merge_with_duplicates_and_reordered_columns(fingerprint):
+    df_old = pd.DataFrame({'a': [1, 1, 2, 3], 'b': ['x', 'x', 'y', None]})
+    df_new = pd.DataFrame({'b': ['x', 'z', None, 'x'], 'a': [1, 1, 3, 1]})
+
+    assert_same_diff(fingerprint.diff_rows(df_old, df_new), merge_diff(df_old, df_new))
+
+
+def test_missing_values_and_negative_zero_compare_like_merge(fingerprint):
+    df_old = pd.DataFrame({'a': [0.0, np.nan], 'b': [None, 'x']})
+    df_new = pd.DataFrame({'a': [-0.0, np.nan, np.nan], 'b': [None, 'x', np.nan]})
+
+    diff = fingerprint.diff_rows(df_old, df_new)
+
+    assert_same_diff(diff, merge_diff(df_old, df_new))
+    assert len(diff) == 1
+
+
+def test_booleans_with_missing_values_are_fingerprinted(fingerprint):
+    df_old = pd.DataFrame({'a': [True, None, False]})
+    df_new = pd.DataFrame({'a': [True, None, None, False, True]})
+
+    assert fingerprint.is_fingerprintable(df_old, df_new)
+    assert_same_diff(fingerprint.diff_rows(df_old, df_new), merge_diff(df_old, df_new))
+
+
+@pytest.mark.parametrize('df_old, df_new', [
+    (pd.DataFrame({'a': [1, 'x']}), pd.DataFrame({'a': [1, 'y']})),
+    (pd.DataFrame({'a': [1, 2]}), pd.DataFrame({'a': [1.0, 3.0]})),
+    (pd.DataFrame({'a': [1, 2], 'b': [1, 2]}), pd.DataFrame({'a': [1, 3], 'c': [1, 2]})),
+])
+def test_frames_that_can_not_be_fingerprinted_are_merged(fingerprint, df_old, df_new):
+    assert not fingerprint.is_fingerprintable(df_old, df_new)
+    assert_same_diff(fingerprint.diff_rows(df_old, df_new), merge_diff(df_old, df_new))
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_dumped_fingerprints_diff_like_the_frame(fingerprint, seed):
+    df_old, df_new = frames(seed)
+
+    diff = fingerprint.diff_dumped_fingerprints(fingerprint.dump_fingerprints(df_old), df_new)
+
+    pd.testing.assert_frame_equal(diff, fingerprint.diff_rows(df_old, df_new))
+
+
+def test_dumped_fingerprints_of_other_columns_or_dtypes_do_not_match(fingerprint):
+    content = fingerprint.dump_fingerprints(pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']}))
+
+    assert fingerprint.diff_dumped_fingerprints(content, pd.DataFrame({'a': [1, 2], 'c': ['x', 'y']})) is None
+    assert fingerprint.diff_dumped_fingerprints(content, pd.DataFrame({'a': [1.0, 2.0], 'b': ['x', 'y']})) is None
+    assert fingerprint.diff_dumped_fingerprints(content, pd.DataFrame({'b': ['x', 'z'], 'a': [1, 2]})) is not None
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_calculate_diff_of_produce_delta_event_leaves_out_columns_drop_like_the_merge(load_function, seed):
+    publishdiff = load_function('produce_delta_event', 'publishdiff', COLUMNS_DROP=['day'])
+    df_old, df_new = frames(seed)
+
+    diff = publishdiff.calculate_diff(df_old, df_new)
+
+    assert_same_diff(diff, merge_diff(df_old.drop(['day'], axis=1), df_new.drop(['day'], axis=1)))
+    assert 'day' not in diff.columns
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_difference_of_eav_delta_producer_matches_the_merge_of_unique_rows(load_function, seed):
+    # The models of main.py take their table names from the config
+    main = load_function('eav_delta_producer', 'main', ImportMeasureValues='importMeasureValues',
+                         ImportKeys='importKeys', Subscriptions='subscriptions')
+    df_old, df_new = frames(seed)
+
+    assert_same_diff(main.difference(df_old, df_new), merge_diff(df_old.drop_duplicates(), df_new.drop_duplicates()))
@@ -0,0 +1,141 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from original_gathermsg import datastore_gather_publish_msg, produce_gather_publish_msg
+
+COLUMNS_PUBLISH = {
+    'lower': {'source_attribute': 'name', 'conversion': 'lowercase'},
+    'chain': {'source_attribute': ['nickname', 'name'], 'conversion': ['strip', 'uppercase']},
+    'capital': {'source_attribute': 'name', 'conversion': 'capitalize'},
+    'date': {'source_attribute': 'day', 'conversion': 'datetime', 'format_from': '%Y-%m-%d', 'format_to': '%d/%m/%Y'},
+    'timestamp': {'source_attribute': 'time', 'conversion': 'datetime'},
+    'point': {'conversion': 'geojson_point', 'longitude_attribute': 'lon', 'latitude_attribute': 'lat'},
+    'no_point': {'conversion': 'geojson_point', 'longitude_attribute': 'lon', 'latitude_attribute': 'missing'},
+    'number': {'source_attribute': 'amount', 'conversion': 'numeric'},
+    'prefixed': {'source_attribute': 'count', 'conversion': 'numeric', 'prefix_value': 7},
+    'hash': {'source_attribute': 'name', 'conversion': ['hash'], 'prefix_value': 'H'},
+    'lower_hash': {'source_attribute': 'name', 'conversion': ['lowercase', 'hash']},
+    'float': {'source_attribute': 'fraction', 'conversion': 'numeric'},
+    'missing': {'source_attribute': 'missing', 'conversion': 'lowercase'},
+    'no_source': {'conversion': 'uppercase'},
+    'plain': 'name',
+    'plain_missing': 'missing',
+    'plain_float': 'fraction',
+}
+# datastore_delta_event only knows one conversion per field, without strip and hash
+DATASTORE_COLUMNS_PUBLISH = {
+    'lower': {'source_attribute': 'name', 'conversion': 'lowercase'},
+    'upper': {'source_attribute': ['nickname', 'name'], 'conversion': 'uppercase'},
+    'capital': {'source_attribute': 'name', 'conversion': 'capitalize', 'prefix_value': 'C'},
+    'date': {'source_attribute': 'day', 'conversion': 'datetime', 'format_from': '%Y-%m-%d', 'format_to': '%d/%m/%Y'},
+    'timestamp': {'source_attribute': 'time', 'conversion': 'datetime'},
+    'point': {'conversion': 'geojson_point', 'longitude_attribute': 'lon', 'latitude_attribute': 'lat'},
+    'no_point': {'conversion': 'geojson_point', 'longitude_attribute': 'lon', 'latitude_attribute': 'missing'},
+    'number': {'source_attribute': 'amount', 'conversion': 'numeric'},
+    'prefixed': {'source_attribute': 'count', 'prefix_value': 7},
+    'unknown': {'source_attribute': 'name', 'conversion': 'hash'},
+    'missing': {'source_attribute': 'missing', 'conversion': 'lowercase'},
+    'plain': 'name',
+    'plain_missing': 'missing',
+}
+ORIGINALS = {
+    'produce_delta_event': (produce_gather_publish_msg, COLUMNS_PUBLISH),
+    'datastore_delta_event': (datastore_gather_publish_msg, DATASTORE_COLUMNS_PUBLISH),
+}
+
+
+def diff_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'name': rng.choice(['Ab', 'CD ', 'e', None, ' ÄbC '], rows),
+        'nickname': rng.choice([' Nick', None], rows),
+        'day': ['2021-0{}-1{}'.format(month, day)
+                for month, day in zip(rng.integers(1, 10, rows), rng.integers(0, 10, rows))],
+        'time': pd.to_datetime(rng.integers(0, 10 ** 9, rows), unit='s'),
+        'lon': rng.random(rows),
+        'lat': rng.random(rows).astype(str),
+        'amount': rng.choice(['1', '1.5', 'abc', '2.0', None, '1e3'], rows),
+        'count': rng.integers(0, 100, rows),
+        'fraction': np.where(rng.random(rows) < 0.1, np.nan, rng.random(rows) * 1000),
+    })
+
+
+@pytest.fixture
+def gathermsg(load_function):
+    return load_function('produce_delta_event', 'gathermsg')
+
+
+def diff_records(rows, seed=0):
+    records = json.loads(diff_frame(rows, seed).to_json(orient='records'))
+    # Records of other sources can miss attributes
+    for i, record in enumerate(records):
+        for key in list(record)[i % 3::5]:
+            del record[key]
+    return records
+
+
+@pytest.mark.parametrize('function', ORIGINALS)
+@pytest.mark.parametrize('seed', range(3))
+def test_compiled_columns_publish_matches_the_original(load_function, function, seed):
+    gathermsg = load_function(function, 'gathermsg')
+    original, columns_publish = ORIGINALS[function]
+    records = diff_records(200, seed)
+    expected = [original(record, columns_publish) for record in records]
+
+    gather = gathermsg.compile_columns_publish(columns_publish)
+
+    assert json.dumps([gather(record) for record in records]) == json.dumps(expected)
+    assert json.dumps([gathermsg.gather_publish_msg(record, columns_publish) for record in records]) == \
+        json.dumps(expected)
+    assert gathermsg.gather_publish_msg(records[0]) is records[0]
+
+
+@pytest.mark.parametrize('function', ORIGINALS)
+def test_gather_publish_msg_compiles_columns_publish_once(load_function, monkeypatch, function):
+    gathermsg = load_function(function, 'gathermsg')
+    compiled = []
+    compile_columns_publish = gathermsg.compile_columns_publish
+    monkeypatch.setattr(gathermsg, 'compile_columns_publish',
+                        lambda columns_publish: compiled.append(columns_publish) or
+                        compile_columns_publish(columns_publish))
+    columns_publish = dict(ORIGINALS[function][1])
+
+    for record in diff_records(50):
+        gathermsg.gather_publish_msg(record, columns_publish)
+    other_columns_publish = {'plain': 'name'}
+    assert gathermsg.gather_publish_msg({'name': 'a'}, other_columns_publish) == {'plain': 'a'}
+
+    assert compiled == [columns_publish, other_columns_publish]
+
+
+@pytest.mark.parametrize('rows', [1, 10, 1000])
+def test_gather_publish_df_matches_the_original(gathermsg, rows):
+    df = diff_frame(rows)
+    records = json.loads(df.to_json(orient='records'))
+    expected = [produce_gather_publish_msg(record, COLUMNS_PUBLISH) for record in records]
+
+    assert json.dumps(gathermsg.gather_publish_df(df, COLUMNS_PUBLISH)) == json.dumps(expected)
+
+
+def test_gather_publish_df_without_columns_publish(gathermsg):
+    df = diff_frame(100)
+    records = json.loads(df.to_json(orient='records'))
+
+    assert gathermsg.gather_publish_df(df) == records
+    assert [json.loads(row) for row in gathermsg.gather_publish_df(df, encoded=True)] == records
+
+
+def test_gather_publish_df_of_empty_frame(gathermsg):
+    assert gathermsg.gather_publish_df(diff_frame(0), COLUMNS_PUBLISH) == []
+
+
+def test_hash_conversion_matches_hashlib(gathermsg):
+    df = pd.DataFrame({'name': ['a', 'b', 'a', None]})
+
+    messages = gathermsg.gather_publish_df(df, {'hash': {'source_attribute': 'name', 'conversion': 'hash'}})
+
+    assert [message['hash'] for message in messages] == \
+        [gathermsg.convert_hash('a'), gathermsg.convert_hash('b'), gathermsg.convert_hash('a'), None]
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from fakes import FakeGCSServer, FakePublisher
+
+CONFIG = {
+    'INBOX': 'inbox',
+    'ARCHIVE': 'archive',
+    'ATTRIBUTE_WITH_THE_LIST': 'rows',
+    'ARCHIVE_LATEST_POINTER': True,
+    'TOPIC_SETTINGS': {'topic_project_id': 'project', 'topic_name': 'topic'},
+    'TOPIC_BATCH_SETTINGS': {},
+}
+
+
+@pytest.fixture
+def gcs_server(monkeypatch):
+    server = FakeGCSServer()
+    monkeypatch.setenv('STORAGE_EMULATOR_HOST', server.url)
+    monkeypatch.setenv('GOOGLE_CLOUD_PROJECT', 'test')
+    yield server
+    server.close()
+
+
+@pytest.mark.parametrize('function', ['produce_delta_event', 'datastore_delta_event', 'file_processing'])
+def test_one_client_and_bucket_handles_are_made_without_requests(load_function, gcs_server, function):
+    gcsclient = load_function(function, 'gcsclient')
+
+    bucket = gcsclient.get_bucket('inbox')
+
+    assert gcsclient.get_bucket('inbox') is bucket
+    assert gcsclient.get_bucket('archive') is not bucket
+    assert bucket.client is gcsclient.get_client()
+    assert gcs_server.requests == []
+
+
+def test_runs_count_their_requests_and_reuse_the_connection(load_function, monkeypatch, gcs_server):
+    publishdiff, gcsclient = load_function('produce_delta_event', 'publishdiff', 'gcsclient', **CONFIG)
+    publisher = FakePublisher()
+    monkeypatch.setattr(publishdiff, 'get_publisher', lambda: publisher)
+    requests = []
+    connections = []
+
+    for day in range(3):
+        rows = [{'id': i, 'name': 'name {}'.format(i * day if i % 3 else i)} for i in range(20)]
+        gcs_server.put('inbox', 'day{}.json'.format(day), json.dumps({'rows': rows}).encode('utf-8'))
+        gcs_server.requests.clear()
+
+        publishdiff.publish_diff({'bucket': 'inbox', 'name': 'day{}.json'.format(day)}, None)
+
+        assert sum(gcsclient.api_calls.values()) == len(gcs_server.requests)
+        requests.append(list(gcs_server.requests))
+        connections.append(gcs_server.connections)
+    publisher.close()
+
+    # Every file is read with one request for its properties and one for its content, the bucket properties are
+    # never requested. The first run lists the archive to find the previous file, later runs read the latest pointer
+    assert requests[0][2:4] == [('GET', '/download/storage/v1/b/archive/o/.latest'), ('GET', '/storage/v1/b/archive/o')]
+    assert requests[2] == [
+        ('GET', '/storage/v1/b/inbox/o/day2.json'),
+        ('GET', '/download/storage/v1/b/inbox/o/day2.json'),
+        ('GET', '/download/storage/v1/b/archive/o/.latest'),
+        ('GET', '/storage/v1/b/archive/o/day1.json'),
+        ('GET', '/download/storage/v1/b/archive/o/day1.json'),
+        ('POST', '/upload/storage/v1/b/archive/o'),
+        ('POST', '/upload/storage/v1/b/archive/o'),
+        ('DELETE', '/storage/v1/b/inbox/o/day2.json'),
+    ]
+    assert [len(requests_of_run) for requests_of_run in requests] == [7, 8, 8]
+    # The runs share one connection
+    assert connections == [1, 1, 1]
+    assert sorted(name for bucket, name in gcs_server.objects if bucket == 'archive') == [
+        '.latest', 'day0.json', 'day1.json', 'day2.json']
@@ -0,0 +1,60 @@
+import types
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+
+@pytest.fixture(params=['produce_delta_event', 'file_processing'])
+def hashing(request, load_function, monkeypatch, tmp_path):
+    """Return the hashing module of a function, with a config module on sys.path that worker processes import."""
+    (tmp_path / 'config.py').write_text('')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    hashing = load_function(request.param, 'hashing')
+    monkeypatch.setattr(hashing, 'PARALLEL_MIN_VALUES', 100)
+    monkeypatch.setattr(hashing, 'CHUNK_SIZE', 30)
+    yield hashing
+    if hashing._executor is not None:
+        hashing._executor.shutdown()
+        hashing._executor = None
+
+
+def values(count):
+    return ['value {} é'.format(i) for i in range(count)]
+
+
+def test_workers_return_the_digests_in_order_and_are_reused(hashing):
+    digests = hashing.sha256_hexdigests(values(1000), workers=2)
+    executor = hashing._executor
+
+    assert digests == hashing.hexdigests(values(1000))
+    assert hashing.sha256_hexdigests(values(500), workers=2) == digests[:500]
+    assert hashing._executor is executor
+
+
+def test_workers_default_to_the_number_of_cpus(hashing, monkeypatch):
+    started = []
+    # A pool that hashes the chunks in the calling process
+    in_process = types.SimpleNamespace(map=map)
+    monkeypatch.setattr(hashing, 'get_executor', lambda workers: started.append(workers) or in_process)
+
+    monkeypatch.setattr(hashing.os, 'cpu_count', lambda: 1)
+    assert hashing.sha256_hexdigests(values(200)) == hashing.hexdigests(values(200))
+    monkeypatch.setattr(hashing.os, 'cpu_count', lambda: 3)
+    assert hashing.sha256_hexdigests(values(200)) == hashing.hexdigests(values(200))
+
+    assert started == [3]
+
+
+def test_a_broken_pool_is_replaced(hashing, monkeypatch):
+    hashing.sha256_hexdigests(values(200), workers=2)
+    broken = hashing._executor
+
+    def map_broken(function, chunks):
+        raise BrokenProcessPool()
+
+    monkeypatch.setattr(broken, 'map', map_broken)
+    assert hashing.sha256_hexdigests(values(200), workers=2) == hashing.hexdigests(values(200))
+    assert hashing._executor is None
+
+    assert hashing.sha256_hexdigests(values(200), workers=2) == hashing.hexdigests(values(200))
+    assert hashing._executor is not broken
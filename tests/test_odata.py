@@ -0,0 +1,96 @@
+import io
+import itertools
+
+import pytest
+
+from fakes import LocalStorage
+from original_odata import load_odata
+
+ATOM = 'http://www.w3.org/2005/Atom'
+METADATA = 'http://schemas.microsoft.com/ado/2007/08/dataservices/metadata'
+DATA = 'http://schemas.microsoft.com/ado/2007/08/dataservices'
+
+
+def odata_entry(i):
+    return ('<entry><id>entry {i}</id><title type="text"/><link rel="edit" href="Items({i})"/>'
+            '<content type="application/xml"><m:properties><d:Id m:type="Edm.Int32">{i}</d:Id>'
+            '<d:Name>name &amp; {i}</d:Name><d:Empty m:null="true"/><d:Blank></d:Blank></m:properties></content>'
+            '</entry>').format(i=i)
+
+
+def odata_feed(entries, root='feed'):
+    return ('<?xml version="1.0" encoding="utf-8"?><{root} xmlns="{}" xmlns:m="{}" xmlns:d="{}"><title>Items</title>'
+            '{}</{root}>').format(ATOM, METADATA, DATA, ''.join(entries), root=root).encode('utf-8')
+
+
+FEEDS = {
+    'empty': odata_feed([]),
+    'entries': odata_feed(odata_entry(i) for i in range(5)),
+    'prefixed': ('<a:feed xmlns:a="{}" xmlns:m="{}" xmlns:d="{}"><a:entry><a:content><m:properties><d:Id>1</d:Id>'
+                 '</m:properties></a:content></a:entry></a:feed>').format(ATOM, METADATA, DATA).encode('utf-8'),
+    'without_content': odata_feed(['<entry><id>1</id></entry>', '<entry><content src="Items(2)/$value"/></entry>',
+                                   odata_entry(3)]),
+    'two_properties': odata_feed(['<entry><content><m:properties><d:Id>1</d:Id></m:properties>'
+                                  '<m:properties><d:Name>x</d:Name></m:properties></content></entry>']),
+    # Entries of an expanded navigation property are part of the entry they are in, not entries of the feed
+    'inline': odata_feed(['<entry><link><m:inline><feed><entry><content><m:properties><d:Id>9</d:Id>'
+                          '</m:properties></content></entry></feed></m:inline></link>'
+                          '<content><m:properties><d:Id>1</d:Id></m:properties></content></entry>',
+                          odata_entry(2)]),
+    'other_root': odata_feed([odata_entry(1)], root='entry'),
+}
+
+
+class ReadCounter(io.BytesIO):
+    """Binary stream that keeps the number of bytes that were read from it."""
+
+    def __init__(self, content):
+        super().__init__(content)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+@pytest.fixture
+def publishdiff(load_function):
+    return load_function('datastore_delta_event', 'publishdiff')
+
+
+@pytest.mark.parametrize('name', sorted(FEEDS))
+def test_load_odata_yields_the_entries_of_the_original(publishdiff, name):
+    entries = publishdiff.load_odata(FEEDS[name])
+
+    # The original returned an empty DataFrame when the root is not a feed
+    assert entries == (load_odata(FEEDS[name]) if name != 'other_root' else [])
+
+
+def test_entries_are_parsed_with_their_properties(publishdiff):
+    assert publishdiff.load_odata(FEEDS['entries'])[:2] == [{'Id': '0', 'Name': 'name & 0'},
+                                                            {'Id': '1', 'Name': 'name & 1'}]
+
+
+def test_iter_odata_yields_entries_before_the_feed_is_read(publishdiff):
+    stream = ReadCounter(odata_feed(odata_entry(i) for i in range(10000)))
+
+    entries = publishdiff.iter_odata(stream)
+    first = next(entries)
+
+    assert first == {'Id': '0', 'Name': 'name & 0'}
+    assert stream.bytes_read < len(stream.getvalue()) / 10
+    assert sum(1 for _ in entries) == 9999
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 100])
+def test_atom_files_are_read_in_chunks_of_entries(load_function, monkeypatch, tmp_path, chunk_size):
+    publishdiff, blobio = load_function('datastore_delta_event', 'publishdiff', 'blobio', CHUNKED_READ_SIZE=chunk_size)
+    local_storage = LocalStorage(str(tmp_path))
+    local_storage.install(monkeypatch, publishdiff, blobio)
+    local_storage.put('inbox', 'items.atom', FEEDS['entries'])
+
+    chunks = list(publishdiff.iter_data_from_store('inbox', 'items.atom'))
+
+    assert list(itertools.chain.from_iterable(chunks)) == load_odata(FEEDS['entries'])
+    assert [len(chunk) for chunk in chunks] == [min(chunk_size, 5 - i) for i in range(0, 5, chunk_size)]
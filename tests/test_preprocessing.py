@@ -0,0 +1,107 @@
+import io
+import json
+import types
+import zipfile
+
+import pandas as pd
+import pytest
+
+from fakes import LocalStorage
+from original_preprocessing import preprocessing
+
+CONFIG = {
+    'COLUMN_MAPPING': {
+        'Name': 'name', 'Project': 'project', 'Number': 'number', 'Amount': 'amount', 'Active': 'active',
+        'Email': 'email', 'Remark': 'remark',
+    },
+    'REMOVE_CHAR_FROM_COLUMN': {'remark': 2},
+    'COLUMNS_NORMALIZE': ['name', 'project'],
+    'COLUMN_COMBINE': {'key': ['number', 'project', 'remark'], 'number_amount': ['number', 'amount', 'active']},
+    'COLUMNS_HASH': ['email', 'name'],
+    'COLUMNS_NONPII': ['key', 'number_amount', 'name', 'project', 'amount', 'active', 'email', 'remark'],
+    'HASH_WORKERS': 1,
+}
+# Setting None where a column is '' with df.at takes a boolean mask in the pandas of requirements.txt only
+needs_pandas_1_2 = pytest.mark.skipif(not pd.__version__.startswith('1.2.'),
+                                      reason='file_processing needs the pandas 1.2 of its requirements.txt')
+NAMES = ['ﬁets ①', 'Café', 'Café', 'Ångström', 'x²', 'plain']
+
+
+def records(count):
+    return [{
+        'Name': NAMES[i % len(NAMES)],
+        'Project': 'Project ½ {}'.format(i % 7),
+        'Number': None if i % 5 == 0 else i,
+        'Amount': [1.5, None, 0, -2.25][i % 4],
+        'Active': [True, False, None][i % 3],
+        'Email': 'user{}@example.com'.format(i % 11),
+        'Remark': ['', 'ok!!', None, 'remark é!!'][i % 4],
+    } for i in range(count)]
+
+
+def file_content(blob_name, rows, json_elements):
+    if blob_name.endswith('.xlsx'):
+        stream = io.BytesIO()
+        pd.DataFrame(rows).to_excel(stream, index=False)
+        return stream.getvalue()
+    for element in reversed(json_elements or []):
+        rows = {element: rows}
+    return json.dumps(rows).encode('utf-8')
+
+
+def sheets(content):
+    """Return the files of an xlsx file, without the document properties that hold the time it was written."""
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        return {name: archive.read(name) for name in archive.namelist() if name != 'docProps/core.xml'}
+
+
+@pytest.fixture
+def run(load_function, monkeypatch, tmp_path):
+    """Return a function that preprocesses a file on a bucket, and preprocesses the frame it reads like before."""
+
+    def preprocess(blob_name, rows, **config):
+        processfile, blobio = load_function('file_processing', 'processfile', 'blobio', **CONFIG, **config)
+        local_storage = LocalStorage(str(tmp_path))
+        local_storage.install(monkeypatch, processfile, blobio)
+        local_storage.put('upload', blob_name, file_content(blob_name, rows, config.get('JSON_ELEMENTS')))
+
+        original = preprocessing(processfile.df_from_store('upload', blob_name), blob_name,
+                                 types.SimpleNamespace(**CONFIG, **config))
+        return processfile.preprocessing('upload', blob_name), original
+
+    return preprocess
+
+
+@needs_pandas_1_2
+@pytest.mark.parametrize('blob_name, json_elements', [
+    ('file.json', ['rows']), ('file.json', ['data', 'rows']), ('file.json', None), ('file.xlsx', None)])
+def test_files_are_the_same_as_preprocessed_with_apply(run, blob_name, json_elements):
+    config = {'JSON_ELEMENTS': json_elements} if json_elements else {}
+
+    preprocessed, original = run(blob_name, records(200), **config)
+
+    assert preprocessed['status'] == original['status'] == 'success'
+    if blob_name.endswith('.xlsx'):
+        assert sheets(preprocessed['file'].getvalue()) == sheets(original['file'].getvalue())
+    else:
+        assert preprocessed['file'] == original['file']
+
+
+@needs_pandas_1_2
+def test_files_of_one_row_are_the_same_as_preprocessed_with_apply(run):
+    preprocessed, original = run('file.json', records(1), JSON_ELEMENTS=['rows'])
+
+    assert preprocessed['file'] == original['file']
+
+
+@pytest.mark.parametrize('column', ['Name', 'Email'])
+def test_missing_values_to_normalize_or_hash_fail_like_with_apply(load_function, monkeypatch, column):
+    rows = records(20)
+    rows[3][column] = None
+
+    with pytest.raises((TypeError, AttributeError)) as original_error:
+        preprocessing(pd.DataFrame(rows), 'file.json', types.SimpleNamespace(**CONFIG))
+    processfile = load_function('file_processing', 'processfile', **CONFIG)
+    monkeypatch.setattr(processfile, 'df_from_store', lambda bucket_name, blob_name: pd.DataFrame(rows))
+    with pytest.raises(original_error.type):
+        processfile.preprocessing('upload', 'file.json')
@@ -0,0 +1,148 @@
+import json
+
+import pytest
+
+from fakes import FakePublisher, LocalStorage
+
+CONFIG = {
+    'INBOX': 'inbox',
+    'ARCHIVE': 'archive',
+    'ATTRIBUTE_WITH_THE_LIST': 'rows',
+    'TOPIC_SETTINGS': {'topic_project_id': 'project', 'topic_name': 'topic'},
+    'TOPIC_BATCH_SETTINGS': {},
+}
+
+
+@pytest.fixture
+def produce(load_function, monkeypatch, tmp_path):
+    """Return a function that runs publish_diff of produce_delta_event on a file with the given rows."""
+    publishdiff, blobio = load_function('produce_delta_event', 'publishdiff', 'blobio', **CONFIG)
+    local_storage = LocalStorage(str(tmp_path))
+    local_storage.install(monkeypatch, publishdiff, blobio)
+    publisher = FakePublisher()
+    monkeypatch.setattr(publishdiff, 'get_publisher', lambda: publisher)
+
+    archive_reads = []
+    df_from_store = publishdiff.df_from_store
+
+    def record_archive_reads(bucket_name, blob_name, from_archive=False, blob=None):
+        if from_archive:
+            archive_reads.append(blob_name)
+        return df_from_store(bucket_name, blob_name, from_archive, blob)
+
+    monkeypatch.setattr(publishdiff, 'df_from_store', record_archive_reads)
+
+    def run(filename, rows):
+        publisher.published.clear()
+        archive_reads.clear()
+        local_storage.put('inbox', filename, json.dumps({'rows': rows}))
+        publishdiff.publish_diff({'bucket': 'inbox', 'name': filename}, None)
+        return [json.loads(payload) for payload in publisher.payloads()]
+
+    run.storage = local_storage
+    run.archive_reads = archive_reads
+    yield run
+    publisher.close()
+
+
+def rows_of_day(day):
+    return [{'id': i, 'name': 'name {}'.format(i if i % 4 else i * day), 'score': i * 0.5} for i in range(12)]
+
+
+def test_fingerprints_are_stored_next_to_the_archived_file(produce, load_function):
+    load_function('produce_delta_event', ARCHIVE_FINGERPRINTS=True)
+
+    assert len(produce('day1.json', rows_of_day(1))) == 12
+
+    assert produce.storage.names('archive') == ['day1.json', 'day1.json.fingerprints']
+    assert produce.storage.names('inbox') == []
+
+
+def test_diff_from_fingerprints_does_not_read_the_archived_file(produce, load_function):
+    load_function('produce_delta_event', ARCHIVE_FINGERPRINTS=True)
+    produce('day1.json', rows_of_day(1))
+
+    published = produce('day2.json', rows_of_day(2))
+
+    assert published == [row for row in rows_of_day(2) if row['id'] % 4 == 0 and row['id'] > 0]
+    assert produce.archive_reads == []
+
+
+def test_diff_falls_back_to_the_archived_file_without_fingerprints(produce, load_function):
+    load_function('produce_delta_event', ARCHIVE_FINGERPRINTS=True)
+    produce('day1.json', rows_of_day(1))
+    produce.storage.bucket('archive').blob('day1.json.fingerprints').delete()
+
+    published = produce('day2.json', rows_of_day(2))
+
+    assert published == [row for row in rows_of_day(2) if row['id'] % 4 == 0 and row['id'] > 0]
+    assert produce.archive_reads == ['day1.json']
+
+
+def test_diff_with_and_without_fingerprints_publishes_the_same_rows(produce, load_function):
+    days = [rows_of_day(1), rows_of_day(2), rows_of_day(2)[3:] + [{'id': 99, 'name': 'new', 'score': None}]]
+
+    published = {}
+    for archive_fingerprints in (False, True):
+        prefix = 'fingerprints/' if archive_fingerprints else 'files/'
+        load_function('produce_delta_event', ARCHIVE_FINGERPRINTS=archive_fingerprints, FILEPATH_PREFIX_FILTER=prefix)
+        published[archive_fingerprints] = [
+            produce('{}day{}.json'.format(prefix, day), rows) for day, rows in enumerate(days)]
+
+    assert published[True] == published[False]
+    assert published[True][2] == [{'id': 99, 'name': 'new', 'score': None}]
+
+
+def test_fingerprints_are_not_stored_for_numbers_and_their_text(produce, load_function):
+    load_function('produce_delta_event', ARCHIVE_FINGERPRINTS=True)
+    produce('day1.json', rows_of_day(1) + [{'id': 12, 'name': 1, 'score': 6.0}])
+
+    published = produce('day2.json', rows_of_day(1) + [{'id': 12, 'name': '1', 'score': 6.0}])
+
+    assert published == [{'id': 12, 'name': '1', 'score': 6.0}]
+    assert produce.storage.names('archive') == ['day1.json', 'day2.json', 'day2.json.fingerprints']
+
+
+def test_previous_file_is_read_from_the_blob_the_latest_pointer_refers_to(produce, load_function):
+    load_function('produce_delta_event', ARCHIVE_LATEST_POINTER=True)
+    produce('day1.json', rows_of_day(1))
+    produce.storage.requests.clear()
+
+    published = produce('day2.json', rows_of_day(2))
+
+    assert published == [row for row in rows_of_day(2) if row['id'] % 4 == 0 and row['id'] > 0]
+    assert produce.archive_reads == ['day1.json']
+    # Resolving the pointer gets the properties of the previous file, reading it does not request them again
+    assert [request for request in produce.storage.requests if request[1:] == ('archive', 'day1.json')] == [
+        ('get', 'archive', 'day1.json'), ('download', 'archive', 'day1.json')]
+
+
+@pytest.mark.parametrize('pointer', ['stale', 'missing'])
+def test_previous_file_is_listed_when_the_latest_pointer_can_not_be_used(produce, load_function, pointer):
+    load_function('produce_delta_event', ARCHIVE_LATEST_POINTER=True, ARCHIVE_FINGERPRINTS=True)
+    produce('day1.json', rows_of_day(1))
+    produce('day2.json', rows_of_day(2))
+    if pointer == 'stale':
+        # The fingerprints of day2.json and the pointer to it are newer than day1.json, but are not a previous file
+        produce.storage.bucket('archive').blob('day2.json').delete()
+    else:
+        produce.storage.bucket('archive').blob('.latest').delete()
+    load_function('produce_delta_event', ARCHIVE_FINGERPRINTS=False)
+
+    published = produce('day3.json', rows_of_day(3))
+
+    assert published == [row for row in rows_of_day(3) if row['id'] % 4 == 0 and row['id'] > 0]
+    assert produce.archive_reads == ['day1.json' if pointer == 'stale' else 'day2.json']
+
+
+def test_latest_pointer_refers_to_the_file_the_listing_finds(produce, load_function):
+    publishdiff = load_function('produce_delta_event', 'publishdiff', ARCHIVE_LATEST_POINTER=True)
+    for day in range(1, 4):
+        produce('day{}.json'.format(day), rows_of_day(day))
+    produce.storage.requests.clear()
+
+    from_pointer = publishdiff.get_prev_blob('archive', None)
+
+    assert produce.storage.requests == [('download', 'archive', '.latest'), ('get', 'archive', 'day3.json')]
+    load_function('produce_delta_event', ARCHIVE_LATEST_POINTER=False)
+    assert from_pointer.name == publishdiff.get_prev_blob('archive', None).name == 'day3.json'
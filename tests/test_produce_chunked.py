@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from fakes import FakePublisher, LocalStorage
+
+CONFIG = {
+    'INBOX': 'inbox',
+    'ARCHIVE': 'archive',
+    'ATTRIBUTE_WITH_THE_LIST': 'rows',
+    'TOPIC_SETTINGS': {'topic_project_id': 'project', 'topic_name': 'topic'},
+    'TOPIC_BATCH_SETTINGS': {},
+    'BATCH_MESSAGE_SIZE': 4,
+}
+CHUNKED_READ_SIZE = 7
+
+
+@pytest.fixture
+def produce(load_function, monkeypatch, tmp_path):
+    """Return a function that runs publish_diff of produce_delta_event on a json file and returns the payloads."""
+    publishdiff, blobio = load_function('produce_delta_event', 'publishdiff', 'blobio', **CONFIG)
+    local_storage = LocalStorage(str(tmp_path))
+    local_storage.install(monkeypatch, publishdiff, blobio)
+    publisher = FakePublisher()
+    monkeypatch.setattr(publishdiff, 'get_publisher', lambda: publisher)
+
+    def run(filename, rows, chunked):
+        if chunked:
+            monkeypatch.setattr(publishdiff.config, 'CHUNKED_READ_SIZE', CHUNKED_READ_SIZE, raising=False)
+        else:
+            monkeypatch.delattr(publishdiff.config, 'CHUNKED_READ_SIZE', raising=False)
+        publisher.published.clear()
+        local_storage.put('inbox', filename, json.dumps({'rows': rows}))
+        publishdiff.publish_diff({'bucket': 'inbox', 'name': filename}, None)
+        return [json.loads(payload) for payload in publisher.payloads()]
+
+    yield run
+    publisher.close()
+
+
+def rows_of_day(day, count=30):
+    return [{'id': i, 'code': str(i % 3), 'name': 'name {}'.format(i if i % 4 else i * day)} for i in range(count)]
+
+
+def publish_days(produce, load_function, days):
+    published = {}
+    for chunked in (False, True):
+        prefix = 'chunked/' if chunked else 'whole/'
+        load_function('produce_delta_event', FILEPATH_PREFIX_FILTER=prefix)
+        published[chunked] = [[row for payload in produce('{}day{}.json'.format(prefix, day), rows, chunked)
+                               for row in payload] for day, rows in enumerate(days)]
+    return published
+
+
+def test_chunked_and_whole_files_publish_the_same_rows(produce, load_function):
+    days = [rows_of_day(1), rows_of_day(2), rows_of_day(2)[5:] + rows_of_day(3)[:5] + rows_of_day(3)[:2]]
+
+    published = publish_days(produce, load_function, days)
+
+    assert published[True] == published[False]
+    assert [len(rows) for rows in published[True]] == [30, 7, 1]
+
+
+def test_chunks_are_published_in_full_messages(produce):
+    payloads = produce('day1.json', rows_of_day(1), chunked=True)
+
+    # The 30 rows are read in chunks of 7, but only the last message has fewer than BATCH_MESSAGE_SIZE rows
+    assert [len(payload) for payload in payloads] == [4] * 7 + [2]
+    assert [row for payload in payloads for row in payload] == rows_of_day(1)
+
+
+def test_numbers_and_their_text_in_a_later_chunk_are_compared_as_values(produce, load_function):
+    # Row 25 is in the fourth chunk, a number is a new value of a column of text, like in a merge of the whole file
+    with_number = rows_of_day(1) + [dict(rows_of_day(1)[25], code=1)]
+    days = [rows_of_day(1), with_number, rows_of_day(1) + [dict(rows_of_day(1)[25], code='x')]]
+
+    published = publish_days(produce, load_function, days)
+
+    assert published[True] == published[False]
+    assert published[True][1:] == [[dict(rows_of_day(1)[25], code=1)], [dict(rows_of_day(1)[25], code='x')]]
@@ -0,0 +1,209 @@
+import gzip
+import json
+import threading
+import types
+
+import pytest
+
+from fakes import FakePublisher
+from original_publish import produce_payloads
+from test_gathermsg import COLUMNS_PUBLISH, diff_frame
+
+CONFIG = {
+    'TOPIC_SETTINGS': {'topic_project_id': 'project', 'topic_name': 'topic'},
+    'TOPIC_BATCH_SETTINGS': {},
+}
+GOBITS = types.SimpleNamespace(to_json=lambda: {'processed': 'test'})
+
+
+@pytest.fixture(params=['produce_delta_event', 'datastore_delta_event'])
+def function(request):
+    return request.param
+
+
+@pytest.fixture
+def publisher():
+    publisher = FakePublisher(latency=0.01, fail=lambda data: b'"fail' in data)
+    yield publisher
+    publisher.close()
+
+
+def rows(count, failing=()):
+    return [{'id': i, 'name': 'fail' if i in failing else 'name {}'.format(i)} for i in range(count)]
+
+
+def test_flush_waits_for_every_message_and_counts_the_failures(load_function, function, publisher):
+    publishfutures = load_function(function, 'publishfutures')
+    publish_futures = publishfutures.PublishFutures()
+    for i, row in enumerate(rows(20, failing={3, 11})):
+        publish_futures.add(publisher.publish('topic', json.dumps(row).encode('utf-8')), i, 20)
+
+    with pytest.raises(RuntimeError, match='Failed to publish 2 of 20 messages'):
+        publish_futures.flush()
+
+    assert publish_futures.published == 18
+
+
+def test_flush_returns_when_every_message_is_published(load_function, function, publisher):
+    publishfutures = load_function(function, 'publishfutures')
+    publish_futures = publishfutures.PublishFutures()
+    futures = [publisher.publish('topic', json.dumps(row).encode('utf-8')) for row in rows(20)]
+    for i, future in enumerate(futures):
+        publish_futures.add(future, i, 20)
+
+    publish_futures.flush()
+
+    assert publish_futures.published == 20
+    assert all(future.done() for future in futures)
+
+
+def test_futures_that_resolve_while_they_are_added_are_counted_once(load_function):
+    publishfutures = load_function('produce_delta_event', 'publishfutures')
+    publisher = FakePublisher()
+    publish_futures = publishfutures.PublishFutures()
+    threads = [threading.Thread(target=lambda: [publish_futures.add(publisher.publish('topic', b'{}'), 0, 0)
+                                                for _ in range(100)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    publish_futures.flush()
+    publisher.close()
+
+    assert publish_futures.published == 400
+
+
+@pytest.mark.parametrize('compact', [False, True])
+@pytest.mark.parametrize('max_bytes, max_rows', [(None, None), (None, 7), (200, None), (200, 3), (10, None)])
+@pytest.mark.parametrize('subject', [None, 'rows'])
+def test_batched_payloads_hold_every_message_within_the_limits(load_function, function, compact, max_bytes,
+                                                               max_rows, subject):
+    batchmsg = load_function(function, 'batchmsg')
+    batcher = batchmsg.MessageBatcher(GOBITS, subject, max_bytes=max_bytes, max_rows=max_rows, compact=compact)
+    messages = rows(25) + [{'id': 25, 'name': 'é' * 100}]
+
+    payloads = [batcher.add(message) for message in messages] + [batcher.flush()]
+    payloads = [payload for payload in payloads if payload is not None]
+    decoded = [json.loads(payload) for payload in payloads]
+    if subject:
+        assert all(payload['gobits'] == [GOBITS.to_json()] for payload in decoded)
+        decoded = [payload[subject] for payload in decoded]
+
+    if max_bytes or max_rows:
+        assert [message for batch in decoded for message in batch] == messages
+        assert all(len(batch) <= (max_rows or len(messages)) for batch in decoded)
+        # A message that is larger than max_bytes is a payload of its own
+        assert all(len(payload) <= max_bytes or len(batch) == 1 for payload, batch in zip(payloads, decoded)
+                   if max_bytes)
+    else:
+        assert decoded == messages
+    if not compact and not subject:
+        # Payloads are encoded like json.dumps
+        assert all(payload == json.dumps(batch).encode('utf-8') for payload, batch in zip(payloads, decoded))
+
+
+def test_the_envelope_is_encoded_once_for_all_payloads(load_function, function):
+    batchmsg = load_function(function, 'batchmsg')
+    calls = []
+    gobits = types.SimpleNamespace(to_json=lambda: calls.append(None) or GOBITS.to_json())
+    batcher = batchmsg.MessageBatcher(gobits, 'rows', max_rows=3)
+
+    payloads = [batcher.add(message) for message in rows(25)] + [batcher.flush()]
+    payloads = [payload for payload in payloads if payload is not None]
+
+    assert len(calls) == 1
+    assert [json.loads(payload) for payload in payloads] == [
+        {'gobits': [GOBITS.to_json()], 'rows': rows(25)[i:i + 3]} for i in range(0, 25, 3)]
+
+
+def test_publish_rows_raises_after_publishing_every_batch(load_function, monkeypatch, publisher):
+    publishdiff = load_function('produce_delta_event', 'publishdiff', **CONFIG)
+    monkeypatch.setattr(publishdiff, 'get_publisher', lambda: publisher)
+
+    with pytest.raises(RuntimeError, match='Failed to publish 1 of 10 messages'):
+        publishdiff.publish_rows(GOBITS, rows(50, failing={12}), 5)
+
+    assert [row for payload in publisher.payloads() for row in json.loads(payload)] == rows(50, failing={12})
+
+
+@pytest.mark.parametrize('content_encoding', ['br', 'gzip'])
+def test_compressed_messages_decompress_to_the_payload(load_function, monkeypatch, function, content_encoding):
+    publishdiff, payloadcoding = load_function(function, 'publishdiff', 'payloadcoding', **CONFIG)
+    publisher = FakePublisher()
+    monkeypatch.setattr(publishdiff, 'get_publisher', lambda: publisher)
+    payload = json.dumps(rows(50)).encode('utf-8')
+
+    load_function(function, PUBLISH_CONTENT_ENCODING=content_encoding)
+    publishdiff.publish_payload(payload, **CONFIG['TOPIC_SETTINGS']).result()
+    load_function(function, PUBLISH_CONTENT_ENCODING=None)
+    publishdiff.publish_payload(payload, **CONFIG['TOPIC_SETTINGS']).result()
+    publisher.close()
+
+    (_, compressed, attributes), (_, plain, no_attributes) = publisher.published
+    assert len(compressed) < len(payload)
+    assert payloadcoding.decompress_payload(compressed, attributes) == payload
+    assert plain == payload and no_attributes == {}
+
+
+@pytest.mark.parametrize('content_encoding, levels', [('br', range(12)), ('gzip', range(1, 10))])
+def test_every_compression_level_decompresses_to_the_payload(load_function, content_encoding, levels):
+    payloadcoding = load_function('produce_delta_event', 'payloadcoding')
+    payload = json.dumps(rows(200)).encode('utf-8')
+
+    for level in levels:
+        compressed = payloadcoding.compress_payload(payload, content_encoding, level)
+
+        assert payloadcoding.decompress_payload(compressed, {'content-encoding': content_encoding}) == payload
+        if content_encoding == 'gzip':
+            # Subscribers can read the messages with any gzip implementation
+            assert gzip.decompress(compressed) == payload
+
+
+def test_unknown_content_encodings_are_refused(load_function):
+    payloadcoding = load_function('produce_delta_event', 'payloadcoding')
+
+    with pytest.raises(ValueError, match='Unknown content encoding deflate'):
+        payloadcoding.compress_payload(b'{}', 'deflate')
+    with pytest.raises(ValueError, match='Unknown content encoding deflate'):
+        payloadcoding.decompress_payload(b'{}', {'content-encoding': 'deflate'})
+
+
+def publish_frame(load_function, monkeypatch, df, columns_publish, batch_message_size, subject, compact):
+    publishdiff, batchmsg, gathermsg = load_function(
+        'produce_delta_event', 'publishdiff', 'batchmsg', 'gathermsg',
+        **dict(CONFIG, TOPIC_SETTINGS=dict(CONFIG['TOPIC_SETTINGS'], subject=subject), PUBLISH_COMPACT_JSON=compact))
+    publisher = FakePublisher()
+    monkeypatch.setattr(publishdiff, 'get_publisher', lambda: publisher)
+    # How publish_diff publishes a diff
+    publishdiff.publish_rows(GOBITS, gathermsg.gather_publish_df(df, columns_publish, encoded=compact),
+                             batch_message_size)
+    publisher.close()
+    return publisher.payloads()
+
+
+@pytest.mark.parametrize('columns_publish', [None, COLUMNS_PUBLISH])
+@pytest.mark.parametrize('batch_message_size', [None, 7])
+@pytest.mark.parametrize('subject', [None, 'rows'])
+def test_payloads_are_the_bytes_of_the_original_encoding(load_function, monkeypatch, columns_publish,
+                                                         batch_message_size, subject):
+    df = diff_frame(30)
+
+    payloads = publish_frame(load_function, monkeypatch, df, columns_publish, batch_message_size, subject, False)
+
+    assert payloads == produce_payloads(df, GOBITS, batch_message_size, subject, columns_publish)
+
+
+@pytest.mark.parametrize('fast_encoder', [False, True])
+@pytest.mark.parametrize('columns_publish', [None, COLUMNS_PUBLISH])
+def test_compact_payloads_hold_the_values_of_the_original_encoding(load_function, monkeypatch, columns_publish,
+                                                                   fast_encoder):
+    df = diff_frame(30)
+    if not fast_encoder:
+        monkeypatch.setattr(load_function('produce_delta_event', 'batchmsg'), 'orjson', None)
+
+    payloads = publish_frame(load_function, monkeypatch, df, columns_publish, 7, 'rows', True)
+
+    assert [json.loads(payload) for payload in payloads] == [
+        json.loads(payload) for payload in produce_payloads(df, GOBITS, 7, 'rows', columns_publish)]
+    assert all(b', ' not in payload for payload in payloads)
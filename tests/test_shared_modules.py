@@ -0,0 +1,22 @@
+"""Every function is deployed on its own, so the helper modules functions share are copied into each of them."""
+import glob
+import os
+
+import pytest
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'functions')
+SHARED_MODULES = ['batchmsg', 'blobio', 'chunkdtypes', 'fingerprint', 'gcsclient', 'hashing', 'jsonstream',
+                  'payloadcoding', 'publishfutures', 'xlsxstream']
+
+
+@pytest.mark.parametrize('module', SHARED_MODULES)
+def test_copies_of_a_shared_module_are_identical(module):
+    copies = {}
+    for path in sorted(glob.glob(os.path.join(FUNCTIONS_DIR, '*', module + '.py'))):
+        with open(path, 'rb') as file:
+            copies[os.path.relpath(path, FUNCTIONS_DIR)] = file.read()
+
+    assert len(copies) > 1
+    first_path, first_content = next(iter(copies.items()))
+    assert [path for path, content in copies.items() if content != first_content] == [], \
+        'copies of {} differ from {}'.format(module, first_path)
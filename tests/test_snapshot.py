@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fakes import LocalStorage
+
+CONFIG = {
+    'INBOX': 'inbox',
+    'ARCHIVE': 'archive',
+    'CSV_DIALECT_PARAMETERS': {'sep': ',', 'quotechar': '"'},
+    'COLUMNS_NONPII': ['id', 'name', 'amount', 'flag', 'big', 'text', 'day'],
+    'ARCHIVE_SNAPSHOT': True,
+}
+
+
+@pytest.fixture
+def archive(load_function, monkeypatch, tmp_path):
+    """Return a function that reads a frame from a file on the inbox like publish_diff, archives it with a snapshot and
+    returns it as read from the snapshot and from the archived file."""
+    publishdiff, blobio = load_function('produce_delta_event', 'publishdiff', 'blobio', **CONFIG)
+    local_storage = LocalStorage(str(tmp_path))
+    local_storage.install(monkeypatch, publishdiff, blobio)
+
+    def run(blob_name, df):
+        if blob_name.endswith('.csv'):
+            # A csv file on the inbox has no index column
+            local_storage.put('inbox', blob_name, df.to_csv(index=False).encode('utf-8'), 'text/csv')
+        else:
+            publishdiff.df_to_store('inbox', blob_name, df)
+        df = publishdiff.df_from_store('inbox', blob_name)
+        archived_blob = publishdiff.df_to_store('archive', blob_name, df)
+        publishdiff.snapshot_to_store('archive', archived_blob, df)
+        from_snapshot = publishdiff.df_from_store('archive', archived_blob, from_archive=True)
+        load_function('produce_delta_event', ARCHIVE_SNAPSHOT=False)
+        from_file = publishdiff.df_from_store('archive', archived_blob, from_archive=True)
+        load_function('produce_delta_event', ARCHIVE_SNAPSHOT=True)
+        return from_snapshot, from_file
+
+    run.storage = local_storage
+    return run
+
+
+def typed_frame():
+    return pd.DataFrame({
+        'id': [1, 2, 3, 4, 5],
+        'name': ['a', 'NA', '', None, 'é ☃'],
+        'amount': [1.5, np.nan, 2.0, -0.0, 1e20],
+        'flag': [True, False, True, True, False],
+        'big': [10 ** 16 + 1, 1, 2, 3, -4],
+        'text': ['0', '1.5', 'x, "y"', 'True', '007'],
+        'day': ['2021-01-01', '2021-01-02', None, '2021-01-04', '2021-01-05'],
+    })
+
+
+@pytest.mark.parametrize('blob_name, attribute_with_the_list', [
+    ('day.xlsx', None), ('day.csv', None), ('day.json', None), ('day.json', 'rows')])
+def test_snapshot_holds_the_values_and_dtypes_of_the_archived_file(
+        archive, load_function, blob_name, attribute_with_the_list):
+    if attribute_with_the_list:
+        load_function('produce_delta_event', ATTRIBUTE_WITH_THE_LIST=attribute_with_the_list)
+
+    from_snapshot, from_file = archive(blob_name, typed_frame())
+
+    if blob_name.endswith('.csv'):
+        # The archived csv file holds the index of the rows as its first column, the snapshot does not
+        from_file = from_file.drop(columns='Unnamed: 0')
+    # Rows are compared by their values, the index of a json file is read as strings
+    pd.testing.assert_frame_equal(from_snapshot, from_file.reset_index(drop=True))
+    if blob_name.endswith('.xlsx'):
+        assert all(from_snapshot.dtypes == object)
+
+
+def test_files_parquet_can_not_hold_are_read_from_the_archived_file(archive):
+    df = typed_frame().assign(mixed=[1, 'a', 2.5, None, 'b'])
+
+    from_snapshot, from_file = archive('day.json', df)
+
+    assert archive.storage.names('archive') == ['day.json']
+    assert 'mixed' in from_snapshot.columns
+    pd.testing.assert_frame_equal(from_snapshot, from_file)
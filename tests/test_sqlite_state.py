@@ -0,0 +1,108 @@
+import os
+import sqlite3
+import tempfile
+
+import pytest
+from google.api_core.exceptions import PreconditionFailed
+
+from fakes import LocalStorage
+
+SPECIFICATION = {'type': 'sqlite', 'bucket': 'state', 'blob_name': 'state.sqlite', 'id_property': 'id'}
+
+
+@pytest.fixture
+def sqlite_state(load_function, monkeypatch, tmp_path):
+    """Return a function that opens SQLiteStateStorage on a local Cloud Storage, with its copies in one directory."""
+    statestorage = load_function('datastore_delta_event', 'statestorage')
+    local_storage = LocalStorage(str(tmp_path / 'storage'))
+    local_storage.install(monkeypatch, statestorage)
+    copies = tmp_path / 'copies'
+    copies.mkdir()
+    mkdtemp = tempfile.mkdtemp
+    monkeypatch.setattr(statestorage.tempfile, 'mkdtemp', lambda: mkdtemp(dir=str(copies)))
+
+    def open_storage():
+        return statestorage.state_storage_from_specification(SPECIFICATION)
+
+    open_storage.storage = local_storage
+    open_storage.copies = copies
+    return open_storage
+
+
+def items(values):
+    return {key: {'id': key, 'value': value} for key, value in values.items()}
+
+
+def run(storage, new_items):
+    try:
+        diff = storage.calculate_diff(new_items, False)
+        storage.store(new_items)
+        storage.save()
+        return diff
+    finally:
+        storage.close()
+
+
+def test_state_of_a_run_is_read_by_the_next_run(sqlite_state):
+    first = items({1: 'a', 2: 'b'})
+    second = items({1: 'a', 2: 'changed', 3: 'c'})
+
+    assert run(sqlite_state(), first) == list(first.values())
+    assert run(sqlite_state(), second) == [second[2], second[3]]
+    assert sqlite_state.storage.bucket('state').get_blob('state.sqlite').generation == 2
+
+
+def test_save_does_not_overwrite_state_written_by_another_run(sqlite_state):
+    run(sqlite_state(), items({1: 'a'}))
+    slow = sqlite_state()
+    run(sqlite_state(), items({1: 'fast'}))
+
+    with pytest.raises(PreconditionFailed):
+        run(slow, items({1: 'slow'}))
+
+    assert run(sqlite_state(), items({1: 'fast'})) == []
+
+
+def test_save_does_not_overwrite_state_created_by_another_run(sqlite_state):
+    slow = sqlite_state()
+    run(sqlite_state(), items({1: 'fast'}))
+
+    with pytest.raises(PreconditionFailed):
+        run(slow, items({1: 'slow'}))
+
+
+def test_close_removes_the_local_copy(sqlite_state):
+    run(sqlite_state(), items({1: 'a'}))
+    storage = sqlite_state()
+    storage.calculate_diff(items({1: 'b'}), False)
+
+    storage.close()
+
+    assert storage.connection is None
+    assert os.listdir(str(sqlite_state.copies)) == []
+
+
+def test_local_copy_is_removed_when_the_state_can_not_be_read(sqlite_state):
+    sqlite_state.storage.put('state', 'state.sqlite', b'not a database')
+
+    with pytest.raises(sqlite3.DatabaseError):
+        sqlite_state()
+
+    assert os.listdir(str(sqlite_state.copies)) == []
+
+
+def test_lookups_of_many_keys_query_at_most_900_keys_at_a_time(sqlite_state):
+    run(sqlite_state(), items({key: 'a' for key in range(2000)}))
+    storage = sqlite_state()
+    queries = []
+    storage.connection.set_trace_callback(lambda query: queries.append(query))
+    new_items = items({key: 'changed' if key % 500 == 0 else 'a' for key in range(2500)})
+
+    try:
+        diff = storage.calculate_diff(new_items, False)
+    finally:
+        storage.close()
+
+    assert diff == [new_items[key] for key in list(range(0, 2000, 500)) + list(range(2000, 2500))]
+    # The traced queries hold either the placeholders or the keys, separated by commas
+    assert [len(query[query.index(' IN ('):].split(',')) for query in queries] == [900, 900, 700]
@@ -0,0 +1,125 @@
+import datetime
+import io
+
+import openpyxl
+import pandas as pd
+import pytest
+import xlsxwriter
+
+
+def workbook(write, **options):
+    stream = io.BytesIO()
+    book = xlsxwriter.Workbook(stream, options)
+    write(book, book.add_worksheet())
+    book.close()
+    return stream.getvalue()
+
+
+def blank_rows(book, sheet):
+    sheet.write_row(0, 0, ['id', 'name', 'amount'])
+    sheet.write_row(1, 0, [1, 'a', 1.5])
+    sheet.write_row(3, 0, [2, 'b', 2])
+    sheet.write_row(6, 0, [3, None, 1e20])
+    # Formatted cells without a value are empty
+    sheet.write_blank(9, 0, None, book.add_format({'bold': True}))
+
+
+def trailing_empty_cells(book, sheet):
+    empty = book.add_format({'num_format': 'yyyy-mm-dd'})
+    sheet.write_row(0, 0, ['id', 'name', 'amount', 'flag'])
+    sheet.write_row(1, 0, [1, 'a'])
+    sheet.write_blank(1, 3, None, empty)
+    sheet.write_row(2, 0, [2, None, 3])
+    sheet.write_row(3, 0, [3, 'c', None, False])
+    sheet.write_row(4, 0, [4])
+    sheet.write_blank(4, 2, None, empty)
+
+
+def shared_strings(book, sheet):
+    sheet.write_row(0, 0, ['id', 'text', 'other'])
+    texts = ['same', 'é ☃', '  spaced  ', 'line\nbreak', '_x005F_x0041_', '1.5', 'NA', '']
+    for i in range(40):
+        sheet.write_row(i + 1, 0, [i, texts[i % len(texts)], texts[(i * 3) % len(texts)]])
+    sheet.write_formula(41, 0, '=1/0', None, '#DIV/0!')
+    sheet.write_boolean(41, 1, True)
+
+
+def dates(book, sheet):
+    formats = {name: book.add_format({'num_format': number_format}) for name, number_format in [
+        ('date', 'yyyy-mm-dd'), ('datetime', 'yyyy-mm-dd hh:mm:ss'), ('time', 'hh:mm'), ('duration', '[h]:mm:ss')]}
+    sheet.write_row(0, 0, ['id', 'date', 'datetime', 'time', 'duration', 'number'])
+    for i in range(10):
+        moment = datetime.datetime(2021, 1, 1, 6, 30) + datetime.timedelta(days=i * 40, minutes=i * 7)
+        sheet.write_number(i + 1, 0, i)
+        sheet.write_datetime(i + 1, 1, moment.replace(hour=0, minute=0), formats['date'])
+        sheet.write_datetime(i + 1, 2, moment, formats['datetime'])
+        sheet.write_datetime(i + 1, 3, datetime.time(i, i * 5), formats['time'])
+        sheet.write_number(i + 1, 4, 1 + i / 24, formats['duration'])
+        sheet.write_number(i + 1, 5, 44000 + i)
+
+
+def openpyxl_workbook():
+    stream = io.BytesIO()
+    pd.DataFrame({
+        'id': range(12),
+        'name': [None if i % 5 == 0 else 'name {}'.format(i % 3) for i in range(12)],
+        'day': pd.date_range('2021-01-01', periods=12, freq='17D'),
+        'amount': [i / 4 if i % 3 else None for i in range(12)],
+    }).to_excel(stream, index=False, engine='openpyxl')
+    return stream.getvalue()
+
+
+WORKBOOKS = {
+    'blank_rows': lambda: workbook(blank_rows),
+    'trailing_empty_cells': lambda: workbook(trailing_empty_cells),
+    'shared_strings': lambda: workbook(shared_strings),
+    'dates': lambda: workbook(dates),
+    'dates_1904': lambda: workbook(dates, date_1904=True),
+    # XlsxWriter writes strings inline to keep its memory use constant
+    'inline_strings': lambda: workbook(shared_strings, constant_memory=True),
+    'written_by_openpyxl': openpyxl_workbook,
+}
+PARAMETERS = [{}, {'dtype': str}, {'converters': {0: str, 1: str}}]
+
+
+@pytest.fixture(params=['produce_delta_event', 'datastore_delta_event', 'file_processing'])
+def xlsxstream(request, load_function):
+    return load_function(request.param, 'xlsxstream')
+
+
+@pytest.mark.parametrize('parameters', PARAMETERS, ids=['default', 'dtype', 'converters'])
+@pytest.mark.parametrize('name', WORKBOOKS)
+def test_read_excel_matches_pandas(xlsxstream, name, parameters):
+    data = WORKBOOKS[name]()
+
+    df = xlsxstream.read_excel(io.BytesIO(data), **parameters)
+
+    pd.testing.assert_frame_equal(df, pd.read_excel(io.BytesIO(data), engine='openpyxl', **parameters))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 4, 100])
+@pytest.mark.parametrize('name', WORKBOOKS)
+def test_chunks_hold_the_rows_of_read_excel(load_function, name, chunk_size):
+    xlsxstream = load_function('datastore_delta_event', 'xlsxstream')
+    data = WORKBOOKS[name]()
+
+    chunks = list(xlsxstream.iter_excel(io.BytesIO(data), chunk_size, dtype=str))
+
+    assert all(len(chunk) <= chunk_size for chunk in chunks)
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True),
+                                  pd.read_excel(io.BytesIO(data), engine='openpyxl', dtype=str))
+
+
+@pytest.mark.parametrize('version', ['2.6.4', '3.0.6'])
+def test_older_openpyxl_versions_are_refused(load_function, monkeypatch, version):
+    monkeypatch.setattr(openpyxl, '__version__', version)
+
+    with pytest.raises(ImportError, match='openpyxl 3.0.7 or later'):
+        load_function('produce_delta_event', 'xlsxstream')
+
+
+@pytest.mark.parametrize('version', ['3.0.7', '3.1.0b1', '3.1.5', '3.10.0'])
+def test_later_openpyxl_versions_are_accepted(load_function, monkeypatch, version):
+    monkeypatch.setattr(openpyxl, '__version__', version)
+
+    assert load_function('produce_delta_event', 'xlsxstream').MIN_OPENPYXL_VERSION == '3.0.7'